@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -81,6 +82,15 @@ DATABASES = {
 }
 
 
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+# In the database. The cache is local memory, per process, so cached_db
+# (LIBRARY_SESSION_ENGINE=cached_db) only suits a single process: with
+# several, a logout would only clear the session from the one that handled it.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('LIBRARY_SESSION_ENGINE', 'db')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -112,6 +122,13 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Book admin (bookshelf.changelist)
+# Above this many rows the unfiltered changelist shows the database's row
+# estimate instead of running COUNT(*). SQLite only has estimates after ANALYZE.
+
+BOOKSHELF_ESTIMATE_COUNT_ABOVE = 100_000
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+FTS_TABLE = 'bookshelf_book_fts'
+TSVECTOR_TABLE = 'bookshelf_book_search'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f"USING fts5(title, author, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {TSVECTOR_TABLE} ('
+            f'book_id bigint PRIMARY KEY REFERENCES bookshelf_book (id) '
+            f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            f'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS bookshelf_book_search_document_idx ON {TSVECTOR_TABLE} USING gin (document)'
+        )
+    else:
+        return
+    from bookshelf.search import rebuild_index
+    rebuild_index(using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TSVECTOR_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshelf', '0002_book_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,145 @@
+"""
+Full-text search over book titles and authors, for the admin search box.
+
+Each book has one document in an inverted index:
+
+* SQLite: an FTS5 virtual table whose rowid is the book id, ranked by bm25.
+* PostgreSQL: a table of weighted ``tsvector`` documents with a GIN index,
+  ranked by ``ts_rank``.
+
+Other backends fall back to ``icontains`` filtering. The index is created
+and filled by migration 0003 and kept current by the receivers in
+``signals.py``; writes that send no signals (``bulk_create``,
+``QuerySet.update``) need ``rebuild_index`` afterwards.
+"""
+import re
+
+from django.db import connections, router
+
+from .models import Book
+
+FTS_TABLE = 'bookshelf_book_fts'
+TSVECTOR_TABLE = 'bookshelf_book_search'
+MAX_TERMS = 10
+REINDEX_CHUNK_SIZE = 500
+
+BOOK_TABLE = Book._meta.db_table
+
+
+def _connection(using=None, write=False):
+    if using is None:
+        using = router.db_for_write(Book) if write else router.db_for_read(Book)
+    return connections[using]
+
+
+def backend(connection):
+    """
+    Returns 'sqlite', 'postgresql' or None when full-text search is unavailable.
+    """
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return connection.vendor
+    return None
+
+
+# ----------------------------
+# Index maintenance
+# ----------------------------
+def _reindex(where, params, using=None):
+    """
+    Re-indexes the books matching ``where`` (SQL over the book table).
+    """
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(
+                f'INSERT INTO {TSVECTOR_TABLE} (book_id, document) '
+                f"SELECT id, setweight(to_tsvector('simple', title), 'A') || "
+                f"setweight(to_tsvector('simple', author), 'B') FROM {BOOK_TABLE} WHERE {where} "
+                f'ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document',
+                params,
+            )
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM {BOOK_TABLE} WHERE {where})', params)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, author) SELECT id, title, author FROM {BOOK_TABLE} WHERE {where}',
+                params,
+            )
+
+
+def reindex_books(book_ids, using=None):
+    """
+    Re-indexes the given books, in chunks to keep statements small.
+    """
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), REINDEX_CHUNK_SIZE):
+        chunk = book_ids[start:start + REINDEX_CHUNK_SIZE]
+        _reindex(f'id IN ({", ".join(["%s"] * len(chunk))})', chunk, using)
+
+
+def remove_books(book_ids, using=None):
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    table, column = (TSVECTOR_TABLE, 'book_id') if kind == 'postgresql' else (FTS_TABLE, 'rowid')
+    book_ids = list(book_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), REINDEX_CHUNK_SIZE):
+            chunk = book_ids[start:start + REINDEX_CHUNK_SIZE]
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+
+def rebuild_index(using=None):
+    """
+    Empties the index and re-indexes every book.
+    """
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TSVECTOR_TABLE if kind == "postgresql" else FTS_TABLE}')
+    _reindex('1 = 1', [], connection.alias)
+
+
+# ----------------------------
+# Querying
+# ----------------------------
+def parse_terms(query):
+    """
+    Splits free text into at most MAX_TERMS lower-cased word tokens.
+    Everything else is dropped, so no operator syntax reaches the engine.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_book_ids(query, limit, using=None):
+    """
+    Returns the ids of the books matching every term of ``query`` (as a
+    prefix), best match first, or None when there is no index to ask.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    connection = _connection(using)
+    kind = backend(connection)
+    if kind is None:
+        return None
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(
+                f"SELECT book_id FROM {TSVECTOR_TABLE}, to_tsquery('simple', %s) query "
+                f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, book_id LIMIT %s',
+                [' & '.join(f'{term}:*' for term in terms), limit],
+            )
+        else:
+            # Title matches weigh more than author matches.
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 5.0), rowid LIMIT %s',
+                [' '.join(f'"{term}"*' for term in terms), limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
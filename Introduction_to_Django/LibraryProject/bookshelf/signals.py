@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changelist, search
+from .models import Book
+
+
+@receiver([post_save, post_delete], sender=Book)
+def refresh_admin_facets(sender, using, **kwargs):
+    # After the commit, or a changelist rendered meanwhile caches the old rows.
+    transaction.on_commit(changelist.bump_version, using=using)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using, **kwargs):
+    search.reindex_books([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using, **kwargs):
+    search.remove_books([instance.pk], using=using)
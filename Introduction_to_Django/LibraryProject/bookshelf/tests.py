@@ -1,3 +1,127 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import changelist
+from .changelist import EstimatedCountPaginator
+from .models import Book
+
+
+class ChangelistTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        Book.objects.bulk_create(
+            [Book(title=f'Orwell {i}', author='George Orwell', publication_year=1940 + i) for i in range(3)]
+            + [Book(title=f'Austen {i}', author='Jane Austen', publication_year=1811 + i) for i in range(2)]
+            + [Book(title='Dune', author='Frank Herbert', publication_year=1965)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin_user)
+
+    def changelist(self, **params):
+        response = self.client.get(reverse('admin:bookshelf_book_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def choices(self, cl, parameter_name):
+        spec = next(spec for spec in cl.filter_specs if spec.parameter_name == parameter_name)
+        return [value for value, _ in spec.lookup_choices]
+
+
+# ----------------------------
+# Decade filter
+# ----------------------------
+class DecadeFilterTests(ChangelistTestCase):
+
+    def test_one_choice_per_decade(self):
+        self.assertEqual(self.choices(self.changelist(), 'decade'), ['1810', '1940', '1960'])
+
+    def test_filters_by_decade(self):
+        cl = self.changelist(decade='1940')
+        self.assertEqual(sorted(book.title for book in cl.result_list), ['Orwell 0', 'Orwell 1', 'Orwell 2'])
+
+    def test_invalid_decade_matches_nothing(self):
+        self.assertEqual(list(self.changelist(decade='forties').result_list), [])
+
+    def test_choices_are_cached_until_a_book_changes(self):
+        self.changelist()
+        Book.objects.bulk_create([Book(title='Neuromancer', author='William Gibson', publication_year=1984)])
+        self.assertNotIn('1980', self.choices(self.changelist(), 'decade'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='Emma', author='Jane Austen', publication_year=1815)
+        self.assertIn('1980', self.choices(self.changelist(), 'decade'))
+
+
+# ----------------------------
+# Top author filter
+# ----------------------------
+class TopAuthorFilterTests(ChangelistTestCase):
+
+    def test_lists_the_most_common_authors(self):
+        with mock.patch.object(changelist, 'TOP_AUTHORS', 2):
+            self.assertEqual(self.choices(self.changelist(), 'author'), ['George Orwell', 'Jane Austen'])
+
+    def test_selected_author_stays_listed(self):
+        with mock.patch.object(changelist, 'TOP_AUTHORS', 2):
+            cl = self.changelist(author='Frank Herbert')
+        self.assertEqual(self.choices(cl, 'author')[0], 'Frank Herbert')
+        self.assertEqual([book.title for book in cl.result_list], ['Dune'])
+
+
+# ----------------------------
+# Estimated counts
+# ----------------------------
+class EstimatedCountPaginatorTests(ChangelistTestCase):
+
+    def count(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            count = EstimatedCountPaginator(queryset.order_by('pk'), 100).count
+        return count, [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+
+    def test_small_tables_are_counted_once(self):
+        count, counted = self.count(Book.objects.all())
+        self.assertEqual((count, len(counted)), (6, 1))
+        # The exact count is cached.
+        self.assertEqual(self.count(Book.objects.all()), (6, []))
+
+    def test_large_unfiltered_tables_are_estimated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Book.objects.bulk_create([Book(title='Extra', author='Anon', publication_year=2000)])
+        with self.settings(BOOKSHELF_ESTIMATE_COUNT_ABOVE=1):
+            self.assertEqual(self.count(Book.objects.all()), (6, []))
+            # Filtered querysets are counted exactly.
+            count, counted = self.count(Book.objects.filter(author='Anon'))
+        self.assertEqual((count, len(counted)), (1, 1))
+
+    def test_no_estimate_without_statistics(self):
+        with self.settings(BOOKSHELF_ESTIMATE_COUNT_ABOVE=1):
+            count, counted = self.count(Book.objects.all())
+        self.assertEqual((count, len(counted)), (6, 1))
+
+
+# ----------------------------
+# Signals
+# ----------------------------
+class FacetVersionTests(TestCase):
 
-# Create your tests here.
+    def test_version_moves_on_once_committed(self):
+        version = changelist.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Emma', author='Jane Austen', publication_year=1815)
+            self.assertEqual(changelist.get_version(), version)
+        self.assertNotEqual(changelist.get_version(), version)
+        version = changelist.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+            self.assertEqual(changelist.get_version(), version)
+        self.assertNotEqual(changelist.get_version(), version)
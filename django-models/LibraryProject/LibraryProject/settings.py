@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'relationship_app.middleware.PerformanceMiddleware',
+    'relationship_app.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'LibraryProject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for PerformanceMiddleware.
+        'BACKEND': 'relationship_app.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,6 +85,113 @@ DATABASES = {
     }
 }
 
+# Read replicas (relationship_app.routers.ReplicaRouter)
+# LIBRARY_REPLICAS is a comma-separated list of SQLite files kept current with
+# `manage.py sync_replica`. For a Postgres standby, add its alias to DATABASES
+# and DATABASE_REPLICAS directly. Run `manage.py replication_heartbeat` alongside
+# either; replicas whose heartbeat is older than REPLICA_MAX_LAG get no reads.
+
+DATABASE_REPLICAS = []
+for _number, _path in enumerate(filter(None, os.environ.get('LIBRARY_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica_{_number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+
+# Source of `manage.py migrate_bookshelf`, read only: the Introduction_to_Django
+# project's database. Set BOOKSHELF_DATABASE to its SQLite file.
+if os.environ.get('BOOKSHELF_DATABASE'):
+    DATABASES['bookshelf'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BOOKSHELF_DATABASE'],
+    }
+
+DATABASE_ROUTERS = ['relationship_app.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write.
+REPLICA_PIN_SECONDS = 5
+# Seconds of lag after which a replica gets no reads, and how often to check.
+REPLICA_MAX_LAG = 10
+REPLICA_CHECK_INTERVAL = 2
+
+
+# Caching
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default. Set LIBRARY_CACHE_BACKEND=file when several worker
+# processes must share one cache (and so see each other's invalidations).
+
+CACHE_IS_SHARED = os.environ.get('LIBRARY_CACHE_BACKEND') == 'file'
+
+if CACHE_IS_SHARED:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get(
+                'LIBRARY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'libraryproject-cache')
+            ),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'libraryproject',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Seconds a rendered catalogue page stays cached. Writes invalidate sooner.
+CATALOGUE_CACHE_TIMEOUT = 60 * 60
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+# In the database, unless the cache is shared: then cached_db serves them from
+# the cache and writes them through to the database. With per-process caches
+# a logout would only clear the session from the worker that handled it.
+# LIBRARY_SESSION_ENGINE overrides the choice (db, cached_db, cache or
+# signed_cookies; signed cookie sessions stay valid after logout until they expire).
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'LIBRARY_SESSION_ENGINE', 'cached_db' if CACHE_IS_SHARED else 'db'
+)
+
+
+# Request instrumentation (relationship_app.middleware.PerformanceMiddleware)
+# Server-Timing headers expose internals, so they are on only in DEBUG.
+# tracemalloc slows every allocation down; enable memory tracing for profiling only.
+
+PERFORMANCE_SERVER_TIMING = DEBUG
+PERFORMANCE_TRACE_MEMORY = os.environ.get('PERFORMANCE_TRACE_MEMORY') == '1'
+PERFORMANCE_BUDGETS_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'relationship_app.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERFORMANCE_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+
+# Authentication
+# Permission and role checks are answered from a per-user compiled record in
+# the cache (relationship_app.permissions) rather than from the database.
+
+AUTHENTICATION_BACKENDS = ['relationship_app.permissions.CompiledPermissionBackend']
+# Also cache the user of each session, with their profile. Only with a shared
+# cache, so that a password change or deactivation reaches every worker.
+CACHE_SESSION_USERS = CACHE_IS_SHARED
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,57 @@
+"""
+Production tuning profile for the SQLite database.
+
+    DJANGO_SETTINGS_MODULE=LibraryProject.settings_performance
+
+Everything else comes from ``settings``. On top of it:
+
+* Connections are kept open between requests (``CONN_MAX_AGE``) and
+  checked before reuse, instead of being reopened for every request.
+  Under ASGI each request runs its queries on a fresh thread, so the
+  reuse only applies to WSGI workers.
+* WAL journaling lets readers and a writer work at the same time, and
+  ``synchronous=NORMAL`` syncs at checkpoints rather than every commit
+  (a power loss can drop the last commits, but never corrupts the file).
+* ``mmap_size`` and ``cache_size`` keep hot pages in memory, and
+  ``busy_timeout`` makes a writer wait for the lock instead of failing
+  with "database is locked".
+* Transactions start as ``BEGIN IMMEDIATE``, taking the write lock up
+  front. A deferred transaction that reads and then writes cannot wait
+  for the lock and fails at once when another writer holds it.
+
+The primary and the SQLite replicas from LIBRARY_REPLICAS get all of it;
+replicas on other backends are left alone. The ``bookshelf`` source of
+``migrate_bookshelf`` belongs to the other project and is only read, so it
+keeps its journal mode and gets only the connection reuse and the read
+pragmas.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative: KiB, so 64 MiB
+    'busy_timeout': 5000,  # milliseconds
+    'temp_store': 'MEMORY',
+}
+
+# Connection-local, so safe on a database another project writes to.
+READ_PRAGMAS = ('mmap_size', 'cache_size', 'busy_timeout', 'temp_store')
+
+for _alias, _database in DATABASES.items():
+    if _database['ENGINE'] != 'django.db.backends.sqlite3':
+        continue
+    if _alias == 'bookshelf':
+        _pragmas, _options = {name: SQLITE_PRAGMAS[name] for name in READ_PRAGMAS}, {}
+    else:
+        _pragmas, _options = SQLITE_PRAGMAS, {'transaction_mode': 'IMMEDIATE'}
+    _database.update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            **_options,
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in _pragmas.items()),
+        },
+    })
@@ -0,0 +1,241 @@
+from django.contrib import admin, messages
+from django.contrib.admin.options import csrf_protect_m
+from django.core.exceptions import PermissionDenied
+from django.db.models import Case, IntegerField, Value, When
+from django.http import Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from . import deletion, exporters, membership, search
+from .forms import BookImportForm, LibraryMembershipForm
+from .importers import BookImporter, ImportStats, detect_format, iter_rows, open_text
+from .models import Author, Book, Library, Librarian, UserProfile
+
+
+class ExportActionsMixin:
+    """
+    Changelist actions streaming the selected rows as a file, read with
+    ``values_list`` in chunks rather than as model instances.
+    """
+    export_table = None
+    actions = ('export_csv', 'export_jsonl', 'export_columnar')
+
+    def _export(self, queryset, export_format):
+        return exporters.export_response(exporters.TABLES[self.export_table], queryset, export_format)
+
+    @admin.action(description='Export selected %(verbose_name_plural)s as gzipped CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Export selected %(verbose_name_plural)s as gzipped JSONL', permissions=['view'])
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+    @admin.action(description='Export selected %(verbose_name_plural)s in the columnar format', permissions=['view'])
+    def export_columnar(self, request, queryset):
+        return self._export(queryset, 'columnar')
+
+
+class ChunkedDeleteMixin:
+    """
+    Deletes through ``deletion.py``, in chunks, from the delete view and
+    the "Delete selected" action. Their confirmation pages show counts of
+    what the delete cascades to instead of collecting and listing every row.
+    """
+    delete_kind = None
+
+    def cascaded_counts(self, objs):
+        """
+        Returns ``{model: rows}`` for the rows deleting ``objs`` takes along.
+        """
+        return {}
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        model_count = {self.model._meta.verbose_name_plural: len(objs)}
+        perms_needed = set()
+        for model, count in self.cascaded_counts(objs).items():
+            if not count:
+                continue
+            model_count[model._meta.verbose_name_plural] = count
+            model_admin = self.admin_site._registry.get(model)
+            if model_admin is not None and not model_admin.has_delete_permission(request):
+                perms_needed.add(model._meta.verbose_name)
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    @csrf_protect_m
+    def delete_view(self, request, object_id, extra_context=None):
+        # ModelAdmin.delete_view runs a POST in one transaction, which would
+        # make every chunk a savepoint of it, holding its locks throughout.
+        return self._delete_view(request, object_id, extra_context)
+
+    def delete_model(self, request, obj):
+        deletion.DELETERS[self.delete_kind]([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        deletion.DELETERS[self.delete_kind](queryset.values_list('pk', flat=True))
+
+
+@admin.register(Author)
+class AuthorAdmin(ChunkedDeleteMixin, ExportActionsMixin, admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+    export_table = 'authors'
+    delete_kind = 'authors'
+
+    def cascaded_counts(self, objs):
+        return {Book: sum(author.book_count for author in objs)}
+
+
+@admin.register(Book)
+class BookAdmin(ChunkedDeleteMixin, ExportActionsMixin, admin.ModelAdmin):
+    list_display = ('title', 'author')
+    list_select_related = ('author',)
+    # The fields the full-text index covers, for searches it cannot answer.
+    search_fields = ('title', 'author__name', 'library__name')
+    raw_id_fields = ('author',)
+    change_list_template = 'admin/relationship_app/book/change_list.html'
+    search_result_limit = 1000
+    export_table = 'books'
+    delete_kind = 'books'
+
+    def cascaded_counts(self, objs):
+        links = deletion.LibraryBooks.objects.filter(book_id__in=[book.pk for book in objs])
+        return {deletion.LibraryBooks: links.count()}
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Answers changelist searches of whole words from the full-text index,
+        best match first, rather than with icontains scans; each word
+        matches the start of a word in the title, author or library names.
+        Other searches, and all of them without an index, get the default
+        search over ``search_fields``.
+        """
+        if not search_term.strip():
+            return queryset, False
+        ids = None
+        if search.index_can_answer(search_term):
+            ids = search.search_book_ids(search_term, limit=self.search_result_limit, fallback=False)
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        if len(ids) == self.search_result_limit:
+            self.message_user(
+                request,
+                f'Only the {self.search_result_limit} best matches are listed; refine the search to see others.',
+                messages.WARNING,
+            )
+        if not ids:
+            return queryset.none(), False
+        # Sorting by a column still wins; the rank orders ties.
+        rank = Case(*[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).order_by(rank), False
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='relationship_app_book_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """
+        Streams an uploaded CSV/JSONL file through the bulk importer.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = BookImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            importer = BookImporter(
+                batch_size=form.cleaned_data['batch_size'],
+                create_libraries=form.cleaned_data['create_libraries'],
+            )
+            stats = ImportStats()
+            stream = open_text(upload.file, filename=upload.name)
+            rows = iter_rows(stream, form.cleaned_data['format'] or detect_format(upload.name))
+            try:
+                importer.run(rows, stats=stats)
+            except (ValueError, OSError, EOFError) as exc:
+                form.add_error('file', f'{exc} Imported before the error: {stats}')
+            else:
+                self.message_user(request, f'Imported {stats}')
+                return redirect('admin:relationship_app_book_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import books',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/relationship_app/book/import_books.html', context)
+
+
+@admin.register(Library)
+class LibraryAdmin(ChunkedDeleteMixin, ExportActionsMixin, admin.ModelAdmin):
+    list_display = ('name', 'book_count')
+    search_fields = ('name',)
+    export_table = 'libraries'
+    actions = ExportActionsMixin.actions + ('export_library_books',)
+    # A library's books are changed with the bulk tool (books_view): the
+    # default widget renders every book as an <option>.
+    exclude = ('books',)
+    readonly_fields = ('book_count',)
+    change_form_template = 'admin/relationship_app/library/change_form.html'
+    delete_kind = 'libraries'
+
+    def cascaded_counts(self, objs):
+        return {
+            deletion.LibraryBooks: sum(library.book_count for library in objs),
+            Librarian: Librarian.objects.filter(library__in=objs).count(),
+        }
+
+    @admin.action(description='Export the book links of selected libraries as gzipped CSV', permissions=['view'])
+    def export_library_books(self, request, queryset):
+        table = exporters.TABLES['library_books']
+        links = table.model.objects.filter(library_id__in=queryset.values('pk'))
+        return exporters.export_response(table, links, 'csv')
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<path:object_id>/books/', self.admin_site.admin_view(self.books_view),
+                name='relationship_app_library_books',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def books_view(self, request, object_id):
+        """
+        Adds, removes or replaces a library's books in bulk, by id.
+        """
+        library = self.get_object(request, object_id)
+        if library is None:
+            raise Http404
+        if not self.has_change_permission(request, library):
+            raise PermissionDenied
+        form = LibraryMembershipForm(request.POST or None, request.FILES or None, admin_site=self.admin_site)
+        if request.method == 'POST' and form.is_valid():
+            change = membership.apply(library, form.cleaned_data['action'], form.cleaned_data['ids'])
+            self.message_user(request, f'{library}: {change}')
+            return redirect('admin:relationship_app_library_change', library.pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': library,
+            'title': f'Change the books of {library}',
+            'form': form,
+            'media': self.media + form.media,
+        }
+        return TemplateResponse(request, 'admin/relationship_app/library/books.html', context)
+
+
+@admin.register(Librarian)
+class LibrarianAdmin(admin.ModelAdmin):
+    list_display = ('name', 'library')
+    list_select_related = ('library',)
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'role')
+    list_filter = ('role',)
+    list_select_related = ('user',)
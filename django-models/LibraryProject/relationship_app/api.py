@@ -0,0 +1,345 @@
+"""
+JSON API for the catalogue.
+
+    GET /api/<resource>/?fields=id,title&page_size=100&after=<cursor>
+    GET /api/<resource>/export/?fields=...&format=ndjson|json&count=1
+    POST /api/libraries/<pk>/books/ {"action": "add|remove|replace", "book_ids": [...]}
+    GET /api/authors/autocomplete/?q=tolk&limit=10
+    POST /api/users/provision/ {"users": [{"username": ..., ...}], "default_role": "Member"}
+
+``resource`` is one of books, authors, libraries or librarians. List pages
+are keyset-paginated on id. The export streams every row from a
+server-side iterator, so a full dump runs in constant memory and the first
+bytes go out before the query has finished. With ``count=1`` it also
+sends an ``X-Total-Count`` header, which costs a full COUNT(*) before the
+first byte and may differ from the rows streamed, as the two are separate
+queries.
+
+The same read endpoints are served under ``async/api/`` by async views
+that query through the async ORM and stream from an async iterator.
+
+The library books endpoint changes a library's books in bulk through
+``membership.py`` and needs the ``change_library`` permission. The author
+autocomplete is answered from the in-process index in ``autocomplete.py``.
+User provisioning runs ``provisioning.py`` and needs ``auth.add_user``, and
+``auth.change_user`` as well to give a role other than Member or any groups.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+
+from . import membership, provisioning
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT, author_index
+from .instrumentation import query_budget
+from .models import Author, BookCatalogueEntry, Library, Librarian, UserProfile
+from .pagination import KeysetPaginator, get_page_size
+
+EXPORT_CHUNK_SIZE = 2000
+MAX_PAGE_SIZE = 1000
+# Bytes; a JSON list of a million ids is around 8 MB.
+MAX_BULK_BODY = 32 * 1024 * 1024
+
+
+class Resource:
+    """
+    A model exposed through the API, as a map of output names to ORM paths.
+    """
+
+    def __init__(self, model, fields, default_fields=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields or tuple(fields)
+
+    def parse_fields(self, value):
+        """
+        Returns the requested output names, or raises ValueError.
+        """
+        if not value:
+            return list(self.default_fields)
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(self.fields)}.')
+        return names
+
+    def values(self, names):
+        """
+        Returns a ``values()`` queryset with the requested fields plus ``id``.
+        """
+        names = set(names) | {'id'}
+        plain = [name for name in names if self.fields[name] == name]
+        renamed = {name: F(self.fields[name]) for name in names if self.fields[name] != name}
+        return self.model.objects.values(*plain, **renamed)
+
+
+RESOURCES = {
+    # Served from the catalogue read model; only updated_at needs a join.
+    'books': Resource(BookCatalogueEntry, {
+        'id': 'book_id',
+        'title': 'title',
+        'author_id': 'author_id',
+        'author_name': 'author_name',
+        'library_ids': 'library_ids',
+        'updated_at': 'book__updated_at',
+    }, default_fields=('id', 'title', 'author_id', 'author_name')),
+    'authors': Resource(Author, {
+        'id': 'id',
+        'name': 'name',
+        'book_count': 'book_count',
+        'updated_at': 'updated_at',
+    }),
+    'libraries': Resource(Library, {
+        'id': 'id',
+        'name': 'name',
+        'book_count': 'book_count',
+        'updated_at': 'updated_at',
+    }),
+    'librarians': Resource(Librarian, {
+        'id': 'id',
+        'name': 'name',
+        'library_id': 'library_id',
+        'library_name': 'library__name',
+    }),
+}
+
+
+def _get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise Http404(f'Unknown resource "{name}".')
+
+
+def _project(row, names):
+    return {name: row[name] for name in names}
+
+
+def _error(message):
+    return JsonResponse({'error': message}, status=400)
+
+
+def _paginator(request, resource, names):
+    return KeysetPaginator(
+        resource.values(names), ordering=('id',), page_size=get_page_size(request, maximum=MAX_PAGE_SIZE)
+    )
+
+
+def _page_response(request, page, names):
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['after'] = page.next_cursor
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return JsonResponse({
+        'results': [_project(row, names) for row in page],
+        'next': next_url,
+    })
+
+
+@query_budget(1)
+@require_GET
+def resource_list(request, resource):
+    """
+    Returns one keyset page of a resource as JSON.
+    """
+    resource = _get_resource(resource)
+    try:
+        names = resource.parse_fields(request.GET.get('fields'))
+    except ValueError as exc:
+        return _error(str(exc))
+    page = _paginator(request, resource, names).page(request.GET.get('after'))
+    return _page_response(request, page, names)
+
+
+@query_budget(1)
+@require_GET
+async def async_resource_list(request, resource):
+    """
+    ``resource_list`` for ASGI.
+    """
+    resource = _get_resource(resource)
+    try:
+        names = resource.parse_fields(request.GET.get('fields'))
+    except ValueError as exc:
+        return _error(str(exc))
+    page = await _paginator(request, resource, names).apage(request.GET.get('after'))
+    return _page_response(request, page, names)
+
+
+def _ndjson_lines(rows, names):
+    for row in rows:
+        yield json.dumps(_project(row, names), cls=DjangoJSONEncoder) + '\n'
+
+
+def _json_array(rows, names):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(_project(row, names), cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']\n'
+
+
+async def _andjson_lines(rows, names):
+    async for row in rows:
+        yield json.dumps(_project(row, names), cls=DjangoJSONEncoder) + '\n'
+
+
+async def _ajson_array(rows, names):
+    yield '['
+    separator = ''
+    async for row in rows:
+        yield separator + json.dumps(_project(row, names), cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']\n'
+
+
+def _export_options(request, resource):
+    """
+    Returns the requested field names, format and whether to count the
+    rows, or raises ValueError.
+    """
+    names = resource.parse_fields(request.GET.get('fields'))
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        raise ValueError('format must be "ndjson" or "json".')
+    return names, export_format, request.GET.get('count') == '1'
+
+
+def _export_response(content, name, export_format, total=None):
+    content_type = 'application/json' if export_format == 'json' else 'application/x-ndjson'
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    if total is not None:
+        response['X-Total-Count'] = str(total)
+    return response
+
+
+@require_GET
+def resource_export(request, resource):
+    """
+    Streams every row of a resource as NDJSON (default) or a JSON array.
+    """
+    name = resource
+    resource = _get_resource(name)
+    try:
+        names, export_format, count = _export_options(request, resource)
+    except ValueError as exc:
+        return _error(str(exc))
+    queryset = resource.values(names).order_by('id')
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    content = _json_array(rows, names) if export_format == 'json' else _ndjson_lines(rows, names)
+    return _export_response(content, name, export_format, queryset.count() if count else None)
+
+
+@require_GET
+async def async_resource_export(request, resource):
+    """
+    ``resource_export`` for ASGI, streamed from an async iterator.
+    """
+    name = resource
+    resource = _get_resource(name)
+    try:
+        names, export_format, count = _export_options(request, resource)
+    except ValueError as exc:
+        return _error(str(exc))
+    queryset = resource.values(names).order_by('id')
+    rows = queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE)
+    content = _ajson_array(rows, names) if export_format == 'json' else _andjson_lines(rows, names)
+    return _export_response(content, name, export_format, await queryset.acount() if count else None)
+
+
+def _json_body(request):
+    """
+    Returns the request's JSON object, or raises ValueError.
+    """
+    if int(request.META.get('CONTENT_LENGTH') or 0) > MAX_BULK_BODY:
+        raise ValueError(f'Request body is larger than {MAX_BULK_BODY} bytes.')
+    try:
+        # Read from the stream: bulk bodies outgrow DATA_UPLOAD_MAX_MEMORY_SIZE.
+        payload = json.load(request)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Body must be a JSON object.')
+    if not isinstance(payload, dict):
+        raise ValueError('Body must be a JSON object.')
+    return payload
+
+
+def _membership_payload(request):
+    """
+    Returns the action and book ids of a membership request, or raises
+    ValueError.
+    """
+    payload = _json_body(request)
+    action = payload.get('action')
+    if action not in membership.ACTIONS:
+        raise ValueError(f'action must be one of: {", ".join(membership.ACTIONS)}.')
+    book_ids = payload.get('book_ids')
+    if not isinstance(book_ids, list) or not all(type(pk) is int for pk in book_ids):
+        raise ValueError('book_ids must be a list of integers.')
+    return action, book_ids
+
+
+@require_POST
+def library_books(request, pk):
+    """
+    Adds, removes or replaces a library's books in bulk. Ids that are not
+    books are reported back instead of failing the request.
+    """
+    if not request.user.has_perm('relationship_app.change_library'):
+        return JsonResponse({'error': 'You do not have permission to change libraries.'}, status=403)
+    library = get_object_or_404(Library.objects.only('pk'), pk=pk)
+    try:
+        action, book_ids = _membership_payload(request)
+    except ValueError as exc:
+        return _error(str(exc))
+    change = membership.apply(library, action, book_ids)
+    library.refresh_from_db(fields=['book_count'])
+    return JsonResponse({**change.as_dict(), 'book_count': library.book_count})
+
+
+@require_GET
+def author_autocomplete(request):
+    """
+    Returns the authors whose name, or a word in it, starts with ``q``.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return _error('limit must be an integer.')
+    matches = author_index.search(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'results': [{'id': pk, 'name': name} for pk, name in matches]})
+
+
+@require_POST
+def provision_users(request):
+    """
+    Creates users with their profiles, roles and groups in bulk. Rows that
+    cannot be created are skipped and reported in ``errors``.
+    """
+    if not request.user.has_perm('auth.add_user'):
+        return JsonResponse({'error': 'You do not have permission to add users.'}, status=403)
+    try:
+        payload = _json_body(request)
+        users = payload.get('users')
+        if not isinstance(users, list) or not all(isinstance(row, dict) for row in users):
+            raise ValueError('users must be a list of objects.')
+        default_role = payload.get('default_role') or UserProfile.ROLE_MEMBER
+        create_groups = bool(payload.get('create_groups'))
+        # Roles and groups grant privileges: the admin needs change_user for them.
+        privileged = (
+            default_role != UserProfile.ROLE_MEMBER or create_groups
+            or any(row.get('role') not in (None, '', UserProfile.ROLE_MEMBER) or row.get('groups') for row in users)
+        )
+        if privileged and not request.user.has_perm('auth.change_user'):
+            return JsonResponse(
+                {'error': 'You do not have permission to assign roles or groups.'}, status=403
+            )
+        provisioner = provisioning.UserProvisioner(default_role=default_role, create_groups=create_groups)
+    except ValueError as exc:
+        return _error(str(exc))
+    return JsonResponse(provisioner.run(users).as_dict())
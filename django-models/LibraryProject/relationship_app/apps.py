@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RelationshipAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'relationship_app'
+
+    def ready(self):
+        # Register signal receivers for cache invalidation.
+        from . import signals  # noqa: F401
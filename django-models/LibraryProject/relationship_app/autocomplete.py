@@ -0,0 +1,203 @@
+"""
+In-process prefix index over author names, for the author autocomplete.
+
+Names are normalised (case-folded, accents and punctuation dropped) and
+stored once per word, from that word to the end of the name, in a sorted
+list; "tolk" then finds "J.R.R. Tolkien". A lookup is a ``bisect`` to the
+first key with the prefix and a walk over the next few keys, so it takes
+microseconds whatever the number of authors.
+
+The index is built on the first lookup in a process. After that it is
+brought up to date, at most every AUTOCOMPLETE_REFRESH_SECONDS, from the
+authors whose ``updated_at`` moved since the last refresh (this catches
+bulk imports, which send no signals). ``updated_at`` is set when a row is
+saved, not when its transaction commits, so a row can become visible after
+a refresh has moved past its timestamp: each refresh re-reads the
+AUTOCOMPLETE_OVERLAP_SECONDS before the watermark as well, which covers
+transactions up to that long. Rows whose name the index already holds are
+skipped; above AUTOCOMPLETE_MERGE_THRESHOLD changes (a bulk import), the
+new keys are sorted and merged into the list in one pass instead of being
+inserted one at a time. An author saved or deleted in this
+process is applied at once by the receivers in ``signals.py``; a delete
+also moves a version in the shared cache, which makes the other processes
+rebuild their index, since deleted rows leave nothing to refresh from.
+"""
+import re
+import threading
+import heapq
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from .models import Author
+
+AUTOCOMPLETE_REFRESH_SECONDS = 5
+AUTOCOMPLETE_OVERLAP_SECONDS = 60
+AUTOCOMPLETE_MERGE_THRESHOLD = 500
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_VERSION_KEY = 'relationship_app:autocomplete:version'
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize(value):
+    """
+    Case-folds, strips accents and reduces punctuation and runs of
+    whitespace to single spaces: "  Gabriel García-Márquez" -> "gabriel garcia marquez".
+    """
+    if not value.isascii():
+        value = unicodedata.normalize('NFKD', value)
+        value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(_SEPARATORS.sub(' ', value.casefold()).split())
+
+
+def _word_keys(name):
+    words = normalize(name).split(' ')
+    return [' '.join(words[start:]) for start in range(len(words)) if words[start]]
+
+
+def _get_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_VERSION_KEY, version, None):
+            version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+class PrefixIndex:
+    """
+    Sorted ``(key, author id)`` entries with the names they stand for.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = None
+        self._names = {}
+        self._version = None
+        self._watermark = None
+        self._checked = 0.0
+
+    # ----------------------------
+    # Loading
+    # ----------------------------
+    def _load(self, version):
+        # Read before the scan, so rows written during it are refreshed later.
+        watermark = Author.objects.aggregate(latest=Max('updated_at'))['latest']
+        entries, names = [], {}
+        for pk, name in Author.objects.values_list('pk', 'name').iterator(chunk_size=5000):
+            names[pk] = name
+            entries.extend((key, pk) for key in _word_keys(name))
+        entries.sort()
+        self._entries, self._names, self._version, self._watermark = entries, names, version, watermark
+
+    def _refresh(self):
+        changed = Author.objects.values_list('pk', 'name', 'updated_at')
+        if self._watermark is not None:
+            # Rows saved before the watermark may have committed since.
+            changed = changed.filter(updated_at__gte=self._watermark - timedelta(seconds=AUTOCOMPLETE_OVERLAP_SECONDS))
+        changes = {}
+        for pk, name, updated_at in changed.iterator(chunk_size=5000):
+            if self._names.get(pk) != name:
+                changes[pk] = name
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+        if len(changes) > AUTOCOMPLETE_MERGE_THRESHOLD:
+            self._merge(changes)
+        else:
+            for pk, name in changes.items():
+                self._set(pk, name)
+
+    def ensure_current(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._entries is not None and now - self._checked < AUTOCOMPLETE_REFRESH_SECONDS:
+                return
+            version = _get_version()
+            if self._entries is None or version != self._version:
+                self._load(version)
+            else:
+                self._refresh()
+            self._checked = now
+
+    # ----------------------------
+    # Incremental changes
+    # ----------------------------
+    def _unset(self, pk):
+        name = self._names.pop(pk, None)
+        if name is None:
+            return
+        for key in _word_keys(name):
+            position = bisect_left(self._entries, (key, pk))
+            if position < len(self._entries) and self._entries[position] == (key, pk):
+                del self._entries[position]
+
+    def _set(self, pk, name):
+        if self._names.get(pk) == name:
+            return
+        self._unset(pk)
+        self._names[pk] = name
+        for key in _word_keys(name):
+            insort(self._entries, (key, pk))
+
+    def _merge(self, changes):
+        """
+        Applies many ``{pk: name}`` changes in linear time: each ``insort``
+        moves the tail of the list.
+        """
+        entries = [entry for entry in self._entries if entry[1] not in changes]
+        added = sorted((key, pk) for pk, name in changes.items() for key in _word_keys(name))
+        self._entries = list(heapq.merge(entries, added))
+        self._names.update(changes)
+
+    def author_saved(self, pk, name):
+        with self._lock:
+            if self._entries is not None:
+                self._set(pk, name)
+
+    def author_deleted(self, pk):
+        with self._lock:
+            if self._entries is not None:
+                self._unset(pk)
+            try:
+                version = cache.incr(_VERSION_KEY)
+            except ValueError:
+                # No version: every index rebuilds on its next check.
+                return
+            # Unless another process deleted too, this index is current.
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+
+    # ----------------------------
+    # Lookups
+    # ----------------------------
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        Returns up to ``limit`` ``(id, name)`` pairs whose name, or a word in
+        it onwards, starts with ``query``; ordered by the matched key.
+        """
+        prefix = normalize(query)
+        if not prefix or limit < 1:
+            return []
+        self.ensure_current()
+        with self._lock:
+            entries, names = self._entries, self._names
+            matches, seen = [], set()
+            position = bisect_left(entries, (prefix,))
+            while position < len(entries) and len(matches) < limit:
+                key, pk = entries[position]
+                if not key.startswith(prefix):
+                    break
+                if pk not in seen:
+                    seen.add(pk)
+                    matches.append((pk, names[pk]))
+                position += 1
+        return matches
+
+
+author_index = PrefixIndex()
@@ -0,0 +1,6 @@
+"""
+Benchmark suite for the relationship_app endpoints; run it with
+``manage.py run_benchmarks`` (latency),
+``manage.py run_concurrency_benchmarks`` (sync against async views) and
+``manage.py run_database_benchmarks`` (settings profiles under load).
+"""
@@ -0,0 +1,152 @@
+"""
+Concurrency benchmark: the sync views on a thread-pooled WSGI worker
+against their async counterparts on one event loop.
+
+A WSGI worker serves at most ``threads`` requests at once, and each holds
+its thread until the response has been written to the client. The async
+views run on the event loop and only borrow a thread while a query runs.
+``delay`` stands for the time spent writing the response to a slow
+client: the sync path sleeps in the worker thread, the async path awaits.
+
+Both paths run in this process (test client and ASGI test client), with
+each async request in its own thread-sensitive context as the ASGI
+handler does, so the numbers compare the two models of concurrency
+rather than HTTP servers.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.test import AsyncClient, Client
+
+from relationship_app.models import Library
+
+from .runner import summarize
+
+MODES = ('wsgi', 'asgi')
+
+
+class InFlight:
+    """
+    Counts requests being handled and remembers the peak.
+    """
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.current -= 1
+
+
+def build_paths():
+    """
+    Returns {scenario: (sync path, async path)}.
+    """
+    library_id = Library.objects.order_by('-book_count').values_list('pk', flat=True).first()
+    return {
+        'list_books': ('/books/', '/async/books/'),
+        'library_detail': (f'/library/{library_id}/', f'/async/library/{library_id}/'),
+        'api_list': ('/api/books/?page_size=100', '/async/api/books/?page_size=100'),
+        'api_export': ('/api/authors/export/', '/async/api/authors/export/'),
+    }
+
+
+def run_wsgi(path, requests, concurrency, threads, delay):
+    """
+    ``concurrency`` clients send ``requests`` requests in total to a worker
+    with ``threads`` threads. Latency includes waiting for a free thread.
+    """
+    local = threading.local()
+    in_flight = InFlight()
+
+    def handle():
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        with in_flight:
+            response = local.client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            time.sleep(delay)
+        return response.status_code
+
+    def send(_):
+        start = time.perf_counter()
+        status = worker.submit(handle).result()
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as worker:
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            outcomes = list(clients.map(send, range(requests)))
+    return _result(outcomes, time.perf_counter() - start, in_flight.peak)
+
+
+async def _run_asgi(path, requests, concurrency, delay):
+    client = AsyncClient()
+    in_flight = InFlight()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send():
+        async with slots:
+            start = time.perf_counter()
+            async with ThreadSensitiveContext():
+                with in_flight:
+                    response = await client.get(path)
+                    if response.streaming:
+                        [chunk async for chunk in response.streaming_content]
+                    await asyncio.sleep(delay)
+            return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(send() for _ in range(requests)))
+    return _result(outcomes, time.perf_counter() - start, in_flight.peak)
+
+
+def run_asgi(path, requests, concurrency, delay):
+    """
+    ``concurrency`` clients send ``requests`` requests in total to the
+    async views on one event loop.
+    """
+    return asyncio.run(_run_asgi(path, requests, concurrency, delay))
+
+
+def _result(outcomes, elapsed, peak):
+    samples = [seconds for seconds, _ in outcomes]
+    result = summarize(samples)
+    # Wall-clock throughput, since requests overlap.
+    result['throughput_rps'] = round(len(samples) / elapsed, 1)
+    result['errors'] = sum(1 for _, status in outcomes if status != 200)
+    result['peak_in_flight'] = peak
+    return result
+
+
+def run(levels, requests, threads=4, delay=0.02, only=None, progress=None):
+    """
+    Runs every scenario (or those named in ``only``) in both modes at each
+    concurrency level.
+    """
+    results = []
+    for scenario, (sync_path, async_path) in build_paths().items():
+        if only and scenario not in only:
+            continue
+        for concurrency in levels:
+            for mode in MODES:
+                if mode == 'wsgi':
+                    result = run_wsgi(sync_path, requests, concurrency, threads, delay)
+                else:
+                    result = run_asgi(async_path, requests, concurrency, delay)
+                result = {'scenario': scenario, 'mode': mode, 'concurrency': concurrency, **result}
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return results
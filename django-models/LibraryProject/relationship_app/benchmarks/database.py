@@ -0,0 +1,135 @@
+"""
+Read and write throughput of the SQLite database under several worker
+processes, compared across settings profiles.
+
+Each profile gets its own database file in a temporary directory, created
+and filled by a child process running under that profile's settings
+module. Then ``workers`` processes send requests through the test client
+for ``duration`` seconds: reads fetch a page of the books API, writes add
+a book. Requests go through Django's request_started/request_finished
+handling, so connection reuse (CONN_MAX_AGE) behaves as in a server.
+
+The child processes import Django themselves, so this module must not
+import models at load time.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+DEFAULT_PROFILES = ('LibraryProject.settings', 'LibraryProject.settings_performance')
+
+
+def _setup_django(settings_module, database):
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.conf import settings
+    # Before setup, so no connection has been opened with the real name.
+    settings.DATABASES['default']['NAME'] = database
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.DEBUG = False
+    import django
+    django.setup()
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+
+def _prepare(settings_module, database, spec):
+    _setup_django(settings_module, database)
+    from django.core.management import call_command
+
+    from .datagen import DatasetSpec, generate
+    call_command('migrate', verbosity=0)
+    generate(DatasetSpec(**spec))
+
+
+def _work(settings_module, database, duration, write_ratio, seed, barrier, results):
+    _setup_django(settings_module, database)
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from django.test import Client
+
+    from relationship_app.models import Author
+
+    from .datagen import BENCH_USERNAME
+
+    client = Client(raise_request_exception=False)
+    client.force_login(User.objects.get(username=BENCH_USERNAME))
+    author_ids = list(Author.objects.values_list('pk', flat=True)[:100])
+    connections.close_all()
+    rng = random.Random(seed)
+    reads, writes, errors = [], [], 0
+
+    barrier.wait()
+    deadline = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < deadline:
+        i += 1
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            response = client.post('/add_book/', {
+                'title': f'Load {seed}-{i}', 'author_id': rng.choice(author_ids),
+            })
+            samples, expected = writes, 302
+        else:
+            response = client.get('/api/books/?page_size=50')
+            samples, expected = reads, 200
+        if response.status_code == expected:
+            samples.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    results.put({'reads': reads, 'writes': writes, 'errors': errors})
+
+
+def run_profile(settings_module, spec, workers, duration=5.0, write_ratio=0.2):
+    """
+    Fills a fresh database under ``settings_module`` and runs ``workers``
+    concurrent processes against it.
+    """
+    from .runner import summarize
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'benchmark.sqlite3')
+        prepare = context.Process(target=_prepare, args=(settings_module, database, spec.as_dict()))
+        prepare.start()
+        prepare.join()
+        if prepare.exitcode:
+            raise RuntimeError(f'Preparing the {settings_module} database failed.')
+
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=_work, args=(settings_module, database, duration, write_ratio, seed, barrier, results)
+            )
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    reads = [sample for outcome in outcomes for sample in outcome['reads']]
+    writes = [sample for outcome in outcomes for sample in outcome['writes']]
+    return {
+        'profile': settings_module,
+        'workers': workers,
+        'reads_per_second': round(len(reads) / duration, 1),
+        'writes_per_second': round(len(writes) / duration, 1),
+        'errors': sum(outcome['errors'] for outcome in outcomes),
+        'read': summarize(reads) if reads else None,
+        'write': summarize(writes) if writes else None,
+    }
+
+
+def run(profiles, worker_counts, spec, duration=5.0, write_ratio=0.2, progress=None):
+    results = []
+    for workers in worker_counts:
+        for settings_module in profiles:
+            result = run_profile(settings_module, spec, workers, duration, write_ratio)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
@@ -0,0 +1,133 @@
+"""
+Synthetic catalogue data for benchmarks.
+
+Generation is deterministic for a given seed and goes through
+``bulk_create``, then rebuilds the book counts, search index and catalogue
+read model in bulk.
+"""
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from relationship_app import catalogue, counters, search
+from relationship_app.models import Author, Book, Library, UserProfile
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench-password-123'
+BOOK_PERMISSIONS = ('add_book', 'change_book', 'delete_book')
+
+
+class DatasetSpec:
+    """
+    Shape of a generated catalogue. ``density`` is the fraction of all
+    books each library holds.
+    """
+
+    def __init__(self, authors=1000, books=10000, libraries=10, density=0.2, seed=0):
+        self.authors = authors
+        self.books = books
+        self.libraries = libraries
+        self.density = density
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+        Adds the dataset options to a management command.
+        """
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--libraries', type=int, default=10)
+        parser.add_argument('--density', type=float, default=0.2, help='Fraction of all books in each library.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    @classmethod
+    def from_options(cls, options):
+        if not 0 <= options['density'] <= 1:
+            raise CommandError('--density must be between 0 and 1.')
+        if options['books'] < 2 or options['authors'] < 1 or options['libraries'] < 1:
+            raise CommandError('Needs at least 2 books, 1 author and 1 library.')
+        return cls(
+            authors=options['authors'], books=options['books'], libraries=options['libraries'],
+            density=options['density'], seed=options['seed'],
+        )
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Runs the block against a throwaway test database, destroyed on exit.
+    """
+    setup_test_environment()
+    hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'])
+    hosts.enable()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        hosts.disable()
+        teardown_test_environment()
+
+
+def _bulk_ids(model, objects, batch_size):
+    created = model.objects.bulk_create(objects, batch_size=batch_size)
+    if all(obj.pk is not None for obj in created):
+        return [obj.pk for obj in created]
+    return list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)])[::-1]
+
+
+def generate(spec, batch_size=2000):
+    """
+    Fills the database with ``spec`` and creates the benchmark user.
+    Returns the user.
+    """
+    rng = random.Random(spec.seed)
+    with transaction.atomic():
+        author_ids = _bulk_ids(
+            Author, [Author(name=f'Author {i:07d}') for i in range(spec.authors)], batch_size
+        )
+        book_ids = []
+        for start in range(0, spec.books, batch_size):
+            books = [
+                Book(title=f'Title {rng.randrange(spec.books * 10):08d}', author_id=rng.choice(author_ids))
+                for _ in range(start, min(start + batch_size, spec.books))
+            ]
+            book_ids.extend(_bulk_ids(Book, books, batch_size))
+        library_ids = _bulk_ids(
+            Library, [Library(name=f'Library {i:04d}') for i in range(spec.libraries)], batch_size
+        )
+        Through = Library.books.through
+        per_library = int(len(book_ids) * spec.density)
+        for library_id in library_ids:
+            members = rng.sample(book_ids, per_library)
+            Through.objects.bulk_create(
+                [Through(library_id=library_id, book_id=book_id) for book_id in members],
+                batch_size=batch_size,
+            )
+        counters.rebuild_book_counts()
+        search.rebuild_index()
+        catalogue.rebuild()
+    cache.clear()
+    return create_bench_user()
+
+
+def create_bench_user():
+    """
+    Creates a librarian holding the book permissions.
+    """
+    user = User.objects.create_user(BENCH_USERNAME, password=BENCH_PASSWORD)
+    UserProfile.objects.filter(user=user).update(role=UserProfile.ROLE_LIBRARIAN)
+    user.user_permissions.add(
+        *Permission.objects.filter(content_type__app_label='relationship_app', codename__in=BOOK_PERMISSIONS)
+    )
+    return user
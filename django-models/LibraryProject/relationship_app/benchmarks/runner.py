@@ -0,0 +1,291 @@
+"""
+Latency and throughput benchmarks for the relationship_app endpoints.
+
+Each scenario is run sequentially through a transport: the Django test
+client (in-process, no network) or a real HTTP round trip to a local
+threaded WSGI server. Results are summarised as p50/p99/mean latency and
+requests per second, and saved as JSON so runs can be compared across
+commits.
+"""
+import http.cookiejar
+import json
+import platform
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test import Client
+
+from relationship_app import counters
+from relationship_app.models import Author, Book, Library
+from relationship_app.pagination import encode_cursor
+
+from .datagen import BENCH_PASSWORD, BENCH_USERNAME
+
+
+# ----------------------------
+# Transports
+# ----------------------------
+class ClientTransport:
+    """
+    Requests through the Django test client.
+    """
+    name = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            return self.client.post(path, data or {}).status_code
+        return self.client.get(path).status_code
+
+    def close(self):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class WSGITransport:
+    """
+    Requests over HTTP to a threaded wsgiref server on a free local port.
+    The server runs in this process, so it shares the benchmark database.
+    """
+    name = 'wsgi'
+
+    def __init__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, WSGIHandler(), server_class=_ThreadingWSGIServer, handler_class=_QuietHandler
+        )
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect()
+        )
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        # Any page with a form sets the CSRF cookie.
+        self.request('GET', '/login/')
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method, path, data=None):
+        body, headers = None, {}
+        if method == 'POST':
+            token = self._csrf_token()
+            body = urllib.parse.urlencode({**(data or {}), 'csrfmiddlewaretoken': token}).encode()
+            headers = {'Content-Type': 'application/x-www-form-urlencoded', 'X-CSRFToken': token}
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {'client': ClientTransport, 'wsgi': WSGITransport}
+
+
+# ----------------------------
+# Scenarios
+# ----------------------------
+class Scenario:
+    """
+    One endpoint to time. ``make_request(i)`` returns (method, path, data)
+    for iteration ``i``; any status outside ``expect`` counts as an error.
+    """
+
+    def __init__(self, name, make_request, expect=(200,), max_iterations=None):
+        self.name = name
+        self.make_request = make_request
+        self.expect = expect
+        self.max_iterations = max_iterations
+
+
+def build_scenarios(iterations):
+    """
+    Builds the scenarios against the generated data.
+    """
+    library_id = Library.objects.order_by('-book_count').values_list('pk', flat=True).first()
+    author_ids = list(Author.objects.values_list('pk', flat=True)[:100])
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:1000])
+    middle = Book.objects.order_by('title', 'id').values_list('title', 'id')[Book.objects.count() // 2]
+    deep_cursor = encode_cursor(middle)
+    # Books for the delete scenario, so the others keep their data.
+    Book.objects.bulk_create([Book(title=f'Doomed {i}', author_id=author_ids[0]) for i in range(iterations)])
+    counters.rebuild_book_counts(author_ids=author_ids[:1], library_ids=[])
+    doomed_ids = list(Book.objects.filter(title__startswith='Doomed ').values_list('pk', flat=True))
+
+    return [
+        Scenario('list_books', lambda i: ('GET', '/books/', None)),
+        Scenario('list_books_deep_page', lambda i: ('GET', f'/books/?after={deep_cursor}', None)),
+        Scenario('library_detail', lambda i: ('GET', f'/library/{library_id}/', None)),
+        Scenario('search_books', lambda i: ('GET', '/books/search/?q=title', None)),
+        # Password hashing dominates; keep this one short.
+        Scenario(
+            'login',
+            lambda i: ('POST', '/login/', {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}),
+            expect=(302,), max_iterations=20,
+        ),
+        Scenario(
+            'add_book',
+            lambda i: ('POST', '/add_book/', {'title': f'Bench {i}', 'author_id': author_ids[i % len(author_ids)]}),
+            expect=(302,),
+        ),
+        Scenario(
+            'edit_book',
+            lambda i: (
+                'POST', f'/edit_book/{book_ids[i % len(book_ids)]}/',
+                {'title': f'Edited {i}', 'author_id': author_ids[i % len(author_ids)]},
+            ),
+            expect=(302,),
+        ),
+        Scenario('delete_book', lambda i: ('POST', f'/delete_book/{doomed_ids.pop()}/', {}), expect=(302,)),
+    ]
+
+
+# ----------------------------
+# Measurement
+# ----------------------------
+def percentile(sorted_samples, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'iterations': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'throughput_rps': round(len(ordered) / total, 1) if total else None,
+    }
+
+
+def run_scenario(transport, scenario, iterations, warmup=3, cold=False):
+    """
+    Times ``iterations`` requests after ``warmup`` untimed ones. With
+    ``cold``, the cache is cleared before every request.
+    """
+    if scenario.max_iterations:
+        iterations = min(iterations, scenario.max_iterations)
+        warmup = min(warmup, 1)
+    samples, errors = [], 0
+    for i in range(warmup + iterations):
+        method, path, data = scenario.make_request(i)
+        if cold:
+            cache.clear()
+        start = time.perf_counter()
+        status = transport.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        if status not in scenario.expect:
+            errors += 1
+        if i >= warmup:
+            samples.append(elapsed)
+    result = {'scenario': scenario.name, 'transport': transport.name, 'errors': errors}
+    result.update(summarize(samples))
+    return result
+
+
+def run(transport_names, iterations, warmup=3, cold=False, only=None, progress=None):
+    """
+    Runs every scenario (or those named in ``only``) on each transport.
+    """
+    results = []
+    for transport_name in transport_names:
+        transport = TRANSPORTS[transport_name]()
+        try:
+            for scenario in build_scenarios(iterations + warmup):
+                if only and scenario.name not in only:
+                    continue
+                result = run_scenario(transport, scenario, iterations, warmup, cold)
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+        finally:
+            transport.close()
+    return results
+
+
+# ----------------------------
+# Results files
+# ----------------------------
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(spec, options):
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'dataset': spec.as_dict(),
+        'options': options,
+    }
+
+
+def save(path, meta, results):
+    with open(path, 'w') as fh:
+        json.dump({'meta': meta, 'results': results}, fh, indent=2)
+
+
+def compare(baseline_path, results):
+    """
+    Yields (scenario, transport, baseline p50, current p50, change) for
+    scenarios present in both runs.
+    """
+    with open(baseline_path) as fh:
+        baseline = {(r['scenario'], r['transport']): r for r in json.load(fh)['results']}
+    for result in results:
+        before = baseline.get((result['scenario'], result['transport']))
+        if before and before['p50_ms']:
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms']
+            yield result['scenario'], result['transport'], before['p50_ms'], result['p50_ms'], change
@@ -0,0 +1,136 @@
+"""
+Copies the Introduction_to_Django project's ``bookshelf.Book`` rows into
+``relationship_app``.
+
+bookshelf keeps a book's author as free text. Its rows are read from the
+BOOKSHELF database in id order, a chunk at a time after the last id seen,
+so every read is an index range scan however far the run has got. Author
+strings are deduplicated on their ``autocomplete.normalize`` form ("J.R.R.
+Tolkien" and "j r r tolkien" are one author) through an in-memory map,
+seeded from the existing authors when a run starts and extended with the
+authors each chunk creates. Books are written with ``bulk_create``, and
+what the receivers would have done (search index, catalogue entries,
+author counts, page caches) is done per chunk, as in ``importers.py``.
+
+Each chunk commits together with the ``ImportCheckpoint`` holding the last
+source id it copied, so a run that stops for any reason resumes after that
+id without copying a row twice.
+"""
+from collections import Counter
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import caching, catalogue, counters, search
+from .autocomplete import normalize
+from .importers import ImportStats
+from .models import Author, Book, ImportCheckpoint
+from .routers import BOOKSHELF
+
+CHECKPOINT_NAME = 'bookshelf'
+DEFAULT_CHUNK_SIZE = 2000
+SOURCE_TABLE = 'bookshelf_book'
+
+
+def iter_source_chunks(after_id, chunk_size, using=BOOKSHELF):
+    """
+    Yields lists of ``(id, title, author, publication_year)`` rows of the
+    source table, in id order, starting after ``after_id``.
+    """
+    connection = connections[using]
+    sql = (
+        f'SELECT id, title, author, publication_year FROM {connection.ops.quote_name(SOURCE_TABLE)} '
+        f'WHERE id > %s ORDER BY id LIMIT %s'
+    )
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [after_id, chunk_size])
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+class BookshelfMigration:
+    """
+    A resumable copy of the source table, checkpointed under ``name``.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, source=BOOKSHELF, name=CHECKPOINT_NAME):
+        self.chunk_size = chunk_size
+        self.source = source
+        self.name = name
+        self.author_ids = {}
+
+    def checkpoint(self):
+        return ImportCheckpoint.objects.get_or_create(name=self.name)[0]
+
+    def reset(self):
+        """
+        Forgets the checkpoint, so the next run starts from the first row.
+        The rows already copied stay.
+        """
+        ImportCheckpoint.objects.filter(name=self.name).delete()
+
+    def run(self, progress=None):
+        """
+        Copies the rows after the checkpoint and returns an ``ImportStats``.
+        ``progress`` is called with the stats after every chunk.
+        """
+        stats = ImportStats()
+        checkpoint = self.checkpoint()
+        self._load_authors()
+        for rows in iter_source_chunks(checkpoint.last_id, self.chunk_size, using=self.source):
+            with transaction.atomic():
+                # Two runs at once would copy the same rows.
+                locked = ImportCheckpoint.objects.select_for_update().get(name=self.name)
+                if locked.last_id != checkpoint.last_id:
+                    raise RuntimeError(f'The "{self.name}" checkpoint was moved by another run.')
+                self._copy_chunk(rows, stats)
+                checkpoint.last_id = rows[-1][0]
+                checkpoint.rows += len(rows)
+                checkpoint.save(update_fields=['last_id', 'rows', 'updated_at'])
+            if progress is not None:
+                progress(stats)
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=['completed_at', 'updated_at'])
+        return stats
+
+    def _load_authors(self):
+        # Reloaded on every run: authors of a rolled back chunk do not exist.
+        self.author_ids = {}
+        for pk, name in Author.objects.order_by('pk').values_list('pk', 'name').iterator(chunk_size=5000):
+            self.author_ids.setdefault(normalize(name), pk)
+
+    def _copy_chunk(self, rows, stats):
+        stats.rows += len(rows)
+        records = []
+        new_authors = {}
+        for _, title, author, publication_year in rows:
+            title = (title or '').strip()
+            author = ' '.join((author or '').split())
+            key = normalize(author)
+            if not title or not key:
+                stats.skipped += 1
+                continue
+            if key not in self.author_ids:
+                new_authors.setdefault(key, author)
+            records.append((title, key, publication_year))
+
+        if new_authors:
+            created = Author.objects.bulk_create([Author(name=name) for name in new_authors.values()])
+            self.author_ids.update(zip(new_authors, (author.pk for author in created)))
+            stats.authors += len(created)
+        books = Book.objects.bulk_create([
+            Book(title=title, author_id=self.author_ids[key], publication_year=publication_year)
+            for title, key, publication_year in records
+        ])
+        stats.books += len(books)
+
+        # bulk_create sends no signals; see importers.BookImporter.
+        book_ids = [book.pk for book in books]
+        search.reindex_books(book_ids)
+        catalogue.refresh_books(book_ids)
+        counters.adjust_author_counts(Counter(book.author_id for book in books))
+        caching.mark_changed()
@@ -0,0 +1,265 @@
+"""
+Versioned caching for the catalogue pages.
+
+Every cached page belongs to a scope: ``CATALOGUE`` for the book list and
+``library_scope(pk)`` for a library's detail page. Each scope has a version,
+the time of its last change in nanoseconds, kept in the cache. Page keys
+include the version, so bumping it on a write makes every stale page
+unreachable without having to find and delete it. The version also serves
+as the page's ETag and Last-Modified, which lets ``conditional_page`` answer
+revalidation requests with a 304 before the view or the database is touched.
+Both decorators also wrap async views, reading the cache and seeding
+versions without blocking the event loop.
+
+A library's version is mirrored in ``Library.updated_at``, which
+``mark_changed`` keeps current, so an evicted library version is restored
+from one primary-key lookup. That lookup reads the primary: a lagging
+replica would restore an older version and revive stale pages. For the
+same reason a page whose version is younger than REPLICA_MAX_LAG is
+rendered from the primary, as replicas may not have its write yet.
+
+Book rows are cached as template fragments keyed by book id and deleted
+when that book or its author changes. The receivers in ``signals.py`` do
+the bumping and deleting, which takes effect when the write commits.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from .models import Library
+from .routers import PRIMARY, use_primary
+
+CATALOGUE = 'catalogue'
+# The book list's and the library page's rows (the latter also shows the year).
+BOOK_FRAGMENTS = ('book_row', 'library_book_row')
+
+
+def library_scope(pk):
+    return f'library:{pk}'
+
+
+def _version_key(scope):
+    return f'relationship_app:version:{scope}'
+
+
+def _seed_version(scope):
+    if scope.startswith('library:'):
+        updated_at = (
+            Library.objects.using(PRIMARY).filter(pk=scope[len('library:'):])
+            .values_list('updated_at', flat=True).first()
+        )
+        if updated_at is not None:
+            return int(updated_at.timestamp() * 1_000_000) * 1000
+    return time.time_ns()
+
+
+async def _aseed_version(scope):
+    if scope.startswith('library:'):
+        updated_at = await (
+            Library.objects.using(PRIMARY).filter(pk=scope[len('library:'):])
+            .values_list('updated_at', flat=True).afirst()
+        )
+        if updated_at is not None:
+            return int(updated_at.timestamp() * 1_000_000) * 1000
+    return time.time_ns()
+
+
+def get_version(scope):
+    """
+    Returns the scope's current version. A scope with no recorded version
+    (never written, or evicted) is seeded from ``Library.updated_at`` for a
+    library and from "now" otherwise; neither can cause a stale hit.
+    """
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = _seed_version(scope)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_request_version(request, scope):
+    """
+    ``get_version`` memoised on the request, so the ETag, Last-Modified and
+    page cache checks of one request agree and share one cache read.
+    """
+    versions = request.__dict__.setdefault('_catalogue_versions', {})
+    if scope not in versions:
+        versions[scope] = get_version(scope)
+    return versions[scope]
+
+
+async def aget_version(scope):
+    """
+    ``get_version`` for async code.
+    """
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        version = await _aseed_version(scope)
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+async def aget_request_version(request, scope):
+    """
+    ``get_request_version`` for async code.
+    """
+    versions = request.__dict__.setdefault('_catalogue_versions', {})
+    if scope not in versions:
+        versions[scope] = await aget_version(scope)
+    return versions[scope]
+
+
+def bump_versions(scopes, using=None):
+    """
+    Moves the given scopes to a new version, orphaning their cached pages,
+    once the current transaction on ``using`` commits (at once outside one).
+    Bumped earlier, a page rendered from the not yet committed state would
+    be cached under the new version.
+    """
+    scopes = list(scopes)
+
+    def bump():
+        now = time.time_ns()
+        cache.set_many({_version_key(scope): now for scope in scopes}, None)
+
+    transaction.on_commit(bump, using=using)
+
+
+def mark_changed(library_ids=(), catalogue=True, using=None):
+    """
+    Records a write: touches ``updated_at`` on the affected libraries and
+    bumps their scopes, plus the catalogue scope unless told otherwise.
+    """
+    library_ids = list(library_ids)
+    if library_ids:
+        Library.objects.using(using).filter(pk__in=library_ids).update(updated_at=timezone.now())
+    scopes = [library_scope(pk) for pk in library_ids]
+    if catalogue:
+        scopes.append(CATALOGUE)
+    bump_versions(scopes, using=using)
+
+
+def invalidate_book_fragments(book_ids, using=None):
+    """
+    Deletes the cached rows of the given books once the current
+    transaction on ``using`` commits, for the same reason.
+    """
+    keys = [make_template_fragment_key(name, [pk]) for name in BOOK_FRAGMENTS for pk in book_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def etag_for(scope, version):
+    return f'"{scope}-{version}"'
+
+
+def last_modified_for(version):
+    return datetime.fromtimestamp(version // 1_000_000_000, tz=dt_timezone.utc)
+
+
+def _page_key(scope, version, request):
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'relationship_app:page:{scope}:{version}:{path}'
+
+
+def _set_validators(response, scope, version):
+    response['ETag'] = etag_for(scope, version)
+    response['Last-Modified'] = http_date(version // 1_000_000_000)
+
+
+def _replicas_may_lag(version):
+    return time.time_ns() - version < settings.REPLICA_MAX_LAG * 1_000_000_000
+
+
+def _cacheable(response):
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    return response
+
+
+def cache_catalogue_page(get_scope):
+    """
+    Caches successful GET/HEAD responses of a view under the version of the
+    scope returned by ``get_scope(request, *args, **kwargs)``.
+    The rendered page must not depend on the requesting user.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view_func(request, *args, **kwargs)
+                scope = get_scope(request, *args, **kwargs)
+                version = await aget_request_version(request, scope)
+                key = _page_key(scope, version, request)
+                response = await cache.aget(key)
+                if response is None:
+                    with use_primary(_replicas_may_lag(version)):
+                        response = _cacheable(await view_func(request, *args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    _set_validators(response, scope, version)
+                    await cache.aset(key, response, settings.CATALOGUE_CACHE_TIMEOUT)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            scope = get_scope(request, *args, **kwargs)
+            version = get_request_version(request, scope)
+            key = _page_key(scope, version, request)
+            response = cache.get(key)
+            if response is None:
+                with use_primary(_replicas_may_lag(version)):
+                    response = _cacheable(view_func(request, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                _set_validators(response, scope, version)
+                cache.set(key, response, settings.CATALOGUE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_page(get_scope):
+    """
+    Answers If-None-Match / If-Modified-Since with a 304 from the scope's
+    version alone, before the wrapped view runs.
+    """
+    def etag(request, *args, **kwargs):
+        scope = get_scope(request, *args, **kwargs)
+        return etag_for(scope, get_request_version(request, scope))
+
+    def last_modified(request, *args, **kwargs):
+        return last_modified_for(get_request_version(request, get_scope(request, *args, **kwargs)))
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        if not iscoroutinefunction(view_func):
+            return conditional_view
+
+        # condition() calls the validator functions synchronously, so load
+        # the version first; they then find it memoised on the request.
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            await aget_request_version(request, get_scope(request, *args, **kwargs))
+            return await conditional_view(request, *args, **kwargs)
+        return async_wrapper
+
+    return decorator
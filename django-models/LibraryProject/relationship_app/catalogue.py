@@ -0,0 +1,111 @@
+"""
+The denormalised catalogue read model, ``BookCatalogueEntry``.
+
+Each entry copies a book's title, its author's id and name and the ids of
+the libraries holding it, so the book list and the books API read one
+narrow table through its (title, book) index, with no joins. The
+receivers in ``signals.py`` refresh the entries a write touches, and
+``manage.py refresh_catalogue`` rebuilds them all. Entries of deleted
+books go with them through the foreign key's cascade.
+"""
+from collections import defaultdict
+
+from django.db import router, transaction
+
+from .models import Author, Book, BookCatalogueEntry, Library
+
+REFRESH_CHUNK_SIZE = 500
+ENTRY_FIELDS = ['title', 'author_id', 'author_name', 'library_ids']
+
+LibraryBooks = Library.books.through
+
+
+def _using(using):
+    return using or router.db_for_write(BookCatalogueEntry)
+
+
+def _build_entries(book_ids, using):
+    libraries = defaultdict(list)
+    links = (
+        LibraryBooks.objects.using(using).filter(book_id__in=book_ids)
+        .order_by('library_id').values_list('book_id', 'library_id')
+    )
+    for book_id, library_id in links:
+        libraries[book_id].append(library_id)
+    books = (
+        Book.objects.using(using).filter(pk__in=book_ids)
+        .values_list('pk', 'title', 'author_id', 'author__name')
+    )
+    return [
+        BookCatalogueEntry(
+            book_id=pk, title=title, author_id=author_id, author_name=author_name, library_ids=libraries[pk]
+        )
+        for pk, title, author_id, author_name in books
+    ]
+
+
+def refresh_books(book_ids, using=None):
+    """
+    Rewrites the entries of the given books, in chunks. Ids of books that
+    no longer exist lose their entries.
+    """
+    using = _using(using)
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), REFRESH_CHUNK_SIZE):
+        chunk = book_ids[start:start + REFRESH_CHUNK_SIZE]
+        entries = _build_entries(chunk, using)
+        BookCatalogueEntry.objects.using(using).bulk_create(
+            entries, update_conflicts=True, unique_fields=['book'], update_fields=ENTRY_FIELDS
+        )
+        missing = set(chunk) - {entry.book_id for entry in entries}
+        if missing:
+            BookCatalogueEntry.objects.using(using).filter(book_id__in=missing).delete()
+
+
+def save_book(book, created, using=None):
+    """
+    Writes a just-saved book's entry from the instance. A new book has no
+    libraries yet; an existing one keeps the library ids it has.
+    """
+    using = _using(using)
+    author = book._state.fields_cache.get('author')
+    if author is not None and author.pk == book.author_id:
+        author_name = author.name
+    else:
+        author_name = Author.objects.using(using).filter(pk=book.author_id).values_list('name', flat=True).first()
+    fields = {'title': book.title, 'author_id': book.author_id, 'author_name': author_name}
+    if created:
+        BookCatalogueEntry.objects.using(using).bulk_create(
+            [BookCatalogueEntry(book_id=book.pk, library_ids=[], **fields)],
+            update_conflicts=True, unique_fields=['book'], update_fields=ENTRY_FIELDS,
+        )
+    elif not BookCatalogueEntry.objects.using(using).filter(book_id=book.pk).update(**fields):
+        refresh_books([book.pk], using=using)
+
+
+def rename_author(author_id, name, using=None):
+    BookCatalogueEntry.objects.using(_using(using)).filter(author_id=author_id).update(author_name=name)
+
+
+def rebuild(using=None):
+    """
+    Empties the catalogue and rebuilds every entry. Returns the number built.
+    Runs in one transaction, so readers see the old entries until it commits.
+    """
+    using = _using(using)
+    with transaction.atomic(using=using):
+        return _rebuild(using)
+
+
+def _rebuild(using):
+    BookCatalogueEntry.objects.using(using).all().delete()
+    book_ids = Book.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    total, chunk = 0, []
+    for pk in book_ids.iterator(chunk_size=REFRESH_CHUNK_SIZE):
+        chunk.append(pk)
+        if len(chunk) == REFRESH_CHUNK_SIZE:
+            total += len(BookCatalogueEntry.objects.using(using).bulk_create(_build_entries(chunk, using)))
+            chunk = []
+    if chunk:
+        total += len(BookCatalogueEntry.objects.using(using).bulk_create(_build_entries(chunk, using)))
+    return total
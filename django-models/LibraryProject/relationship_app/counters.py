@@ -0,0 +1,60 @@
+"""
+Denormalised book counts on ``Author`` and ``Library``.
+
+Writes adjust the counters with ``F()`` expressions, so concurrent writers
+cannot lose each other's updates. ``rebuild_book_counts`` recomputes them
+from the source tables in set-based UPDATEs, for reconciling after bulk
+operations that bypass signals.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Author, Book, Library
+
+
+def _adjust(model, deltas, using):
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.using(using).filter(pk__in=pks).update(book_count=F('book_count') + delta)
+
+
+def adjust_author_counts(deltas, using=None):
+    """
+    Applies ``{author_id: delta}`` to ``Author.book_count``.
+    """
+    _adjust(Author, deltas, using)
+
+
+def adjust_library_counts(deltas, using=None):
+    """
+    Applies ``{library_id: delta}`` to ``Library.book_count``.
+    """
+    _adjust(Library, deltas, using)
+
+
+def rebuild_book_counts(author_ids=None, library_ids=None, using=None):
+    """
+    Recomputes the counters, for all rows or only the given ids.
+    Pass an empty list to skip a model. Returns the rows updated per model.
+    """
+    Through = Library.books.through
+    author_books = (
+        Book.objects.filter(author_id=OuterRef('pk')).order_by()
+        .values('author_id').annotate(total=Count('pk')).values('total')
+    )
+    library_books = (
+        Through.objects.filter(library_id=OuterRef('pk')).order_by()
+        .values('library_id').annotate(total=Count('pk')).values('total')
+    )
+    updated = {}
+    for model, subquery, ids in ((Author, author_books, author_ids), (Library, library_books, library_ids)):
+        queryset = model.objects.using(using)
+        if ids is not None:
+            queryset = queryset.filter(pk__in=list(ids))
+        updated[model._meta.model_name] = queryset.update(book_count=Coalesce(Subquery(subquery), Value(0)))
+    return updated
@@ -0,0 +1,162 @@
+"""
+Chunked deletion of authors, books and libraries.
+
+``Model.delete()`` and ``QuerySet.delete()`` collect every row a delete
+cascades to into memory first (an author's books, their library links and
+catalogue entries), send ``pre_delete``/``post_delete`` for each book, and
+delete it all in one transaction that holds its locks throughout. Here the
+dependent rows go in chunks of ``chunk_size``, each in a short transaction
+of its own:
+
+* books are deleted with plain DELETEs, preceded by their library links
+  and catalogue entries (no receivers listen to either). No per-book
+  signal is sent; what the receivers in ``signals.py`` would do (search
+  index, counters, page caches) is done once per chunk instead;
+* a library's links are removed through ``membership.remove_books``, so
+  its former books get their catalogue entries and search documents
+  rewritten as on any other removal.
+
+The author or library itself is deleted last, with ``delete()``, once
+nothing cascades from it anymore, so its own receivers still run. A run
+that is interrupted leaves only whole chunks deleted; running it again
+with the same ids carries on from there.
+"""
+import time
+from collections import Counter
+
+from django.db import connections, router, transaction
+
+from . import caching, counters, membership, search
+from .models import Author, Book, BookCatalogueEntry, Library
+
+CHUNK_SIZE = 500
+
+LibraryBooks = Library.books.through
+
+
+class DeletionStats:
+    """
+    Running totals for a deletion.
+    """
+
+    def __init__(self):
+        self.authors = 0
+        self.books = 0
+        self.libraries = 0
+        self.library_links = 0
+        self.chunks = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def books_per_second(self):
+        elapsed = self.elapsed
+        return self.books / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.authors} authors, {self.books} books, {self.libraries} libraries, '
+            f'{self.library_links} library links in {self.chunks} chunks '
+            f'in {self.elapsed:.1f}s ({self.books_per_second:.0f} books/s)'
+        )
+
+
+def _report(stats, progress):
+    stats.chunks += 1
+    if progress is not None:
+        progress(stats)
+
+
+def _delete_rows(model, pks, using):
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', pks)
+        return cursor.rowcount
+
+
+def _delete_book_chunk(book_ids, using, stats):
+    with transaction.atomic(using=using):
+        books = list(
+            Book.objects.using(using).select_for_update().filter(pk__in=book_ids).values_list('pk', 'author_id')
+        )
+        if not books:
+            return
+        book_ids = [pk for pk, _ in books]
+        links = LibraryBooks.objects.using(using).filter(book_id__in=book_ids)
+        library_counts = Counter(links.values_list('library_id', flat=True))
+        links.delete()
+        BookCatalogueEntry.objects.using(using).filter(book_id__in=book_ids).delete()
+        search.remove_books(book_ids, using=using)
+        stats.books += _delete_rows(Book, book_ids, using)
+        stats.library_links += sum(library_counts.values())
+
+        author_counts = Counter(author_id for _, author_id in books)
+        counters.adjust_author_counts({pk: -count for pk, count in author_counts.items()}, using=using)
+        counters.adjust_library_counts({pk: -count for pk, count in library_counts.items()}, using=using)
+        caching.invalidate_book_fragments(book_ids, using=using)
+        caching.mark_changed(library_counts, using=using)
+
+
+def delete_books(book_ids, using=None, chunk_size=CHUNK_SIZE, progress=None, stats=None):
+    """
+    Deletes the given books. Ids that are not books are skipped. Returns a
+    ``DeletionStats``; ``progress`` is called with it after every chunk.
+    """
+    using = using or router.db_for_write(Book)
+    stats = stats or DeletionStats()
+    book_ids = sorted(set(book_ids))
+    for start in range(0, len(book_ids), chunk_size):
+        _delete_book_chunk(book_ids[start:start + chunk_size], using, stats)
+        _report(stats, progress)
+    return stats
+
+
+def delete_authors(author_ids, using=None, chunk_size=CHUNK_SIZE, progress=None, stats=None):
+    """
+    Deletes the given authors and their books, a chunk of books at a time.
+    """
+    using = using or router.db_for_write(Author)
+    stats = stats or DeletionStats()
+    for author_id in sorted(set(author_ids)):
+        books = Book.objects.using(using).filter(author_id=author_id).order_by('pk').values_list('pk', flat=True)
+        while True:
+            book_ids = list(books[:chunk_size])
+            if not book_ids:
+                break
+            _delete_book_chunk(book_ids, using, stats)
+            _report(stats, progress)
+        # Books added meanwhile are few; delete() cascades to them.
+        deleted = Author.objects.using(using).filter(pk=author_id).delete()[1]
+        stats.authors += deleted.get(Author._meta.label, 0)
+        stats.books += deleted.get(Book._meta.label, 0)
+    return stats
+
+
+def delete_libraries(library_ids, using=None, chunk_size=CHUNK_SIZE, progress=None, stats=None):
+    """
+    Deletes the given libraries (not their books), unlinking their books a
+    chunk at a time first.
+    """
+    using = using or router.db_for_write(Library)
+    stats = stats or DeletionStats()
+    for library in Library.objects.using(using).filter(pk__in=set(library_ids)).order_by('pk'):
+        links = LibraryBooks.objects.using(using).filter(library_id=library.pk).order_by('book_id')
+        while True:
+            book_ids = list(links.values_list('book_id', flat=True)[:chunk_size])
+            if not book_ids:
+                break
+            change = membership.remove_books(library, book_ids, using=using, batch_size=chunk_size)
+            stats.library_links += len(change.removed)
+            _report(stats, progress)
+        deleted = Library.objects.using(using).filter(pk=library.pk).delete()[1]
+        stats.libraries += deleted.get(Library._meta.label, 0)
+    return stats
+
+
+DELETERS = {'authors': delete_authors, 'books': delete_books, 'libraries': delete_libraries}
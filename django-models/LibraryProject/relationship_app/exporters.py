@@ -0,0 +1,337 @@
+"""
+Streaming export of the catalogue tables.
+
+Rows are read with ``values_list().iterator()``, so the database hands them
+over in chunks and no model instances are built, and each row is encoded
+as soon as it arrives. Memory use is bounded by the chunk size (or the
+row group size of the columnar format), whatever the table size.
+
+Formats:
+
+* ``csv`` and ``jsonl``: gzip-compressed text, one record per row.
+* ``columnar``: a compact binary format for analytics. Rows are cut into
+  row groups; in each group every column is stored contiguously, as
+  little-endian int64s (timestamps as microseconds since the epoch, UTC)
+  or as int32 lengths followed by UTF-8 bytes, and zlib-compressed.
+  ``read_columnar`` reads it back. Layout::
+
+      b'LBCOL1\\n'
+      uint32 header length, JSON header {"columns": [{"name", "type", "nullable"}]}
+      per row group: uint32 row count, then per column:
+          uint32 compressed length, compressed column data
+      uint32 0
+
+  The data of a nullable column starts with a validity bitmap, one bit
+  per row (least significant bit first, set when the value is not null);
+  null slots hold 0 or an empty string.
+"""
+import csv
+import io
+import json
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Author, Book, Library
+
+CHUNK_SIZE = 2000
+ROW_GROUP_SIZE = 65536
+FORMATS = ('csv', 'jsonl', 'columnar')
+EXTENSIONS = {'csv': '.csv.gz', 'jsonl': '.jsonl.gz', 'columnar': '.lbc'}
+CONTENT_TYPES = {'csv': 'application/gzip', 'jsonl': 'application/gzip', 'columnar': 'application/octet-stream'}
+
+COLUMNAR_MAGIC = b'LBCOL1\n'
+INT64, UTF8, TIMESTAMP = 'int64', 'utf8', 'timestamp_us'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class Table:
+    """
+    A table to export: a model and the columns written for it.
+    """
+
+    def __init__(self, name, model, columns):
+        self.name = name
+        self.model = model
+        self.columns = columns
+
+    def nullable_columns(self):
+        return [self.model._meta.get_field(column).null for column in self.columns]
+
+    def column_types(self):
+        types = []
+        for column in self.columns:
+            internal_type = self.model._meta.get_field(column).get_internal_type()
+            if internal_type in ('CharField', 'TextField'):
+                types.append(UTF8)
+            elif internal_type == 'DateTimeField':
+                types.append(TIMESTAMP)
+            else:
+                types.append(INT64)
+        return types
+
+    def rows(self, queryset=None, using=None, chunk_size=CHUNK_SIZE):
+        """
+        Returns an iterator of row tuples, in primary key order.
+        """
+        if queryset is None:
+            queryset = self.model._default_manager.using(using)
+        return queryset.values_list(*self.columns).order_by('pk').iterator(chunk_size=chunk_size)
+
+
+TABLES = {
+    'authors': Table('authors', Author, ('id', 'name', 'book_count', 'updated_at')),
+    'books': Table('books', Book, ('id', 'title', 'author_id', 'publication_year', 'updated_at')),
+    'libraries': Table('libraries', Library, ('id', 'name', 'book_count', 'updated_at')),
+    'library_books': Table('library_books', Library.books.through, ('library_id', 'book_id')),
+}
+
+
+class ExportStats:
+    """
+    Rows written so far, and how fast.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed else 0.0
+
+    def count(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def __str__(self):
+        return (
+            f'{self.rows} rows, {self.bytes / 1_000_000:.1f} MB in {self.elapsed:.1f}s '
+            f'({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+# ----------------------------
+# Text formats
+# ----------------------------
+def _csv_text(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for number, row in enumerate(rows, 1):
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+        if number % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_text(rows, columns):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder))
+        if len(lines) == CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(text_chunks, level=6):
+    """
+    Compresses a stream of text chunks into a gzip stream, chunk by chunk.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for text in text_chunks:
+        data = compressor.compress(text.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ----------------------------
+# Columnar format
+# ----------------------------
+def _int64_block(values):
+    block = array('q', values)
+    if _BIG_ENDIAN:
+        block.byteswap()
+    return block.tobytes()
+
+
+def _encode_column(values, column_type):
+    if column_type == INT64:
+        return _int64_block(values)
+    if column_type == TIMESTAMP:
+        return _int64_block((value - _EPOCH) // _MICROSECOND for value in values)
+    encoded = [value.encode('utf-8') for value in values]
+    lengths = array('i', map(len, encoded))
+    if _BIG_ENDIAN:
+        lengths.byteswap()
+    return lengths.tobytes() + b''.join(encoded)
+
+
+_NULL_PLACEHOLDERS = {INT64: 0, TIMESTAMP: _EPOCH, UTF8: ''}
+
+
+def _validity(values):
+    bits = bytearray((len(values) + 7) // 8)
+    for position, value in enumerate(values):
+        if value is not None:
+            bits[position >> 3] |= 1 << (position & 7)
+    return bytes(bits)
+
+
+def _encode_nullable_column(values, column_type):
+    placeholder = _NULL_PLACEHOLDERS[column_type]
+    filled = [placeholder if value is None else value for value in values]
+    return _validity(values) + _encode_column(filled, column_type)
+
+
+def _row_group(group, types, nullable):
+    parts = [struct.pack('<I', len(group))]
+    for values, column_type, column_nullable in zip(zip(*group), types, nullable):
+        encoder = _encode_nullable_column if column_nullable else _encode_column
+        data = zlib.compress(encoder(values, column_type))
+        parts.append(struct.pack('<I', len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def columnar_chunks(rows, columns, types, nullable=None, row_group_size=ROW_GROUP_SIZE):
+    """
+    Encodes rows in the columnar format, one row group per chunk.
+    ``nullable`` flags the columns that may hold None.
+    """
+    nullable = nullable or [False] * len(columns)
+    header = json.dumps({'columns': [
+        {'name': name, 'type': kind, 'nullable': column_nullable}
+        for name, kind, column_nullable in zip(columns, types, nullable)
+    ]})
+    header = header.encode('utf-8')
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) == row_group_size:
+            yield _row_group(group, types, nullable)
+            group = []
+    if group:
+        yield _row_group(group, types, nullable)
+    yield struct.pack('<I', 0)
+
+
+def _read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated columnar file.')
+    return data
+
+
+def _decode_column(data, column_type, count):
+    if column_type in (INT64, TIMESTAMP):
+        values = array('q')
+        values.frombytes(data)
+        if _BIG_ENDIAN:
+            values.byteswap()
+        if column_type == TIMESTAMP:
+            return [_EPOCH + value * _MICROSECOND for value in values]
+        return values.tolist()
+    lengths = array('i')
+    lengths.frombytes(data[:4 * count])
+    if _BIG_ENDIAN:
+        lengths.byteswap()
+    values, offset = [], 4 * count
+    for length in lengths:
+        values.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return values
+
+
+def _decode_nullable_column(data, column_type, count):
+    size = (count + 7) // 8
+    bits = data[:size]
+    values = _decode_column(data[size:], column_type, count)
+    return [value if bits[position >> 3] >> (position & 7) & 1 else None for position, value in enumerate(values)]
+
+
+def read_columnar(file):
+    """
+    Reads a columnar export from a binary file object. Returns the column
+    names and an iterator of row tuples, decoded one row group at a time.
+    """
+    if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not a columnar export.')
+    (length,) = struct.unpack('<I', _read_exactly(file, 4))
+    columns = json.loads(_read_exactly(file, length))['columns']
+
+    def rows():
+        while True:
+            (count,) = struct.unpack('<I', _read_exactly(file, 4))
+            if not count:
+                return
+            decoded = []
+            for column in columns:
+                (size,) = struct.unpack('<I', _read_exactly(file, 4))
+                data = zlib.decompress(_read_exactly(file, size))
+                decoder = _decode_nullable_column if column.get('nullable') else _decode_column
+                decoded.append(decoder(data, column['type'], count))
+            yield from zip(*decoded)
+
+    return [column['name'] for column in columns], rows()
+
+
+# ----------------------------
+# Exports
+# ----------------------------
+def encode(table, rows, export_format):
+    """
+    Returns the export of ``rows`` as a stream of byte chunks.
+    """
+    if export_format == 'csv':
+        return gzip_chunks(_csv_text(rows, table.columns))
+    if export_format == 'jsonl':
+        return gzip_chunks(_jsonl_text(rows, table.columns))
+    if export_format == 'columnar':
+        return columnar_chunks(rows, table.columns, table.column_types(), table.nullable_columns())
+    raise ValueError(f'Unknown format "{export_format}". Use one of: {", ".join(FORMATS)}.')
+
+
+def export_table(table, file, export_format, queryset=None, using=None, chunk_size=CHUNK_SIZE, stats=None):
+    """
+    Writes a table (or ``queryset`` of its model) to a binary file object.
+    Returns the ``ExportStats``.
+    """
+    stats = stats or ExportStats()
+    rows = stats.count(table.rows(queryset, using=using, chunk_size=chunk_size))
+    for chunk in encode(table, rows, export_format):
+        file.write(chunk)
+        stats.bytes += len(chunk)
+    return stats
+
+
+def export_response(table, queryset, export_format, filename=None):
+    """
+    Streams an export of ``queryset`` as a file download.
+    """
+    content = encode(table, table.rows(queryset), export_format)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename or table.name}{EXTENSIONS[export_format]}"'
+    return response
@@ -0,0 +1,57 @@
+from django import forms
+from django.contrib.admin.widgets import ManyToManyRawIdWidget
+
+from .importers import DEFAULT_BATCH_SIZE, FORMATS
+from .membership import parse_ids
+from .models import Library
+
+
+class BookImportForm(forms.Form):
+    """
+    Upload form for the admin book import tool.
+    """
+    file = forms.FileField(help_text='CSV or JSONL with title, author and optional libraries columns; may be gzipped.')
+    format = forms.ChoiceField(
+        choices=[('', 'Detect from file name')] + [(f, f.upper()) for f in FORMATS],
+        required=False,
+    )
+    batch_size = forms.IntegerField(min_value=1, initial=DEFAULT_BATCH_SIZE)
+    create_libraries = forms.BooleanField(required=False, help_text='Create libraries that do not exist yet.')
+
+
+class LibraryMembershipForm(forms.Form):
+    """
+    Admin form for adding, removing or replacing a library's books in bulk.
+    """
+    action = forms.ChoiceField(choices=[
+        ('add', 'Add these books'),
+        ('remove', 'Remove these books'),
+        ('replace', 'Make these the only books'),
+    ])
+    # A raw-id input (a list of ids) when built with admin_site.
+    book_ids = forms.Field(required=False, help_text='Book ids separated by commas.')
+    file = forms.FileField(required=False, help_text='A text file of book ids, one per line or comma-separated.')
+
+    def __init__(self, *args, admin_site=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if admin_site is not None:
+            # With the book lookup popup, instead of a <select> of every book.
+            self.fields['book_ids'].widget = ManyToManyRawIdWidget(
+                Library._meta.get_field('books').remote_field, admin_site
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        book_ids = cleaned_data.get('book_ids') or []
+        if isinstance(book_ids, str):
+            book_ids = [book_ids]
+        try:
+            ids = parse_ids(' '.join(book_ids))
+            if cleaned_data.get('file'):
+                ids += parse_ids(cleaned_data['file'].read().decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise forms.ValidationError(str(exc))
+        if not ids and cleaned_data.get('action') != 'replace':
+            raise forms.ValidationError('Give at least one book id.')
+        cleaned_data['ids'] = ids
+        return cleaned_data
@@ -0,0 +1,237 @@
+"""
+Streaming bulk import of books.
+
+Rows are read lazily from CSV or JSONL and written in fixed-size chunks, so
+memory use is bounded by the chunk size rather than the file size. Each row
+has a ``title``, an ``author`` name and optionally ``libraries``: a list of
+library names (a ``;``-separated string in CSV). A malformed file raises
+``ValueError`` naming the line, once the chunks before it are imported.
+"""
+import csv
+import gzip
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from . import caching, catalogue, counters, search
+from .models import Author, Book, Library
+
+DEFAULT_BATCH_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+
+# ----------------------------
+# Readers
+# ----------------------------
+def iter_csv_rows(stream):
+    """
+    Yields one dict per CSV record. The first line must be a header.
+    """
+    reader = csv.DictReader(stream)
+    try:
+        yield from reader
+    except csv.Error as exc:
+        raise ValueError(f'Line {reader.line_num}: {exc}')
+    except UnicodeDecodeError:
+        raise ValueError(f'Line {reader.line_num + 1}: not UTF-8 text.')
+
+
+def iter_jsonl_rows(stream):
+    """
+    Yields one dict per non-blank JSON line.
+    """
+    number = 0
+    try:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError('not a JSON object.')
+            yield row
+    except UnicodeDecodeError:
+        raise ValueError(f'Line {number + 1}: not UTF-8 text.')
+    except ValueError as exc:
+        raise ValueError(f'Line {number}: {exc}')
+
+
+def detect_format(filename):
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def iter_rows(stream, format):
+    """
+    Yields rows from a text stream in the given format.
+    """
+    if format == 'jsonl':
+        return iter_jsonl_rows(stream)
+    return iter_csv_rows(stream)
+
+
+def open_text(path_or_file, filename=None):
+    """
+    Opens a path or binary file object as UTF-8 text, decompressing ``.gz``.
+    """
+    if isinstance(path_or_file, str):
+        opener = gzip.open if path_or_file.lower().endswith('.gz') else open
+        binary = opener(path_or_file, 'rb')
+    elif filename and filename.lower().endswith('.gz'):
+        binary = gzip.GzipFile(fileobj=path_or_file)
+    else:
+        binary = path_or_file
+    return io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+
+# ----------------------------
+# Importer
+# ----------------------------
+class ImportStats:
+    """
+    Running totals for an import.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.books = 0
+        self.authors = 0
+        self.library_links = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.rows} rows, {self.books} books, {self.authors} new authors, '
+            f'{self.library_links} library links, {self.skipped} skipped rows and library names '
+            f'in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def _split_libraries(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    elif not isinstance(value, (list, tuple)):
+        return []
+    return [name.strip() for name in value if isinstance(name, str) and name.strip()]
+
+
+class BookImporter:
+    """
+    Inserts books chunk by chunk with ``bulk_create``.
+
+    Author and library names are resolved through in-memory name -> id maps
+    that only ask the database about names not seen before. Unknown authors
+    are created; unknown libraries are created only if ``create_libraries``,
+    and otherwise each mention of one is counted in ``skipped``.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, create_libraries=False):
+        self.batch_size = batch_size
+        self.create_libraries = create_libraries
+        self.author_ids = {}
+        self.library_ids = {}
+
+    def run(self, rows, progress=None, stats=None):
+        """
+        Imports an iterable of row dicts and returns an ``ImportStats``.
+        ``progress`` is called with the stats after every chunk.
+        """
+        stats = stats or ImportStats()
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                self._import_chunk(chunk, stats)
+            if progress is not None:
+                progress(stats)
+        return stats
+
+    def _import_chunk(self, chunk, stats):
+        stats.rows += len(chunk)
+        records = []
+        for row in chunk:
+            title, author = row.get('title'), row.get('author')
+            if not isinstance(title, str) or not isinstance(author, str):
+                stats.skipped += 1
+                continue
+            title, author = title.strip(), author.strip()
+            if not title or not author:
+                stats.skipped += 1
+                continue
+            records.append((title, author, _split_libraries(row.get('libraries'))))
+        if not records:
+            return
+
+        stats.authors += self._resolve(
+            Author, self.author_ids, {author for _, author, _ in records}, create=True
+        )
+        books = Book.objects.bulk_create(
+            [Book(title=title, author_id=self.author_ids[author]) for title, author, _ in records],
+            batch_size=self.batch_size,
+        )
+        stats.books += len(books)
+
+        library_names = {name for _, _, names in records for name in names}
+        if library_names:
+            self._resolve(Library, self.library_ids, library_names, create=self.create_libraries)
+            Through = Library.books.through
+            links = [
+                Through(library_id=self.library_ids[name], book_id=book.pk)
+                for book, (_, _, names) in zip(books, records)
+                for name in names
+                if name in self.library_ids
+            ]
+            stats.skipped += sum(len(names) for _, _, names in records) - len(links)
+            Through.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+            stats.library_links += len(links)
+
+        # bulk_create sends no signals, so index the new books, write their
+        # catalogue entries and invalidate the affected pages here.
+        search.reindex_books([book.pk for book in books])
+        catalogue.refresh_books([book.pk for book in books])
+        library_ids = {self.library_ids[name] for name in library_names if name in self.library_ids}
+        counters.rebuild_book_counts(
+            author_ids={book.author_id for book in books}, library_ids=library_ids
+        )
+        caching.mark_changed(library_ids)
+
+    def _resolve(self, model, cache, names, create):
+        """
+        Adds the ids of ``names`` to ``cache``, creating missing rows if asked.
+        Returns the number of rows created.
+        """
+        missing = names - cache.keys()
+        if not missing:
+            return 0
+        for name, pk in model.objects.filter(name__in=missing).values_list('name', 'pk'):
+            cache.setdefault(name, pk)
+        missing -= cache.keys()
+        if not missing or not create:
+            return 0
+        created = model.objects.bulk_create([model(name=name) for name in missing], batch_size=self.batch_size)
+        if all(obj.pk is not None for obj in created):
+            cache.update((obj.name, obj.pk) for obj in created)
+        else:
+            # Backends that cannot return ids from a bulk insert.
+            for name, pk in model.objects.filter(name__in=missing).values_list('name', 'pk'):
+                cache.setdefault(name, pk)
+        return len(created)
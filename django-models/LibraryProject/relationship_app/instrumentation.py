@@ -0,0 +1,154 @@
+"""
+Per-request performance metrics and per-view query budgets.
+
+``PerformanceMiddleware`` (in ``middleware.py``) opens a ``RequestMetrics``
+for each request. Database time is collected through connection execute
+wrappers. Template time comes from ``InstrumentedDjangoTemplates``, a
+drop-in for the ``DjangoTemplates`` backend. Views declare how many
+queries they may run with ``@query_budget(n)``.
+"""
+import contextvars
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+_current = contextvars.ContextVar('relationship_app_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a view runs more queries than its budget and budgets are strict.
+    """
+
+
+class RequestMetrics:
+    """
+    Counters for one request. Times are in milliseconds.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.peak_memory = None
+        self.view_queries_start = None
+        self.query_budget = None
+        self.view_name = None
+
+    @property
+    def view_queries(self):
+        """
+        Queries run from the start of the view, excluding session and
+        authentication lookups made by middleware before it.
+        """
+        if self.view_queries_start is None:
+            return self.queries
+        return self.queries - self.view_queries_start
+
+    @property
+    def over_budget(self):
+        return self.query_budget is not None and self.view_queries > self.query_budget
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Connection execute wrapper that counts and times each query.
+        Queries made on behalf of another request sharing the connection
+        (concurrent async requests on one thread) are passed through.
+        """
+        if _current.get() is not self:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += (time.perf_counter() - start) * 1000
+            self.queries += 1
+
+    def as_dict(self):
+        return {
+            'view': self.view_name,
+            'queries': self.queries,
+            'view_queries': self.view_queries,
+            'query_budget': self.query_budget,
+            'db_ms': round(self.db_time, 3),
+            'template_ms': round(self.template_time, 3),
+            'total_ms': round(self.total_time, 3),
+            'peak_memory_bytes': self.peak_memory,
+        }
+
+    def server_timing(self):
+        """
+        Formats the metrics as a ``Server-Timing`` header value.
+        """
+        metrics = [
+            f'db;dur={self.db_time:.2f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time:.2f}',
+            f'total;dur={self.total_time:.2f}',
+        ]
+        if self.peak_memory is not None:
+            metrics.append(f'mem;desc="peak {self.peak_memory / 1024:.0f} KiB"')
+        return ', '.join(metrics)
+
+
+def current_metrics():
+    """
+    Returns the metrics of the request being handled, or None.
+    """
+    return _current.get()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def query_budget(max_queries):
+    """
+    Declares the most queries a view may run. Works on function views and
+    on class-based views (decorate the class).
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view_func):
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view_func, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+# ----------------------------
+# Template timing
+# ----------------------------
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += (time.perf_counter() - start) * 1000
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render into the
+    current request's metrics.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
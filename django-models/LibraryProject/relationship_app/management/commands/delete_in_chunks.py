@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.deletion import CHUNK_SIZE, DELETERS
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes authors (with their books), books or libraries in chunks of short transactions. '
+        'If interrupted, run it again with the same ids to finish.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(DELETERS))
+        parser.add_argument('ids', nargs='+', type=int)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows deleted per transaction.')
+        parser.add_argument('--database', help='Database alias to write. Defaults to the routed write database.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        stats = DELETERS[options['kind']](
+            options['ids'],
+            using=options['database'],
+            chunk_size=options['chunk_size'],
+            progress=lambda s: self.stdout.write(str(s)),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {stats}'))
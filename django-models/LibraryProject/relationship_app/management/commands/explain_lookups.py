@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+
+from relationship_app.models import Author, Book, BookCatalogueEntry, Library
+
+# Indexes added for the hot lookups, as (table, columns or index name).
+LOOKUP_INDEXES = [
+    ('relationship_app_author', ['name']),
+    ('relationship_app_author', 'author_name_lower_idx'),
+    ('relationship_app_author', 'author_name_trgm_idx'),
+    ('relationship_app_library', ['name']),
+    ('relationship_app_library', 'library_name_trgm_idx'),
+    ('relationship_app_book', 'book_title_id_idx'),
+    ('relationship_app_book', 'book_author_title_idx'),
+    ('relationship_app_book', 'book_title_lower_idx'),
+    ('relationship_app_book', 'book_title_trgm_idx'),
+    ('relationship_app_bookcatalogueentry', 'catalogue_title_book_idx'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints query plans and timings for the catalogue lookups. With --compare, '
+        'also runs them with the lookup indexes dropped inside a rolled-back '
+        'transaction. That holds exclusive locks, so never run it against production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compare', action='store_true', help='Show plans without the indexes as well.')
+        parser.add_argument('--repeat', type=int, default=20, help='Executions per query for timing.')
+
+    def handle(self, *args, **options):
+        author = Author.objects.values_list('pk', 'name').first()
+        library_name = Library.objects.values_list('name', flat=True).first()
+        title = Book.objects.values_list('title', flat=True).first()
+        if author is None or library_name is None or title is None:
+            raise CommandError('Needs at least one author, book and library; import some data first.')
+        author_id, author_name = author
+        queries = [
+            ('author by name', Author.objects.filter(name=author_name)),
+            (
+                'author by name, case-insensitive',
+                Author.objects.alias(name_lower=Lower('name')).filter(name_lower=author_name.lower()),
+            ),
+            ('library by name', Library.objects.filter(name=library_name)),
+            ('books by author, by title', Book.objects.filter(author_id=author_id).order_by('title')),
+            ('book list page', BookCatalogueEntry.objects.order_by('title', 'book_id')[:50]),
+            ('books ordered case-insensitively', Book.objects.order_by(Lower('title'))[:50]),
+            ('title search', Book.objects.filter(title__icontains=title[:4])[:50]),
+        ]
+
+        self.report('with indexes', queries, options['repeat'])
+        if not options['compare']:
+            return
+        if not connection.features.can_rollback_ddl:
+            raise CommandError(f'--compare needs transactional DDL, which {connection.vendor} lacks.')
+        try:
+            with transaction.atomic():
+                self.drop_lookup_indexes()
+                self.report('without indexes', queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, heading, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {heading} =='))
+        for label, queryset in queries:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            self.stdout.write(self.style.SUCCESS(f'{label}: {elapsed:.3f} ms'))
+            self.stdout.write(self.explain(queryset, heading))
+
+    def explain(self, queryset, tag):
+        # SQLite's driver reuses prepared EXPLAIN statements even after the
+        # schema changes, so the SQL is tagged to keep each plan fresh.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} /* {tag} */', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def drop_lookup_indexes(self):
+        with connection.cursor() as cursor:
+            for table, target in LOOKUP_INDEXES:
+                constraints = connection.introspection.get_constraints(cursor, table)
+                for name, info in constraints.items():
+                    if not info['index'] or info['unique'] or info['primary_key']:
+                        continue
+                    if name == target or info['columns'] == target:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
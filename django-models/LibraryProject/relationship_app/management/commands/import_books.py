@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.importers import (
+    DEFAULT_BATCH_SIZE, FORMATS, BookImporter, ImportStats, detect_format, iter_rows, open_text,
+)
+
+
+class Command(BaseCommand):
+    help = 'Streams books from a CSV or JSONL file (optionally gzipped) into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import; "-" reads standard input.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, else csv.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--create-libraries', action='store_true',
+            help='Create libraries named in the file that do not exist yet.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        path = options['path']
+        try:
+            if path == '-':
+                stream = open_text(sys.stdin.buffer)
+            else:
+                stream = open_text(path)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        importer = BookImporter(
+            batch_size=options['batch_size'],
+            create_libraries=options['create_libraries'],
+        )
+        stats = ImportStats()
+        rows = iter_rows(stream, options['format'] or detect_format(path))
+        with stream:
+            try:
+                importer.run(rows, progress=lambda s: self.stdout.write(str(s)), stats=stats)
+            except (ValueError, OSError, EOFError) as exc:
+                raise CommandError(f'{exc} Imported before the error: {stats}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {stats}'))
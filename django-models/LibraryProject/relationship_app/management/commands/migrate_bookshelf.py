@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from relationship_app.bookshelf_migration import DEFAULT_CHUNK_SIZE, BookshelfMigration
+from relationship_app.routers import BOOKSHELF
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies bookshelf.Book rows from the Introduction_to_Django database into relationship_app, '
+        'in checkpointed chunks. Run it again to resume after an interruption or copy newer rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows copied per transaction.')
+        parser.add_argument('--source', default=BOOKSHELF, help='Database alias of the bookshelf database.')
+        parser.add_argument('--reset', action='store_true', help='Start again from the first row.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        if options['source'] not in connections:
+            raise CommandError(f'No "{options["source"]}" database. Set BOOKSHELF_DATABASE to its SQLite file.')
+        migration = BookshelfMigration(chunk_size=options['chunk_size'], source=options['source'])
+        if options['reset']:
+            migration.reset()
+        last_id = migration.checkpoint().last_id
+        if last_id:
+            self.stdout.write(f'Resuming after id {last_id}.')
+        try:
+            stats = migration.run(progress=lambda s: self.stdout.write(str(s)))
+        except RuntimeError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(f'Copied {stats}'))
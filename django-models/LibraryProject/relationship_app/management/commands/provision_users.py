@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.importers import FORMATS, detect_format, iter_rows, open_text
+from relationship_app.provisioning import DEFAULT_BATCH_SIZE, ROLES, UserProvisioner
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates users with their profiles, roles and groups from a CSV or JSONL file '
+        '(optionally gzipped), in batches, hashing passwords across a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read; "-" reads standard input.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, else csv.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--default-role', choices=sorted(ROLES), default='Member')
+        parser.add_argument('--create-groups', action='store_true', help='Create groups that do not exist yet.')
+        parser.add_argument('--workers', type=int, help='Password hashing processes. Defaults to one per CPU.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be positive.')
+        path = options['path']
+        try:
+            if path == '-':
+                stream = open_text(sys.stdin.buffer)
+            else:
+                stream = open_text(path)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        provisioner = UserProvisioner(
+            batch_size=options['batch_size'],
+            default_role=options['default_role'],
+            create_groups=options['create_groups'],
+            workers=options['workers'],
+        )
+        rows = iter_rows(stream, options['format'] or detect_format(path))
+        with stream:
+            try:
+                stats = provisioner.run(rows, progress=lambda s: self.stdout.write(str(s)))
+            except (ValueError, OSError, EOFError) as exc:
+                raise CommandError(exc)
+        for error in stats.errors[:20]:
+            self.stderr.write(error)
+        if len(stats.errors) > 20:
+            self.stderr.write(f'... and {len(stats.errors) - 20} more.')
+        self.stdout.write(self.style.SUCCESS(f'Provisioned {stats}'))
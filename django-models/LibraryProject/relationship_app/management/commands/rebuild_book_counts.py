@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from relationship_app.counters import rebuild_book_counts
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Author.book_count and Library.book_count from the book and library tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        with transaction.atomic(using=options['database']):
+            updated = rebuild_book_counts(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counts for {updated["author"]} authors and {updated["library"]} libraries '
+            f'in {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from relationship_app import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over books, authors and libraries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if search.backend(connections[using]) is None:
+            raise CommandError('Full-text search needs SQLite (FTS5) or PostgreSQL.')
+        start = time.monotonic()
+        with transaction.atomic(using=using):
+            search.rebuild_index(using=using)
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt in {time.monotonic() - start:.1f}s'))
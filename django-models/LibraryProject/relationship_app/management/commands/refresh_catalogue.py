@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from relationship_app import caching, catalogue
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the catalogue read model (BookCatalogueEntry) from books, authors and libraries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        start = time.monotonic()
+        with transaction.atomic(using=using):
+            total = catalogue.rebuild(using=using)
+        caching.bump_versions([caching.CATALOGUE])
+        self.stdout.write(self.style.SUCCESS(
+            f'Catalogue rebuilt: {total} entries in {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app import replication
+from relationship_app.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Touches the replication heartbeat on the primary every few seconds. '
+        'Replicas whose copy of it is older than REPLICA_MAX_LAG get no reads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Seconds between heartbeats. Defaults to a third of REPLICA_MAX_LAG.',
+        )
+        parser.add_argument('--once', action='store_true', help='Touch the heartbeat once and exit.')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.REPLICA_MAX_LAG / 3
+        if interval <= 0:
+            raise CommandError('--interval must be positive.')
+        while True:
+            replication.touch_heartbeat()
+            if options['once']:
+                break
+            if options['verbosity'] > 1:
+                lags = {alias: replication.replica_lag(alias) for alias in get_replicas()}
+                self.stdout.write(f'Heartbeat; replica lag: {lags}')
+            time.sleep(interval)
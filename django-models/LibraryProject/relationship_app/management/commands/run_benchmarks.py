@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from relationship_app.benchmarks import datagen, runner
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic catalogue in a throwaway test database and measures '
+        'p50/p99 latency and throughput of the relationship_app endpoints.'
+    )
+
+    def add_arguments(self, parser):
+        datagen.DatasetSpec.add_arguments(parser)
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--transport', action='append', choices=sorted(runner.TRANSPORTS),
+            help='client (Django test client) and/or wsgi (local HTTP server). Defaults to both.',
+        )
+        parser.add_argument('--scenario', action='append', help='Run only these scenarios.')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--output', help='JSON results file. Defaults to benchmark-<revision>.json.')
+        parser.add_argument('--compare', help='Earlier results file to compare p50 latency against.')
+
+    def handle(self, *args, **options):
+        spec = datagen.DatasetSpec.from_options(options)
+        transports = options['transport'] or ['client', 'wsgi']
+
+        with datagen.benchmark_database():
+            start = time.monotonic()
+            datagen.generate(spec)
+            self.stdout.write(f'Generated {spec.as_dict()} in {time.monotonic() - start:.1f}s')
+            results = runner.run(
+                transports, options['iterations'], warmup=options['warmup'], cold=options['cold'],
+                only=options['scenario'], progress=self.report,
+            )
+            meta = runner.metadata(spec, {
+                key: options[key] for key in ('iterations', 'warmup', 'cold', 'scenario')
+            })
+
+        output = options['output'] or f'benchmark-{meta["revision"] or "unknown"}.json'
+        runner.save(output, meta, results)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+        if options['compare']:
+            for scenario, transport, before, after, change in runner.compare(options['compare'], results):
+                style = self.style.ERROR if change > 0.1 else self.style.SUCCESS
+                self.stdout.write(style(
+                    f'{scenario:<22} {transport:<6} p50 {before:>9.3f} -> {after:>9.3f} ms ({change:+.0%})'
+                ))
+
+    def report(self, result):
+        self.stdout.write(
+            f'{result["scenario"]:<22} {result["transport"]:<6} '
+            f'p50 {result["p50_ms"]:>9.3f} ms  p99 {result["p99_ms"]:>9.3f} ms  '
+            f'{result["throughput_rps"]:>8} req/s  errors {result["errors"]}'
+        )
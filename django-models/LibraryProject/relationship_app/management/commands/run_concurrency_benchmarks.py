@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.benchmarks import concurrency, datagen, runner
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares how many concurrent requests the sync views sustain on a '
+        'thread-pooled WSGI worker against the async views on one event loop.'
+    )
+
+    def add_arguments(self, parser):
+        datagen.DatasetSpec.add_arguments(parser)
+        parser.add_argument(
+            '--levels', default='1,8,32,128',
+            help='Comma-separated numbers of concurrent clients.',
+        )
+        parser.add_argument('--requests', type=int, default=256, help='Requests per scenario, mode and level.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads of the WSGI worker.')
+        parser.add_argument(
+            '--delay', type=float, default=20,
+            help='Milliseconds each response spends being written to the client.',
+        )
+        parser.add_argument('--scenario', action='append', help='Run only these scenarios.')
+        parser.add_argument('--output', help='JSON results file. Defaults to concurrency-<revision>.json.')
+
+    def handle(self, *args, **options):
+        spec = datagen.DatasetSpec.from_options(options)
+        try:
+            levels = [int(level) for level in options['levels'].split(',')]
+        except ValueError:
+            raise CommandError('--levels must be comma-separated integers.')
+        if min(levels) < 1 or options['threads'] < 1 or options['requests'] < 1:
+            raise CommandError('--levels, --threads and --requests must be positive.')
+
+        with datagen.benchmark_database():
+            start = time.monotonic()
+            datagen.generate(spec)
+            self.stdout.write(f'Generated {spec.as_dict()} in {time.monotonic() - start:.1f}s')
+            results = concurrency.run(
+                levels, options['requests'], threads=options['threads'], delay=options['delay'] / 1000,
+                only=options['scenario'], progress=self.report,
+            )
+            meta = runner.metadata(spec, {
+                key: options[key] for key in ('levels', 'requests', 'threads', 'delay', 'scenario')
+            })
+
+        output = options['output'] or f'concurrency-{meta["revision"] or "unknown"}.json'
+        runner.save(output, meta, results)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def report(self, result):
+        self.stdout.write(
+            f'{result["scenario"]:<16} {result["mode"]:<5} c={result["concurrency"]:<4} '
+            f'in flight {result["peak_in_flight"]:>4}  p50 {result["p50_ms"]:>9.3f} ms  '
+            f'p99 {result["p99_ms"]:>9.3f} ms  {result["throughput_rps"]:>8} req/s  errors {result["errors"]}'
+        )
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app.benchmarks import database, datagen, runner
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures read and write throughput with several worker processes '
+        'under each settings profile (by default the stock settings and '
+        'the SQLite tuning profile).'
+    )
+
+    def add_arguments(self, parser):
+        datagen.DatasetSpec.add_arguments(parser)
+        parser.add_argument(
+            '--profile', action='append',
+            help=f'Settings module to measure. Defaults to {", ".join(database.DEFAULT_PROFILES)}.',
+        )
+        parser.add_argument('--workers', default='1,4,8', help='Comma-separated numbers of worker processes.')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds each run lasts.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of requests that add a book.')
+        parser.add_argument('--output', help='JSON results file. Defaults to database-<revision>.json.')
+
+    def handle(self, *args, **options):
+        spec = datagen.DatasetSpec.from_options(options)
+        try:
+            worker_counts = [int(count) for count in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be comma-separated integers.')
+        if min(worker_counts) < 1 or options['duration'] <= 0:
+            raise CommandError('--workers and --duration must be positive.')
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1.')
+
+        results = database.run(
+            options['profile'] or database.DEFAULT_PROFILES, worker_counts, spec,
+            duration=options['duration'], write_ratio=options['write_ratio'], progress=self.report,
+        )
+        meta = runner.metadata(spec, {
+            key: options[key] for key in ('profile', 'workers', 'duration', 'write_ratio')
+        })
+        output = options['output'] or f'database-{meta["revision"] or "unknown"}.json'
+        runner.save(output, meta, results)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def report(self, result):
+        def p99(summary):
+            return f'{summary["p99_ms"]:>9.3f} ms' if summary else '        -   '
+
+        self.stdout.write(
+            f'{result["profile"]:<38} workers {result["workers"]:<3} '
+            f'reads {result["reads_per_second"]:>8}/s (p99 {p99(result["read"])})  '
+            f'writes {result["writes_per_second"]:>7}/s (p99 {p99(result["write"])})  '
+            f'errors {result["errors"]}'
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from relationship_app import replication
+from relationship_app.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the primary database into the SQLite files standing in for '
+        'read replicas (LIBRARY_REPLICAS), once or every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Replica alias to sync. Defaults to every configured replica.',
+        )
+        parser.add_argument('--interval', type=float, help='Keep syncing every this many seconds.')
+
+    def handle(self, *args, **options):
+        replicas = options['databases'] or get_replicas()
+        unknown = set(replicas) - set(get_replicas())
+        if unknown:
+            raise CommandError(f'Not a configured replica: {", ".join(sorted(unknown))}.')
+        if not replicas:
+            raise CommandError('No replicas configured; set LIBRARY_REPLICAS.')
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('--interval must be positive.')
+        while True:
+            # The copy carries a fresh heartbeat, so its lag starts near zero.
+            replication.touch_heartbeat()
+            for alias in replicas:
+                start = time.monotonic()
+                try:
+                    replication.sync_sqlite_replica(alias)
+                except ValueError as exc:
+                    raise CommandError(str(exc))
+                self.stdout.write(f'Synced {alias} in {time.monotonic() - start:.2f}s')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
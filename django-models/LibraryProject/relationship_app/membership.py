@@ -0,0 +1,174 @@
+"""
+Bulk changes to a library's books.
+
+``Library.books.add()``/``remove()``/``set()`` take the whole id list in
+one statement and ``set()`` loads every current book first. Here the ids
+are processed in batches: each batch is diffed against the through table
+in SQL (ids that are already linked, not linked, or not books at all), and
+only the difference is written. The receivers in ``signals.py`` then get
+one ``m2m_changed`` per action with every changed id, so the counters,
+catalogue entries, search index and page caches are updated once, in bulk.
+
+Each operation runs in one transaction holding the library's row lock, so
+concurrent changes to the same library are applied one after the other.
+"""
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import m2m_changed
+
+from .models import Book, Library
+
+BATCH_SIZE = 1000
+ACTIONS = ('add', 'remove', 'replace')
+# Unknown ids reported back, at most.
+UNKNOWN_REPORT_LIMIT = 100
+
+LibraryBooks = Library.books.through
+
+
+class MembershipChange:
+    """
+    Outcome of a bulk operation: the book ids added and removed, and the
+    requested ids that are not books.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.unknown = []
+
+    def as_dict(self):
+        return {
+            'added': len(self.added),
+            'removed': len(self.removed),
+            'unknown': len(self.unknown),
+            'unknown_ids': sorted(self.unknown)[:UNKNOWN_REPORT_LIMIT],
+        }
+
+    def __str__(self):
+        return f'{len(self.added)} added, {len(self.removed)} removed, {len(self.unknown)} unknown ids'
+
+
+def _batches(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _send(library, action, pk_set, using):
+    m2m_changed.send(
+        sender=LibraryBooks, instance=library, action=action, reverse=False, model=Book, pk_set=pk_set, using=using,
+    )
+
+
+def _links(library, using):
+    return LibraryBooks.objects.using(using).filter(library_id=library.pk)
+
+
+def _add(library, book_ids, change, using, batch_size):
+    linked = _links(library, using).filter(book_id=OuterRef('pk'))
+    for batch in _batches(book_ids, batch_size):
+        missing = set(
+            Book.objects.using(using).filter(pk__in=batch)
+            .filter(~Exists(linked)).values_list('pk', flat=True)
+        )
+        if len(missing) < len(batch):
+            # Either linked already or not a book.
+            known = set(Book.objects.using(using).filter(pk__in=set(batch) - missing).values_list('pk', flat=True))
+            change.unknown.extend(set(batch) - missing - known)
+        change.added.extend(missing)
+    if not change.added:
+        return
+    pk_set = set(change.added)
+    _send(library, 'pre_add', pk_set, using)
+    LibraryBooks.objects.using(using).bulk_create(
+        [LibraryBooks(library_id=library.pk, book_id=pk) for pk in pk_set], batch_size=batch_size
+    )
+    _send(library, 'post_add', pk_set, using)
+
+
+def _remove(library, book_ids, change, using, batch_size):
+    for batch in _batches(book_ids, batch_size):
+        change.removed.extend(_links(library, using).filter(book_id__in=batch).values_list('book_id', flat=True))
+    _unlink(library, change, using, batch_size)
+
+
+def _unlink(library, change, using, batch_size):
+    if not change.removed:
+        return
+    pk_set = set(change.removed)
+    _send(library, 'pre_remove', pk_set, using)
+    for batch in _batches(pk_set, batch_size):
+        _links(library, using).filter(book_id__in=batch).delete()
+    _send(library, 'post_remove', pk_set, using)
+
+
+def _lock(library, using):
+    Library.objects.using(using).select_for_update().filter(pk=library.pk).values_list('pk').first()
+
+
+def add_books(library, book_ids, using=None, batch_size=BATCH_SIZE):
+    """
+    Links the given books to the library. Ids already linked are skipped.
+    """
+    using = using or router.db_for_write(Library, instance=library)
+    change = MembershipChange()
+    with transaction.atomic(using=using):
+        _lock(library, using)
+        _add(library, sorted(set(book_ids)), change, using, batch_size)
+    return change
+
+
+def remove_books(library, book_ids, using=None, batch_size=BATCH_SIZE):
+    """
+    Unlinks the given books from the library. Ids not linked are skipped.
+    """
+    using = using or router.db_for_write(Library, instance=library)
+    change = MembershipChange()
+    with transaction.atomic(using=using):
+        _lock(library, using)
+        _remove(library, sorted(set(book_ids)), change, using, batch_size)
+    return change
+
+
+def replace_books(library, book_ids, using=None, batch_size=BATCH_SIZE):
+    """
+    Makes the given books the library's only books: unlinks the others,
+    then links the missing ones.
+    """
+    using = using or router.db_for_write(Library, instance=library)
+    wanted = set(book_ids)
+    change = MembershipChange()
+    with transaction.atomic(using=using):
+        _lock(library, using)
+        current = _links(library, using).values_list('book_id', flat=True).iterator(chunk_size=batch_size)
+        change.removed = [pk for pk in current if pk not in wanted]
+        _unlink(library, change, using, batch_size)
+        _add(library, sorted(wanted), change, using, batch_size)
+    return change
+
+
+def apply(library, action, book_ids, using=None, batch_size=BATCH_SIZE):
+    """
+    Runs ``action`` (one of ACTIONS) with the given ids.
+    """
+    operations = {'add': add_books, 'remove': remove_books, 'replace': replace_books}
+    try:
+        operation = operations[action]
+    except KeyError:
+        raise ValueError(f'Unknown action "{action}". Use one of: {", ".join(ACTIONS)}.')
+    return operation(library, book_ids, using=using, batch_size=batch_size)
+
+
+def parse_ids(text):
+    """
+    Returns the ids in a comma-, space- or newline-separated string, or
+    raises ValueError.
+    """
+    ids = []
+    for token in text.replace(',', ' ').split():
+        try:
+            ids.append(int(token))
+        except ValueError:
+            raise ValueError(f'Not a book id: "{token[:20]}".')
+    return ids
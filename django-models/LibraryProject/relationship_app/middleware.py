@@ -0,0 +1,177 @@
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation, routers
+
+logger = logging.getLogger('relationship_app.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Records query count, database time, template time, total time and
+    (optionally) peak memory for every request.
+
+    The metrics go to the ``relationship_app.performance`` logger as JSON,
+    into a ``Server-Timing`` header when PERFORMANCE_SERVER_TIMING is on,
+    and onto ``response.performance`` for tests. A view that exceeds its
+    ``@query_budget`` logs a warning, or raises QueryBudgetExceeded when
+    PERFORMANCE_BUDGETS_STRICT is on.
+
+    Put it first in MIDDLEWARE so the session and authentication queries
+    are counted too. Queries run while a streaming response is being
+    consumed happen after it returns and are not counted.
+
+    It runs natively under ASGI, so async views are not pushed onto a
+    thread by it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.trace_memory = getattr(settings, 'PERFORMANCE_TRACE_MEMORY', False)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics, token, start = self.start()
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            instrumentation.deactivate(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            # Connections belong to the thread the async ORM runs queries
+            # on, so the wrappers are installed and removed from there.
+            stack = await sync_to_async(self.wrap_connections)(metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            instrumentation.deactivate(token)
+        return self.finish(request, response, metrics, start)
+
+    def start(self):
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation.activate(metrics)
+        if self.trace_memory:
+            # The peak is process-wide, so concurrent requests share it.
+            tracemalloc.reset_peak()
+        return metrics, token, time.perf_counter()
+
+    def wrap_connections(self, metrics):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics.record_query))
+        return stack
+
+    def finish(self, request, response, metrics, start):
+        metrics.total_time = (time.perf_counter() - start) * 1000
+        if self.trace_memory:
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+
+        response.performance = metrics
+        if getattr(settings, 'PERFORMANCE_SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.server_timing()
+        self.report(request, response, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = instrumentation.current_metrics()
+        if metrics is not None:
+            metrics.view_queries_start = metrics.queries
+            metrics.query_budget = instrumentation.get_query_budget(view_func)
+            metrics.view_name = getattr(request.resolver_match, 'view_name', None)
+
+    def report(self, request, response, metrics):
+        record = {'method': request.method, 'path': request.path, 'status': response.status_code}
+        record.update(metrics.as_dict())
+        logger.info(json.dumps(record), extra={'performance': record})
+        if metrics.over_budget:
+            message = (
+                f'{metrics.view_name or request.path} ran {metrics.view_queries} queries, '
+                f'over its budget of {metrics.query_budget}'
+            )
+            if getattr(settings, 'PERFORMANCE_BUDGETS_STRICT', False):
+                raise instrumentation.QueryBudgetExceeded(message)
+            logger.warning(message, extra={'performance': record})
+
+
+class ReplicaPinMiddleware:
+    """
+    Keeps a user's catalogue reads on the primary for REPLICA_PIN_SECONDS
+    after they write, across requests, with a cookie holding the time the
+    pin expires. Also refreshes replica health before the view runs, so
+    those checks stay out of the view's query budget.
+    """
+    cookie_name = 'primary_until'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        until, token = self.start(request)
+        try:
+            self.refresh_health()
+            response = self.get_response(request)
+            pinned_until = routers.pinned_until()
+        finally:
+            routers.deactivate_pin(token)
+        return self.finish(response, until, pinned_until)
+
+    async def __acall__(self, request):
+        until, token = self.start(request)
+        try:
+            await sync_to_async(self.refresh_health)()
+            response = await self.get_response(request)
+            pinned_until = routers.pinned_until()
+        finally:
+            routers.deactivate_pin(token)
+        return self.finish(response, until, pinned_until)
+
+    def start(self, request):
+        try:
+            until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            until = 0.0
+        # The cookie can shorten a pin but never extend it.
+        until = min(until, time.time() + settings.REPLICA_PIN_SECONDS)
+        return until, routers.activate_pin(until)
+
+    def refresh_health(self):
+        if routers.get_replicas() and routers.pinned_until() <= time.time():
+            from .replication import healthy_replicas
+            healthy_replicas()
+
+    def finish(self, response, until, pinned_until):
+        if pinned_until > until:
+            response.set_cookie(
+                self.cookie_name, f'{pinned_until:.3f}',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_book_counts(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Author = apps.get_model('relationship_app', 'Author')
+    Book = apps.get_model('relationship_app', 'Book')
+    Library = apps.get_model('relationship_app', 'Library')
+    Through = Library.books.through
+    author_books = (
+        Book.objects.filter(author_id=OuterRef('pk')).order_by()
+        .values('author_id').annotate(total=Count('pk')).values('total')
+    )
+    library_books = (
+        Through.objects.filter(library_id=OuterRef('pk')).order_by()
+        .values('library_id').annotate(total=Count('pk')).values('total')
+    )
+    Author.objects.using(using).update(book_count=Coalesce(Subquery(author_books), Value(0)))
+    Library.objects.using(using).update(book_count=Coalesce(Subquery(library_books), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='library',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_book_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0006_book_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationMarker',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
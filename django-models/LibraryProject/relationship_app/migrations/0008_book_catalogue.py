@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:03
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 500
+
+
+def _entries(Book, BookCatalogueEntry, Through, book_ids, using):
+    libraries = defaultdict(list)
+    links = Through.objects.using(using).filter(book_id__in=book_ids).order_by('library_id')
+    for book_id, library_id in links.values_list('book_id', 'library_id'):
+        libraries[book_id].append(library_id)
+    books = Book.objects.using(using).filter(pk__in=book_ids).values_list('pk', 'title', 'author_id', 'author__name')
+    return [
+        BookCatalogueEntry(
+            book_id=pk, title=title, author_id=author_id, author_name=author_name, library_ids=libraries[pk],
+        )
+        for pk, title, author_id, author_name in books
+    ]
+
+
+def populate_catalogue(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Book = apps.get_model('relationship_app', 'Book')
+    Library = apps.get_model('relationship_app', 'Library')
+    BookCatalogueEntry = apps.get_model('relationship_app', 'BookCatalogueEntry')
+    Through = Library.books.through
+    # A chunk of books at a time, with only their library links in memory.
+    last_pk = 0
+    while True:
+        book_ids = list(
+            Book.objects.using(using).filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:CHUNK_SIZE]
+        )
+        if not book_ids:
+            break
+        BookCatalogueEntry.objects.using(using).bulk_create(
+            _entries(Book, BookCatalogueEntry, Through, book_ids, using)
+        )
+        last_pk = book_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0007_replication_marker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCatalogueEntry',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalogue_entry', serialize=False, to='relationship_app.book')),
+                ('title', models.CharField(max_length=100)),
+                ('author_id', models.BigIntegerField(db_index=True)),
+                ('author_name', models.CharField(max_length=100)),
+                ('library_ids', models.JSONField(default=list)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['title', 'book'], name='catalogue_title_book_idx')],
+            },
+        ),
+        migrations.RunPython(populate_catalogue, migrations.RunPython.noop),
+    ]
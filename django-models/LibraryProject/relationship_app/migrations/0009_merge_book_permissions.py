@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:20
+
+from django.conf import settings
+from django.db import migrations
+
+# The custom book permissions and the default ones they duplicated.
+BOOK_PERMISSIONS = {
+    'can_add_book': ('add_book', 'Can add book'),
+    'can_change_book': ('change_book', 'Can change book'),
+    'can_delete_book': ('delete_book', 'Can delete book'),
+}
+LEGACY_NAMES = {
+    'can_add_book': 'Can add a new book',
+    'can_change_book': 'Can edit an existing book',
+    'can_delete_book': 'Can delete a book',
+}
+
+
+def _copy_grants(source, target):
+    target.user_set.add(*source.user_set.all())
+    target.group_set.add(*source.group_set.all())
+
+
+def merge_into_defaults(apps, schema_editor):
+    using = schema_editor.connection.alias
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Permission = apps.get_model('auth', 'Permission')
+    content_type = ContentType.objects.using(using).filter(app_label='relationship_app', model='book').first()
+    if content_type is None:
+        # Fresh database: the permissions are created after migrating.
+        return
+    for legacy_codename, (codename, name) in BOOK_PERMISSIONS.items():
+        legacy = Permission.objects.using(using).filter(content_type=content_type, codename=legacy_codename).first()
+        if legacy is None:
+            continue
+        default, _ = Permission.objects.using(using).get_or_create(
+            content_type=content_type, codename=codename, defaults={'name': name}
+        )
+        _copy_grants(legacy, default)
+        legacy.delete()
+
+
+def split_from_defaults(apps, schema_editor):
+    using = schema_editor.connection.alias
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Permission = apps.get_model('auth', 'Permission')
+    content_type = ContentType.objects.using(using).filter(app_label='relationship_app', model='book').first()
+    if content_type is None:
+        return
+    for legacy_codename, (codename, _) in BOOK_PERMISSIONS.items():
+        default = Permission.objects.using(using).filter(content_type=content_type, codename=codename).first()
+        if default is None:
+            continue
+        legacy, _ = Permission.objects.using(using).get_or_create(
+            content_type=content_type, codename=legacy_codename, defaults={'name': LEGACY_NAMES[legacy_codename]}
+        )
+        _copy_grants(default, legacy)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('relationship_app', '0008_book_catalogue'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_into_defaults, split_from_defaults),
+        migrations.AlterModelOptions(
+            name='book',
+            options={},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0009_merge_book_permissions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['updated_at'], name='author_updated_at_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -43,37 +44,64 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+def _save_without_book_count(instance, kwargs):
+    # book_count is maintained with F() updates, so a full-row save of an
+    # instance loaded earlier must not write its stale copy back.
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name != 'book_count'
+        ]
+    return kwargs
 
 
 # ----------------------------
 # Author Model
 # ----------------------------
 class Author(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
+    # Maintained by the receivers in signals.py; rebuild with rebuild_book_counts.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, **kwargs):
+        super().save(**_save_without_book_count(self, kwargs))
+
+    class Meta:
+        indexes = [
+            # Case-insensitive lookups written as alias(name_lower=Lower('name'))
+            # .filter(name_lower=...), and ordering by Lower('name'). name__iexact
+            # compiles to UPPER() or LIKE and cannot use it.
+            models.Index(Lower('name'), name='author_name_lower_idx'),
+            # Authors changed since a given time; see autocomplete.py.
+            models.Index(fields=['updated_at'], name='author_updated_at_idx'),
+        ]
+
 
 # ----------------------------
 # Book Model
 # ----------------------------
 class Book(models.Model):
-    title = models.CharField(max_length=100)
-    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+    # As long as bookshelf.Book.title, which migrate_bookshelf copies from.
+    title = models.CharField(max_length=200)
+    # Indexed through book_author_title_idx, whose leading column is author_id.
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, db_index=False)
+    publication_year = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
     class Meta:
-        permissions = [
-            ("can_add_book", "Can add a new book"),
-            ("can_change_book", "Can edit an existing book"),
-            ("can_delete_book", "Can delete a book"),
+        indexes = [
+            # Backs the keyset pagination of the book list.
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # "Books by author", ordered by title.
+            models.Index(fields=['author', 'title'], name='book_author_title_idx'),
+            models.Index(Lower('title'), name='book_title_lower_idx'),
         ]
 
 
@@ -81,12 +109,19 @@ class Book(models.Model):
 # Library Model
 # ----------------------------
 class Library(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     books = models.ManyToManyField(Book)
+    # Maintained by the receivers in signals.py; rebuild with rebuild_book_counts.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    # Also touched when the library's books change; see caching.mark_changed().
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, **kwargs):
+        super().save(**_save_without_book_count(self, kwargs))
+
 
 # ----------------------------
 # Librarian Model
@@ -97,3 +132,61 @@ class Librarian(models.Model):
 
     def __str__(self):
         return self.name
+
+
+# ----------------------------
+# Book Catalogue Entry Model
+# ----------------------------
+class BookCatalogueEntry(models.Model):
+    """
+    Read model for the catalogue: one narrow row per book with its author's
+    name and its library ids copied in, so listings need no joins. Kept
+    current by the receivers in signals.py; rebuild with refresh_catalogue.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='catalogue_entry')
+    title = models.CharField(max_length=200)
+    author_id = models.BigIntegerField(db_index=True)
+    author_name = models.CharField(max_length=100)
+    library_ids = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.title} by {self.author_name}"
+
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of the book list.
+            models.Index(fields=['title', 'book'], name='catalogue_title_book_idx'),
+        ]
+
+
+# ----------------------------
+# Replication Marker Model
+# ----------------------------
+class ReplicationMarker(models.Model):
+    """
+    A row touched on the primary at a fixed interval. Its age on a replica
+    is how far that replica lags behind; see replication.py.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.updated_at}"
+
+
+# ----------------------------
+# Import Checkpoint Model
+# ----------------------------
+class ImportCheckpoint(models.Model):
+    """
+    How far a resumable import has got: the last source id it committed,
+    written in the same transaction as the rows. See bookshelf_migration.py.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at id {self.last_id}"
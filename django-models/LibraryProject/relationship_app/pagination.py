@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination for catalogue listings.
+
+Offset pagination (``LIMIT n OFFSET m``) makes the database walk and throw
+away ``m`` rows for every page, so deep pages get slower as the catalogue
+grows. Keyset pagination instead remembers the sort key of the last row on
+the page and asks for the rows that sort after it, which an index on the
+ordering columns answers directly no matter how deep the page is.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of a row as an opaque, URL-safe token.
+    """
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """
+    Decodes a token produced by ``encode_cursor``.
+    Returns None for a missing or malformed token, which means "first page".
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Reads ``?page_size=`` from the request, clamped to ``1..maximum``.
+    """
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _key_value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+    for part in field.split('__'):
+        item = getattr(item, part)
+    return item
+
+
+class KeysetPage:
+    """
+    One page of results plus the cursor needed to fetch the next one.
+    """
+
+    def __init__(self, object_list, has_next, next_cursor, cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_previous(self):
+        return self.cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pages a queryset by a unique, ascending sort key such as ``('title', 'id')``.
+    The last field must be unique so that ties on the earlier ones are stable.
+    """
+
+    def __init__(self, queryset, ordering, page_size=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+
+    def _after(self, values):
+        # (a, b, c) > (x, y, z)  <=>  a > x OR (a = x AND b > y) OR ...
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            clause = Q(**{f'{field}__gt': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                clause &= Q(**{prev_field: prev_value})
+            condition |= clause
+        return condition
+
+    def get_queryset(self, token=None):
+        """
+        Returns the unevaluated queryset for the page after ``token``.
+        One extra row is fetched to find out whether a next page exists.
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        values = decode_cursor(token, len(self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+        return queryset[:self.page_size + 1]
+
+    def build_page(self, rows, token=None):
+        """
+        Builds a page from rows already fetched with ``get_queryset``.
+        """
+        rows = list(rows)
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            next_cursor = encode_cursor(_key_value(last, field) for field in self.ordering)
+        cursor = token if decode_cursor(token, len(self.ordering)) is not None else None
+        return KeysetPage(rows, has_next, next_cursor, cursor)
+
+    def page(self, token=None):
+        return self.build_page(self.get_queryset(token), token)
+
+    async def apage(self, token=None):
+        """
+        ``page`` for async views, fetching through the async ORM.
+        """
+        return self.build_page([row async for row in self.get_queryset(token).aiterator()], token)
@@ -0,0 +1,76 @@
+"""
+Password hashing across a process pool, for provisioning many users.
+
+A password hash is deliberately slow (PBKDF2 runs a million iterations)
+and holds the GIL, so threads do not help. The hasher is picked in the
+calling process and handed to each worker once; workers only run its
+``encode``, so they need no Django setup. This module imports no models,
+which lets the spawned workers import it.
+"""
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_hasher = None
+_pool = None
+_pool_size = None
+
+
+def _init_worker(hasher):
+    global _hasher
+    _hasher = hasher
+
+
+def _encode(password):
+    return _hasher.encode(password, _hasher.salt())
+
+
+def _shutdown():
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+
+
+def get_pool(workers=None):
+    """
+    Returns the process pool, started on first use with ``workers``
+    processes (default: one per CPU) and kept for later calls.
+    """
+    global _pool, _pool_size
+    from django.contrib.auth.hashers import get_hasher
+
+    workers = workers or os.cpu_count() or 1
+    if _pool is not None and _pool_size != workers:
+        _pool.shutdown()
+        _pool = None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # Not fork: the parent holds database connections and threads.
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(get_hasher('default'),),
+        )
+        _pool_size = workers
+    return _pool
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Returns the hashes of ``passwords``, in order. None gets an unusable
+    password. With ``workers=1`` everything is hashed in this process.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    passwords = list(passwords)
+    usable = [password for password in passwords if password is not None]
+    if workers == 1 or len(usable) < 2:
+        hashes = iter([make_password(password) for password in usable])
+    else:
+        pool = get_pool(workers)
+        chunksize = max(1, len(usable) // (4 * _pool_size))
+        hashes = pool.map(_encode, usable, chunksize=chunksize)
+    return [make_password(None) if password is None else next(hashes) for password in passwords]
+
+
+atexit.register(_shutdown)
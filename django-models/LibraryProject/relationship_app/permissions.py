@@ -0,0 +1,174 @@
+"""
+Compiled permissions.
+
+``ModelBackend`` reads a user's permissions with two joined queries (direct
+grants, and grants through groups) the first time a user object is asked,
+and that cache dies with the object at the end of the request. Here they
+are compiled once per user into a bitset, one bit per ``Permission`` id,
+and kept in the shared cache together with the user's role from
+``UserProfile``. After that a permission or role check is one cache read
+per request and a bit test, with no database access.
+
+A user's record is dropped when their grants, groups or profile change
+(see ``signals.py``). Changes that can affect many users at once, to a
+group's permissions or to the permission table, move a shared version
+instead, which retires every record.
+
+With CACHE_SESSION_USERS on, the backend also serves the user of a
+session, with their profile, from the cache, so an authenticated request
+reaches its view without a query when sessions are cached too
+(SESSION_ENGINE). Both need a cache shared by every worker. The session's auth hash is
+still checked against the cached user by ``django.contrib.auth``. A
+user's entry is dropped when they are saved (a password change, a
+deactivation, a login), deleted or logged out, or their profile changes.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+
+from .models import UserProfile
+
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+# Bounds how long a write that sends no signal (a queryset update()) goes unseen.
+USER_CACHE_TIMEOUT = 15 * 60
+NO_ROLE = ''
+
+_VERSION_KEY = 'relationship_app:permissions:version'
+
+# (version, {'app_label.codename': bit}, {app_label: mask}), per process.
+_index = None
+
+
+def _user_key(user_id):
+    return f'relationship_app:permissions:user:{user_id}'
+
+
+def _session_user_key(user_id):
+    return f'relationship_app:permissions:session_user:{user_id}'
+
+
+def _seed_version():
+    version = time.time_ns()
+    if not cache.add(_VERSION_KEY, version, None):
+        version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    """
+    Retires every compiled record.
+    """
+    cache.set(_VERSION_KEY, time.time_ns(), None)
+
+
+def _get_index(version):
+    global _index
+    if _index is None or _index[0] != version:
+        bits, modules = {}, {}
+        for app_label, codename, pk in Permission.objects.values_list('content_type__app_label', 'codename', 'pk'):
+            bits[f'{app_label}.{codename}'] = pk
+            modules[app_label] = modules.get(app_label, 0) | 1 << pk
+        _index = (version, bits, modules)
+    return _index
+
+
+class CompiledPermissions:
+    """
+    A user's permissions as a bitset over ``Permission`` ids, and their role.
+    """
+    __slots__ = ('version', 'bits', 'role')
+
+    def __init__(self, version, bits, role):
+        self.version = version
+        self.bits = bits
+        self.role = role
+
+    def has_perm(self, perm):
+        bit = _get_index(self.version)[1].get(perm)
+        return bit is not None and bool(self.bits >> bit & 1)
+
+    def has_module_perms(self, app_label):
+        return bool(self.bits & _get_index(self.version)[2].get(app_label, 0))
+
+
+def _compile(user_id):
+    direct = User.user_permissions.through.objects.filter(user_id=user_id).values_list('permission_id', flat=True)
+    grouped = Group.permissions.through.objects.filter(group__user=user_id).values_list('permission_id', flat=True)
+    bits = 0
+    for pk in direct.union(grouped):
+        bits |= 1 << pk
+    role = UserProfile.objects.filter(user_id=user_id).values_list('role', flat=True).first()
+    return bits, role or NO_ROLE
+
+
+def get_compiled(user):
+    """
+    Returns the user's compiled permissions, or None for anonymous users.
+    The record is memoised on the user object for the rest of the request.
+    """
+    if not user.is_authenticated:
+        return None
+    compiled = user.__dict__.get('_compiled_permissions')
+    if compiled is None:
+        key = _user_key(user.pk)
+        # The version and the record in one round trip; a record compiled
+        # under an older version is stale.
+        found = cache.get_many([_VERSION_KEY, key])
+        version = found.get(_VERSION_KEY) or _seed_version()
+        record = found.get(key)
+        if record is None or record[0] != version:
+            record = (version, *_compile(user.pk))
+            cache.set(key, record, PERMISSION_CACHE_TIMEOUT)
+        compiled = user._compiled_permissions = CompiledPermissions(*record)
+    return compiled
+
+
+def invalidate_users(user_ids):
+    """
+    Drops the compiled records of the given users.
+    """
+    cache.delete_many([_user_key(pk) for pk in user_ids])
+
+
+def invalidate_session_users(user_ids):
+    """
+    Drops the cached session users of the given users.
+    """
+    cache.delete_many([_session_user_key(pk) for pk in user_ids])
+
+
+class CompiledPermissionBackend(ModelBackend):
+    """
+    ``ModelBackend`` answering ``has_perm`` and ``has_module_perms`` from
+    compiled permissions, and loading session users from the cache.
+    Authentication and the permission listings used by the admin are
+    unchanged.
+    """
+
+    def get_user(self, user_id):
+        use_cache = getattr(settings, 'CACHE_SESSION_USERS', False)
+        key = _session_user_key(user_id)
+        user = cache.get(key) if use_cache else None
+        if user is None:
+            try:
+                user = User._default_manager.select_related('profile').get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            if not self.user_can_authenticate(user):
+                return None
+            if use_cache:
+                cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return False
+        return user_obj.is_superuser or get_compiled(user_obj).has_perm(perm)
+
+    def has_module_perms(self, user_obj, app_label):
+        if not user_obj.is_active or user_obj.is_anonymous:
+            return False
+        return user_obj.is_superuser or get_compiled(user_obj).has_module_perms(app_label)
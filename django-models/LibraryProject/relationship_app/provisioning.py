@@ -0,0 +1,283 @@
+"""
+Bulk creation of users with their profiles, roles and groups.
+
+Saving users one by one costs a ``post_save`` per user, which creates its
+profile with another INSERT, and a password hash inline. Here each batch
+of rows is validated against the database in one query, its passwords are
+hashed across a process pool (see ``passwords.py``), and users, profiles
+and group memberships are each written with one ``bulk_create``.
+``bulk_create`` sends no signals, so ``create_user_profile`` does not run
+and the profiles are created here instead, with their roles. Nothing else
+needs a signal for a new user: there is no cached role or compiled
+permission record to invalidate yet.
+
+Each row is a dict with ``username`` and optionally ``email``,
+``first_name``, ``last_name``, ``password`` (plain text), ``password_hash``
+(already hashed, e.g. from another Django site), ``role`` and ``groups``
+(a list of group names, ``;``-separated in CSV). Rows without a password
+get an unusable one. Rows with a username that is taken, or repeated in
+the input, are skipped, as are rows whose fields are not strings or fail
+the ``User`` field validators (username characters, lengths, email).
+Passwords are not checked against AUTH_PASSWORD_VALIDATORS.
+
+A chunk that hits an IntegrityError (a username taken by a concurrent
+request since it was checked) is retried once without the usernames taken
+by then; if it fails again its rows are skipped and reported, and the run
+carries on with the next chunk.
+"""
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import UserProfile
+from .passwords import hash_passwords
+
+DEFAULT_BATCH_SIZE = 1000
+ROLES = {role for role, _ in UserProfile.ROLE_CHOICES}
+TEXT_FIELDS = ('username', 'email', 'first_name', 'last_name', 'password', 'password_hash', 'role')
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+UserGroups = User.groups.through
+
+
+class ProvisioningStats:
+    """
+    Running totals for a provisioning run.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.users = 0
+        self.group_links = 0
+        self.skipped = 0
+        self.hashing_seconds = 0.0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def users_per_second(self):
+        elapsed = self.elapsed
+        return self.users / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'users': self.users,
+            'group_links': self.group_links,
+            'skipped': self.skipped,
+            'errors': self.errors[:100],
+            'seconds': round(self.elapsed, 3),
+            'hashing_seconds': round(self.hashing_seconds, 3),
+            'users_per_second': round(self.users_per_second, 1),
+        }
+
+    def __str__(self):
+        return (
+            f'{self.rows} rows, {self.users} users, {self.group_links} group links, '
+            f'{self.skipped} skipped in {self.elapsed:.1f}s ({self.users_per_second:.0f} users/s, '
+            f'{self.hashing_seconds:.1f}s hashing)'
+        )
+
+
+def _split_groups(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [name.strip() for name in value if name and name.strip()]
+
+
+def _invalid_fields(row):
+    """
+    Returns the names of the row's fields that hold neither text nor nothing.
+    """
+    invalid = [name for name in TEXT_FIELDS if row.get(name) is not None and not isinstance(row[name], str)]
+    groups = row.get('groups')
+    if groups is not None and not isinstance(groups, str) and (
+        not isinstance(groups, (list, tuple)) or not all(isinstance(name, str) for name in groups)
+    ):
+        invalid.append('groups')
+    return invalid
+
+
+def _clean_user_fields(row):
+    """
+    Returns the row's stripped ``User`` fields, validated as the model
+    would; raises ``ValidationError`` naming the first invalid one.
+    """
+    values = {}
+    for name in USER_FIELDS:
+        field = User._meta.get_field(name)
+        try:
+            values[name] = field.clean((row.get(name) or '').strip(), None)
+        except ValidationError as exc:
+            raise ValidationError(f'{name}: {" ".join(exc.messages)}')
+    return values
+
+
+class UserProvisioner:
+    """
+    Creates users chunk by chunk. Unknown groups are created only if
+    ``create_groups``; otherwise the row is provisioned without them and
+    the group is reported as an error.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, default_role=UserProfile.ROLE_MEMBER,
+                 create_groups=False, workers=None):
+        if default_role not in ROLES:
+            raise ValueError(f'Unknown role "{default_role}". Use one of: {", ".join(sorted(ROLES))}.')
+        self.batch_size = batch_size
+        self.default_role = default_role
+        self.create_groups = create_groups
+        self.workers = workers
+        self.group_ids = {}
+        self.unknown_groups = set()
+        self.seen = set()
+
+    def run(self, rows, progress=None):
+        """
+        Provisions an iterable of row dicts and returns a ``ProvisioningStats``.
+        ``progress`` is called with the stats after every chunk.
+        """
+        stats = ProvisioningStats()
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self._provision_chunk(chunk, stats)
+            if progress is not None:
+                progress(stats)
+        return stats
+
+    def _skip(self, stats, message):
+        stats.skipped += 1
+        stats.errors.append(message)
+
+    def _clean(self, chunk, stats):
+        records = []
+        for row in chunk:
+            invalid = _invalid_fields(row)
+            if invalid:
+                self._skip(stats, f'{row.get("username")!r}: {", ".join(invalid)} must be text.')
+                continue
+            username = (row.get('username') or '').strip()
+            role = (row.get('role') or '').strip() or self.default_role
+            if not username:
+                self._skip(stats, 'Row without a username.')
+                continue
+            try:
+                fields = _clean_user_fields(row)
+            except ValidationError as exc:
+                self._skip(stats, f'{username}: {exc.messages[0]}')
+                continue
+            if username in self.seen:
+                self._skip(stats, f'{username}: repeated in the input.')
+            elif role not in ROLES:
+                self._skip(stats, f'{username}: unknown role "{role}".')
+            else:
+                self.seen.add(username)
+                records.append((username, role, row, fields))
+        return self._drop_taken(records, stats)
+
+    def _drop_taken(self, records, stats):
+        taken = set(
+            User.objects.filter(username__in=[record[0] for record in records])
+            .values_list('username', flat=True)
+        )
+        for username in sorted(taken):
+            self._skip(stats, f'{username}: already exists.')
+        return [record for record in records if record[0] not in taken]
+
+    def _passwords(self, records, stats):
+        """
+        Returns the password hashes of the records, hashing plain-text
+        passwords in the pool.
+        """
+        hashes = [None] * len(records)
+        to_hash = []
+        for position, (username, _, row, _) in enumerate(records):
+            password_hash = row.get('password_hash')
+            if password_hash:
+                try:
+                    identify_hasher(password_hash)
+                except ValueError:
+                    stats.errors.append(f'{username}: unrecognised password_hash; password made unusable.')
+                    to_hash.append((position, None))
+                else:
+                    hashes[position] = password_hash
+            else:
+                to_hash.append((position, row.get('password') or None))
+        started = time.monotonic()
+        hashed = hash_passwords([password for _, password in to_hash], workers=self.workers)
+        stats.hashing_seconds += time.monotonic() - started
+        for (position, _), password_hash in zip(to_hash, hashed):
+            hashes[position] = password_hash
+        return hashes
+
+    def _resolve_groups(self, names, stats):
+        missing = names - self.group_ids.keys() - self.unknown_groups
+        if not missing:
+            return
+        self.group_ids.update(Group.objects.filter(name__in=missing).values_list('name', 'pk'))
+        missing -= self.group_ids.keys()
+        if missing and self.create_groups:
+            Group.objects.bulk_create([Group(name=name) for name in missing], ignore_conflicts=True)
+            self.group_ids.update(Group.objects.filter(name__in=missing).values_list('name', 'pk'))
+        elif missing:
+            self.unknown_groups |= missing
+            stats.errors.extend(f'Unknown group "{name}".' for name in sorted(missing))
+
+    def _provision_chunk(self, chunk, stats):
+        stats.rows += len(chunk)
+        records = self._clean(chunk, stats)
+        if not records:
+            return
+        password_hashes = dict(zip((record[0] for record in records), self._passwords(records, stats)))
+        group_names = {name for _, _, row, _ in records for name in _split_groups(row.get('groups'))}
+        self._resolve_groups(group_names, stats)
+        try:
+            self._write(records, password_hashes, stats)
+        except IntegrityError:
+            # A concurrent request took some of the usernames meanwhile.
+            records = self._drop_taken(records, stats)
+            try:
+                if records:
+                    self._write(records, password_hashes, stats)
+            except IntegrityError as exc:
+                for record in records:
+                    self._skip(stats, f'{record[0]}: not created ({exc}).')
+
+    def _write(self, records, password_hashes, stats):
+        users = [
+            User(password=password_hashes[username], **fields)
+            for username, _, _, fields in records
+        ]
+        with transaction.atomic():
+            users = User.objects.bulk_create(users, batch_size=self.batch_size)
+            if any(user.pk is None for user in users):
+                # Backends that cannot return ids from a bulk insert.
+                ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user.pk, role=role) for user, (_, role, _, _) in zip(users, records)],
+                batch_size=self.batch_size,
+            )
+            links = [
+                UserGroups(user_id=user.pk, group_id=self.group_ids[name])
+                for user, (_, _, row, _) in zip(users, records)
+                for name in _split_groups(row.get('groups'))
+                if name in self.group_ids
+            ]
+            UserGroups.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+        stats.users += len(users)
+        stats.group_links += len(links)
@@ -0,0 +1,81 @@
+"""
+Replica health for ``ReplicaRouter``.
+
+A heartbeat row on the primary is touched every few seconds by
+``manage.py replication_heartbeat``. A replica's copy of the row says how
+far behind it is. A replica whose heartbeat is older than REPLICA_MAX_LAG
+seconds, or that cannot be queried, gets no reads until it catches up;
+if the heartbeat stops, every read falls back to the primary. Health is
+checked at most every REPLICA_CHECK_INTERVAL seconds per process.
+
+A second SQLite file can stand in for a replica; ``manage.py sync_replica``
+copies the primary into it with SQLite's online backup API. A Postgres
+standby needs no syncing, only the heartbeat.
+"""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .models import ReplicationMarker
+from .routers import PRIMARY, get_replicas
+
+HEARTBEAT = 'heartbeat'
+
+# alias -> (time.monotonic() of the check, healthy)
+_health = {}
+
+
+def touch_heartbeat(using=PRIMARY):
+    ReplicationMarker.objects.using(using).update_or_create(
+        name=HEARTBEAT, defaults={'updated_at': timezone.now()}
+    )
+
+
+def replica_lag(alias):
+    """
+    Returns how many seconds ``alias`` is behind the primary, or None when
+    that is unknown (no heartbeat yet, or the replica is unreachable).
+    """
+    try:
+        updated_at = (
+            ReplicationMarker.objects.using(alias).filter(name=HEARTBEAT)
+            .values_list('updated_at', flat=True).first()
+        )
+    except DatabaseError:
+        return None
+    if updated_at is None:
+        return None
+    return max(0.0, (timezone.now() - updated_at).total_seconds())
+
+
+def is_healthy(alias, refresh=False):
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if refresh or checked is None or now - checked[0] >= settings.REPLICA_CHECK_INTERVAL:
+        lag = replica_lag(alias)
+        checked = _health[alias] = (now, lag is not None and lag <= settings.REPLICA_MAX_LAG)
+    return checked[1]
+
+
+def healthy_replicas():
+    return [alias for alias in get_replicas() if is_healthy(alias)]
+
+
+def sync_sqlite_replica(alias, source=PRIMARY):
+    """
+    Copies the ``source`` database into the SQLite replica ``alias``.
+    Readers of the replica wait on its lock while a page is copied.
+    """
+    source_connection, target = connections[source], connections[alias]
+    if source_connection.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError('Only SQLite replicas can be synced; use database replication for other backends.')
+    source_connection.ensure_connection()
+    destination = sqlite3.connect(target.settings_dict['NAME'])
+    try:
+        source_connection.connection.backup(destination)
+    finally:
+        destination.close()
+    _health.pop(alias, None)
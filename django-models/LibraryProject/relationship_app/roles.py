@@ -0,0 +1,21 @@
+"""
+Role resolution for the role-based dashboards.
+
+A user's role is compiled together with their permissions (see
+``permissions.py``): it is read at most once per request, from the shared
+cache, and from the database only after their profile or grants change.
+"""
+from .permissions import get_compiled
+
+
+def get_role(user):
+    """
+    Returns the user's role, or None for anonymous users and users
+    without a profile.
+    """
+    if not user.is_authenticated:
+        return None
+    profile = user._state.fields_cache.get('profile')
+    if profile is not None:
+        return profile.role or None
+    return get_compiled(user).role or None
@@ -0,0 +1,112 @@
+"""
+Database routing for read replicas.
+
+Reads of the catalogue models (authors, books, libraries, librarians and
+catalogue entries) go to one of the aliases in DATABASE_REPLICAS, chosen
+at random among those that are healthy (see replication.py). Every write goes to the primary,
+``default``. Reads go to the primary instead when:
+
+* no replica is configured, or none is healthy;
+* they run inside a transaction on the primary;
+* the caller wrote recently. A write pins the current context to the
+  primary for REPLICA_PIN_SECONDS, and ``ReplicaPinMiddleware`` carries
+  the pin to the user's next requests in a cookie, so users read their
+  own writes while the replicas catch up;
+* they run inside ``use_primary()``.
+
+Everything else (users, sessions, profiles) always uses the primary.
+Nothing is migrated on replicas or on BOOKSHELF, the source database that
+``migrate_bookshelf`` reads.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+BOOKSHELF = 'bookshelf'
+REPLICATED_MODELS = {'author', 'book', 'library', 'librarian', 'bookcatalogueentry'}
+
+_primary_until = contextvars.ContextVar('relationship_app_primary_until', default=0.0)
+_force_primary = contextvars.ContextVar('relationship_app_force_primary', default=False)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_to_primary(seconds=None):
+    """
+    Sends this context's catalogue reads to the primary for ``seconds``.
+    """
+    if seconds is None:
+        seconds = settings.REPLICA_PIN_SECONDS
+    _primary_until.set(max(_primary_until.get(), time.time() + seconds))
+
+
+def pinned_until():
+    """
+    Returns the time (seconds since the epoch) the current pin lasts until.
+    """
+    return _primary_until.get()
+
+
+def activate_pin(until):
+    return _primary_until.set(until)
+
+
+def deactivate_pin(token):
+    _primary_until.reset(token)
+
+
+@contextmanager
+def use_primary(enabled=True):
+    """
+    Sends the catalogue reads made inside the block to the primary.
+    """
+    token = _force_primary.set(enabled or _force_primary.get())
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def is_replicated(model):
+    return model._meta.app_label == 'relationship_app' and model._meta.model_name in REPLICATED_MODELS
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not is_replicated(model) or not get_replicas():
+            return None
+        if _force_primary.get() or _primary_until.get() > time.time() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        # Imported here: routers may be loaded before the models are.
+        from .replication import healthy_replicas
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if not is_replicated(model):
+            return None
+        if get_replicas():
+            pin_to_primary()
+        # Explicit, so an instance read from a replica is saved to the primary.
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary; the bookshelf
+        # database belongs to the other project.
+        if db in get_replicas() or db == BOOKSHELF:
+            return False
+        return None
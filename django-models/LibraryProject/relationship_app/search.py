@@ -0,0 +1,206 @@
+"""
+Full-text search over books, their authors and the libraries holding them.
+
+Each book has one document in an inverted index with three fields: its
+title, its author's name and the names of its libraries.
+
+* SQLite: an FTS5 virtual table whose rowid is the book id, ranked by bm25.
+* PostgreSQL: a table of weighted ``tsvector`` documents with a GIN index,
+  ranked by ``ts_rank``.
+
+Other backends fall back to ``icontains`` filtering. The index is
+maintained by the receivers in ``signals.py`` and can be rebuilt with
+``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connections, router
+
+from .models import Author, Book, Library
+
+FTS_TABLE = 'relationship_app_book_fts'
+TSVECTOR_TABLE = 'relationship_app_book_search'
+DEFAULT_LIMIT = 20
+MAX_TERMS = 10
+REINDEX_CHUNK_SIZE = 500
+
+BOOK_TABLE = Book._meta.db_table
+AUTHOR_TABLE = Author._meta.db_table
+LIBRARY_TABLE = Library._meta.db_table
+LIBRARY_BOOKS_TABLE = Library.books.through._meta.db_table
+
+
+def _connection(using=None, write=False):
+    if using is None:
+        using = router.db_for_write(Book) if write else router.db_for_read(Book)
+    return connections[using]
+
+
+def backend(connection):
+    """
+    Returns 'sqlite', 'postgresql' or None when full-text search is unavailable.
+    """
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return connection.vendor
+    return None
+
+
+# ----------------------------
+# Index maintenance
+# ----------------------------
+def _document_select(kind, where):
+    if kind == 'postgresql':
+        libraries = 'string_agg(l.name, \' \')'
+        document = (
+            "setweight(to_tsvector('simple', b.title), 'A') || "
+            "setweight(to_tsvector('simple', a.name), 'B') || "
+            "setweight(to_tsvector('simple', COALESCE(({libraries_sql}), '')), 'C')"
+        )
+    else:
+        libraries = 'group_concat(l.name, \' \')'
+        document = "b.title, a.name, COALESCE(({libraries_sql}), '')"
+    libraries_sql = (
+        f'SELECT {libraries} FROM {LIBRARY_BOOKS_TABLE} lb '
+        f'JOIN {LIBRARY_TABLE} l ON l.id = lb.library_id WHERE lb.book_id = b.id'
+    )
+    return (
+        f'SELECT b.id, {document.format(libraries_sql=libraries_sql)} '
+        f'FROM {BOOK_TABLE} b JOIN {AUTHOR_TABLE} a ON a.id = b.author_id WHERE {where}'
+    )
+
+
+def _reindex(where, params, using=None):
+    """
+    Re-indexes the books matching ``where`` (SQL over the alias ``b``).
+    """
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(
+                f'INSERT INTO {TSVECTOR_TABLE} (book_id, document) {_document_select(kind, where)} '
+                f'ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document',
+                params,
+            )
+        else:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT b.id FROM {BOOK_TABLE} b WHERE {where})',
+                params,
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, author, libraries) {_document_select(kind, where)}',
+                params,
+            )
+
+
+def reindex_books(book_ids, using=None):
+    """
+    Re-indexes the given books, in chunks to keep statements small.
+    """
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), REINDEX_CHUNK_SIZE):
+        chunk = book_ids[start:start + REINDEX_CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        _reindex(f'b.id IN ({placeholders})', chunk, using)
+
+
+def reindex_author_books(author_id, using=None):
+    _reindex('b.author_id = %s', [author_id], using)
+
+
+def reindex_library_books(library_id, using=None):
+    _reindex(f'b.id IN (SELECT book_id FROM {LIBRARY_BOOKS_TABLE} WHERE library_id = %s)', [library_id], using)
+
+
+def remove_books(book_ids, using=None):
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    table, column = (TSVECTOR_TABLE, 'book_id') if kind == 'postgresql' else (FTS_TABLE, 'rowid')
+    book_ids = list(book_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), REINDEX_CHUNK_SIZE):
+            chunk = book_ids[start:start + REINDEX_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', chunk)
+
+
+def rebuild_index(using=None):
+    """
+    Empties the index and re-indexes every book.
+    """
+    connection = _connection(using, write=True)
+    kind = backend(connection)
+    if kind is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TSVECTOR_TABLE if kind == "postgresql" else FTS_TABLE}')
+    _reindex('1 = 1', [], connection.alias)
+
+
+# ----------------------------
+# Querying
+# ----------------------------
+def parse_terms(query):
+    """
+    Splits free text into at most MAX_TERMS lower-cased word tokens.
+    Everything else is dropped, so no operator syntax reaches the engine.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def index_can_answer(query):
+    """
+    Whether ``query`` is whole words the index can match as typed: text
+    with punctuation or too many words would lose part of itself to
+    ``parse_terms``.
+    """
+    words = query.split()
+    return 0 < len(words) <= MAX_TERMS and all(re.fullmatch(r'\w+', word) for word in words)
+
+
+def search_book_ids(query, limit=DEFAULT_LIMIT, fallback=True):
+    """
+    Returns the ids of the books matching every term of ``query`` (as a
+    prefix), best match first. Without an index, titles are filtered with
+    ``icontains``, or None is returned unless ``fallback``.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    connection = _connection()
+    kind = backend(connection)
+    if kind is None and not fallback:
+        return None
+    if kind is None:
+        queryset = Book.objects.all()
+        for term in terms:
+            queryset = queryset.filter(title__icontains=term)
+        return list(queryset.order_by('title', 'id').values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        if kind == 'postgresql':
+            cursor.execute(
+                f"SELECT book_id FROM {TSVECTOR_TABLE}, to_tsquery('simple', %s) query "
+                f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, book_id LIMIT %s',
+                [' & '.join(f'{term}:*' for term in terms), limit],
+            )
+        else:
+            # Title matches weigh more than author matches, then library names.
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0), rowid LIMIT %s',
+                [' '.join(f'"{term}"*' for term in terms), limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_books(query, limit=DEFAULT_LIMIT):
+    """
+    Returns the matching books, with their authors, best match first.
+    """
+    ids = search_book_ids(query, limit)
+    books = Book.objects.select_related('author').only('title', 'author__name').in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
@@ -0,0 +1,319 @@
+"""
+Signal receivers that keep the app's caches, search index, catalogue read
+model and denormalised counters in step with the database.
+"""
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import caching, catalogue, counters, membership, permissions, search
+from .autocomplete import author_index
+from .models import Author, Book, Library, UserProfile
+
+LibraryBooks = Library.books.through
+UserPermissions = User.user_permissions.through
+UserGroups = User.groups.through
+GroupPermissions = Group.permissions.through
+
+
+def _library_ids_for_books(book_filter, using):
+    return set(
+        LibraryBooks.objects.using(using)
+        .filter(**book_filter)
+        .values_list('library_id', flat=True)
+        .distinct()
+    )
+
+
+# ----------------------------
+# Shared bookkeeping
+# ----------------------------
+# Rows that a delete, remove or clear is about to take away are noted on the
+# instance beforehand, because the "post" signals fire once they are gone.
+@receiver(pre_delete, sender=Book)
+def remember_book_libraries(sender, instance, using=None, **kwargs):
+    instance._library_ids = _library_ids_for_books({'book_id': instance.pk}, using)
+
+
+@receiver(pre_delete, sender=Library)
+def remember_library_books(sender, instance, using=None, **kwargs):
+    instance._book_ids = list(
+        LibraryBooks.objects.using(using).filter(library_id=instance.pk).values_list('book_id', flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=LibraryBooks)
+def remember_removed_members(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    # Sets instance._removed_pks to the ids on the other side of the relation
+    # that are really linked, since remove() accepts ids that are not.
+    if action not in ('pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        links = sender.objects.using(using).filter(book_id=instance.pk)
+        column = 'library_id'
+    else:
+        links = sender.objects.using(using).filter(library_id=instance.pk)
+        column = 'book_id'
+    if action == 'pre_clear':
+        instance._removed_pks = list(links.values_list(column, flat=True))
+        return
+    # Bulk changes (membership.py) remove many ids at once.
+    other_ids = list(pk_set)
+    instance._removed_pks = []
+    for start in range(0, len(other_ids), membership.BATCH_SIZE):
+        chunk = other_ids[start:start + membership.BATCH_SIZE]
+        instance._removed_pks.extend(links.filter(**{f'{column}__in': chunk}).values_list(column, flat=True))
+
+
+# ----------------------------
+# Cached session users, compiled permissions and roles
+# ----------------------------
+def _now_and_on_commit(func, using):
+    func()
+    # Again once committed: a request that read the old rows in between
+    # would otherwise cache them until they expire.
+    transaction.on_commit(func, using=using)
+
+
+def _forget_compiled(users, using=None):
+    user_ids = [user.pk for user in users]
+    for user in users:
+        user.__dict__.pop('_compiled_permissions', None)
+    _now_and_on_commit(lambda: permissions.invalidate_users(user_ids), using)
+
+
+def _forget_session_user(user_id, using=None):
+    _now_and_on_commit(lambda: permissions.invalidate_session_users([user_id]), using)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_compiled_role(sender, instance, using=None, **kwargs):
+    user = instance._state.fields_cache.get('user')
+    if user is not None:
+        _forget_compiled([user], using)
+    else:
+        user_id = instance.user_id
+        _now_and_on_commit(lambda: permissions.invalidate_users([user_id]), using)
+    _forget_session_user(instance.user_id, using)
+
+
+@receiver(post_save, sender=User)
+def invalidate_session_user(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        _forget_session_user(instance.pk, using)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, using=None, **kwargs):
+    _forget_compiled([instance], using)
+    _forget_session_user(instance.pk, using)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        permissions.invalidate_session_users([user.pk])
+
+
+@receiver(m2m_changed, sender=UserPermissions)
+@receiver(m2m_changed, sender=UserGroups)
+def invalidate_member_permissions(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _forget_compiled([instance], using)
+    elif action == 'post_clear':
+        # permission.user_set.clear() or group.user_set.clear(): the users
+        # affected are no longer known.
+        _now_and_on_commit(permissions.bump_version, using)
+    else:
+        user_ids = list(pk_set)
+        _now_and_on_commit(lambda: permissions.invalidate_users(user_ids), using)
+
+
+@receiver(m2m_changed, sender=GroupPermissions)
+def invalidate_group_permissions(sender, action, using=None, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _now_and_on_commit(permissions.bump_version, using)
+
+
+# Deleting a group or permission drops its grants without m2m_changed, and
+# migrations create permissions in bulk.
+@receiver([post_save, post_delete], sender=Permission)
+@receiver(post_delete, sender=Group)
+@receiver(post_migrate)
+def retire_compiled_permissions(sender, using=None, **kwargs):
+    _now_and_on_commit(permissions.bump_version, using)
+
+
+# ----------------------------
+# Full-text search index
+# ----------------------------
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        search.reindex_books([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using=None, **kwargs):
+    search.remove_books([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Author)
+def reindex_author(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        search.reindex_author_books(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Library)
+def reindex_library(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        search.reindex_library_books(instance.pk, using=using)
+
+
+@receiver(post_delete, sender=Library)
+def reindex_former_library_books(sender, instance, using=None, **kwargs):
+    search.reindex_books(getattr(instance, '_book_ids', ()), using=using)
+
+
+@receiver(m2m_changed, sender=LibraryBooks)
+def reindex_library_membership(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action == 'post_clear':
+        book_ids = [instance.pk] if reverse else getattr(instance, '_removed_pks', ())
+        search.reindex_books(book_ids, using=using)
+    elif action in ('post_add', 'post_remove'):
+        search.reindex_books([instance.pk] if reverse else pk_set, using=using)
+
+
+# ----------------------------
+# Catalogue read model
+# ----------------------------
+@receiver(post_save, sender=Book)
+def write_catalogue_entry(sender, instance, created, raw=False, using=None, **kwargs):
+    if not raw:
+        catalogue.save_book(instance, created, using=using)
+
+
+@receiver(post_save, sender=Author)
+def rename_catalogue_author(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        catalogue.rename_author(instance.pk, instance.name, using=using)
+
+
+@receiver(post_delete, sender=Library)
+def refresh_former_library_entries(sender, instance, using=None, **kwargs):
+    catalogue.refresh_books(getattr(instance, '_book_ids', ()), using=using)
+
+
+@receiver(m2m_changed, sender=LibraryBooks)
+def refresh_membership_entries(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action == 'post_clear':
+        book_ids = [instance.pk] if reverse else getattr(instance, '_removed_pks', ())
+        catalogue.refresh_books(book_ids, using=using)
+    elif action in ('post_add', 'post_remove'):
+        catalogue.refresh_books([instance.pk] if reverse else pk_set, using=using)
+
+
+# ----------------------------
+# Author autocomplete index
+# ----------------------------
+@receiver(post_save, sender=Author)
+def index_author_name(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        pk, name = instance.pk, instance.name
+        transaction.on_commit(lambda: author_index.author_saved(pk, name), using=using)
+
+
+@receiver(post_delete, sender=Author)
+def unindex_author_name(sender, instance, using=None, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: author_index.author_deleted(pk), using=using)
+
+
+# ----------------------------
+# Page and fragment caches
+# ----------------------------
+@receiver(post_save, sender=Book)
+def invalidate_book_pages(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    caching.invalidate_book_fragments([instance.pk], using=using)
+    caching.mark_changed(_library_ids_for_books({'book_id': instance.pk}, using), using=using)
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_deleted_book_pages(sender, instance, using=None, **kwargs):
+    caching.invalidate_book_fragments([instance.pk], using=using)
+    caching.mark_changed(getattr(instance, '_library_ids', ()), using=using)
+
+
+@receiver(post_save, sender=Author)
+def invalidate_author_pages(sender, instance, created, raw=False, using=None, **kwargs):
+    if created or raw:
+        return
+    book_ids = list(Book.objects.using(using).filter(author_id=instance.pk).values_list('pk', flat=True))
+    caching.invalidate_book_fragments(book_ids, using=using)
+    caching.mark_changed(_library_ids_for_books({'book__author_id': instance.pk}, using), using=using)
+
+
+@receiver([post_save, post_delete], sender=Library)
+def invalidate_library_page(sender, instance, using=None, **kwargs):
+    # post_save: updated_at was just set by auto_now, so only bump the scope.
+    caching.bump_versions([caching.library_scope(instance.pk)], using=using)
+
+
+@receiver(m2m_changed, sender=LibraryBooks)
+def invalidate_library_membership(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        caching.mark_changed([instance.pk], catalogue=False, using=using)
+    else:
+        library_ids = pk_set if action != 'post_clear' else getattr(instance, '_removed_pks', ())
+        caching.mark_changed(library_ids, catalogue=False, using=using)
+
+
+# ----------------------------
+# Book counters
+# ----------------------------
+@receiver(pre_save, sender=Book)
+def remember_previous_author(sender, instance, raw=False, using=None, **kwargs):
+    instance._previous_author_id = None
+    if not raw and not instance._state.adding:
+        instance._previous_author_id = (
+            Book.objects.using(using).filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_author_id', None)
+    if created or previous is None:
+        counters.adjust_author_counts({instance.author_id: 1}, using=using)
+    elif previous != instance.author_id:
+        counters.adjust_author_counts({previous: -1, instance.author_id: 1}, using=using)
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, using=None, **kwargs):
+    counters.adjust_author_counts({instance.author_id: -1}, using=using)
+    counters.adjust_library_counts({pk: -1 for pk in getattr(instance, '_library_ids', ())}, using=using)
+
+
+@receiver(m2m_changed, sender=LibraryBooks)
+def count_library_membership(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action == 'post_add':
+        changed, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = getattr(instance, '_removed_pks', ()), -1
+    else:
+        return
+    if reverse:
+        counters.adjust_library_counts({pk: delta for pk in changed}, using=using)
+    else:
+        counters.adjust_library_counts({instance.pk: delta * len(changed)}, using=using)
@@ -0,0 +1,42 @@
+"""
+Test helpers for the per-view query budgets.
+
+    class CatalogueTests(QueryBudgetTestMixin, TestCase):
+        def test_list_books(self):
+            response = self.client.get('/books/')
+            self.assertWithinQueryBudget(response)
+
+Within ``strict_query_budgets()`` (or with PERFORMANCE_BUDGETS_STRICT on)
+any request that goes over budget raises QueryBudgetExceeded.
+"""
+from django.test import override_settings
+
+from .instrumentation import QueryBudgetExceeded  # noqa: F401
+
+
+def strict_query_budgets():
+    return override_settings(PERFORMANCE_BUDGETS_STRICT=True)
+
+
+class QueryBudgetTestMixin:
+    """
+    Assertions over the metrics PerformanceMiddleware attaches to responses.
+    """
+
+    def get_performance(self, response):
+        metrics = getattr(response, 'performance', None)
+        if metrics is None:
+            self.fail('No performance metrics on the response; is PerformanceMiddleware installed?')
+        return metrics
+
+    def assertWithinQueryBudget(self, response, max_queries=None):
+        """
+        Fails if the view ran more queries than ``max_queries`` or, when
+        that is not given, than the budget the view declares.
+        """
+        metrics = self.get_performance(response)
+        budget = max_queries if max_queries is not None else metrics.query_budget
+        if budget is None:
+            self.fail(f'{metrics.view_name} declares no query budget; pass max_queries.')
+        if metrics.view_queries > budget:
+            self.fail(f'{metrics.view_name} ran {metrics.view_queries} queries, over its budget of {budget}.')
@@ -0,0 +1,958 @@
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.utils import ConnectionHandler
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from LibraryProject import settings as project_settings
+
+from . import (
+    admin, autocomplete, catalogue, counters, deletion, exporters, membership, provisioning,
+    replication, routers, search,
+)
+from .autocomplete import PrefixIndex
+from .bookshelf_migration import BookshelfMigration
+from .models import Author, Book, BookCatalogueEntry, ImportCheckpoint, Library, UserProfile
+from .pagination import KeysetPaginator, encode_cursor
+from .permissions import CompiledPermissionBackend
+from .testing import QueryBudgetTestMixin, strict_query_budgets
+
+
+# ----------------------------
+# Query budgets
+# ----------------------------
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = Author.objects.bulk_create([Author(name=f'Author {i}') for i in range(5)])
+        Book.objects.bulk_create([Book(title=f'Book {i:03}', author=authors[i % 5]) for i in range(120)])
+        cls.library = Library.objects.create(name='Main')
+        cls.library.books.add(*Book.objects.values_list('pk', flat=True))
+        catalogue.rebuild()
+
+    def setUp(self):
+        # Rendered pages are cached; every test renders its own.
+        cache.clear()
+
+    def test_list_books(self):
+        with strict_query_budgets():
+            response = self.client.get(reverse('list_books'))
+            self.assertWithinQueryBudget(response)
+            response = self.client.get(reverse('list_books'), {'after': response.context['page'].next_cursor})
+            self.assertWithinQueryBudget(response)
+        self.assertEqual(response.status_code, 200)
+
+    def test_library_detail(self):
+        with strict_query_budgets():
+            response = self.client.get(reverse('library_detail', args=[self.library.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, 'Books in Library (120)')
+
+
+# ----------------------------
+# Keyset pagination
+# ----------------------------
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Ann')
+        # Pairs of equal titles, so page boundaries fall between ties.
+        Book.objects.bulk_create([Book(title=f'Book {i // 2:02}', author=author) for i in range(25)])
+        catalogue.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, page_size):
+        keys, pages, params = [], 0, {'page_size': page_size}
+        while True:
+            response = self.client.get(reverse('list_books'), params)
+            page = response.context['page']
+            keys += [(entry.title, entry.book_id) for entry in page]
+            pages += 1
+            if not page.has_next:
+                self.assertIsNone(page.next_cursor)
+                return keys, pages
+            params['after'] = page.next_cursor
+
+    def test_pages_cover_every_book_once_in_order(self):
+        expected = list(BookCatalogueEntry.objects.order_by('title', 'book_id').values_list('title', 'book_id'))
+        for page_size in (1, 3, 5, 25):
+            with self.subTest(page_size=page_size):
+                keys, pages = self.walk(page_size)
+                self.assertEqual(keys, expected)
+                self.assertEqual(pages, -(-25 // page_size))
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        paginator = KeysetPaginator(BookCatalogueEntry.objects.all(), ordering=('title', 'book_id'), page_size=5)
+        page = paginator.page()
+        for _ in range(4):
+            self.assertTrue(page.has_next)
+            page = paginator.page(page.next_cursor)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next)
+        self.assertTrue(page.has_previous)
+
+    def test_invalid_cursor_means_first_page(self):
+        first = self.client.get(reverse('list_books'), {'page_size': 5}).context['page']
+        for token in ('not-a-cursor', encode_cursor(['Book 01']), 'W10'):
+            with self.subTest(token=token):
+                page = self.client.get(reverse('list_books'), {'page_size': 5, 'after': token}).context['page']
+                self.assertEqual([entry.book_id for entry in page], [entry.book_id for entry in first])
+                self.assertFalse(page.has_previous)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.client.get(reverse('list_books'), {'page_size': 0}).context['page']), 1)
+        self.assertEqual(len(self.client.get(reverse('list_books'), {'page_size': 'x'}).context['page']), 25)
+
+
+# ----------------------------
+# Page and fragment caches
+# ----------------------------
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name='Ann Author')
+        self.book = Book.objects.create(title='Dated', author=self.author, publication_year=1999)
+        self.library = Library.objects.create(name='Main')
+        self.library.books.add(self.book)
+
+    def test_library_rows_are_cached_apart_from_book_list_rows(self):
+        self.assertContains(self.client.get(reverse('library_detail', args=[self.library.pk])), '(Published 1999)')
+        response = self.client.get(reverse('list_books'))
+        self.assertContains(response, 'Dated by Ann Author')
+        self.assertNotContains(response, 'Published')
+
+    def get(self, name, *args):
+        return self.client.get(reverse(name, args=args)).content.decode()
+
+    def test_book_save_invalidates_after_commit(self):
+        self.assertIn('Dated by', self.get('list_books'))
+        self.assertIn('Dated by', self.get('library_detail', self.library.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+            # Until the commit, pages keep their version.
+            self.assertIn('Dated by', self.get('list_books'))
+        self.assertIn('Renamed by', self.get('list_books'))
+        self.assertIn('Renamed by', self.get('library_detail', self.library.pk))
+
+    def test_author_rename_drops_cached_rows(self):
+        self.get('list_books'), self.get('library_detail', self.library.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = 'Ann Other'
+            self.author.save()
+        self.assertIn('Dated by Ann Other', self.get('list_books'))
+        self.assertIn('Dated by Ann Other', self.get('library_detail', self.library.pk))
+
+    def test_library_membership_changes_invalidate_after_commit(self):
+        other = Book.objects.create(title='Second', author=self.author)
+        self.assertNotIn('Second by', self.get('library_detail', self.library.pk))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.library.books.add(other)
+            self.assertNotIn('Second by', self.get('library_detail', self.library.pk))
+        self.assertTrue(callbacks)
+        self.assertIn('Second by', self.get('library_detail', self.library.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.library.books.remove(self.book)
+        self.assertNotIn('Dated by', self.get('library_detail', self.library.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.library.books.clear()
+        self.assertNotIn('Second by', self.get('library_detail', self.library.pk))
+
+
+# ----------------------------
+# Conditional GET
+# ----------------------------
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name='Ann Author')
+        self.book = Book.objects.create(title='Dated', author=self.author)
+        self.other = Book.objects.create(title='Other', author=self.author)
+        self.library = Library.objects.create(name='Main')
+        self.library.books.add(self.book)
+        self.urls = [reverse('list_books'), reverse('library_detail', args=[self.library.pk])]
+
+    def validators(self):
+        return [(response['ETag'], response['Last-Modified']) for response in map(self.client.get, self.urls)]
+
+    def test_revalidation_is_answered_with_304(self):
+        for url, (etag, last_modified) in zip(self.urls, self.validators()):
+            self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+            self.assertEqual(self.client.get(url, headers={'if-modified-since': last_modified}).status_code, 304)
+            self.assertEqual(self.client.get(url, headers={'if-none-match': '"stale"'}).status_code, 200)
+
+    def test_book_save_changes_the_etags(self):
+        before = self.validators()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+        after = self.validators()
+        self.assertNotEqual(before[0][0], after[0][0])
+        self.assertNotEqual(before[1][0], after[1][0])
+        response = self.client.get(self.urls[1], headers={'if-none-match': before[1][0]})
+        self.assertContains(response, 'Renamed')
+
+    def test_membership_change_changes_the_library_etag(self):
+        before = self.validators()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.library.books.add(self.other)
+        after = self.validators()
+        self.assertNotEqual(before[1][0], after[1][0])
+        self.assertContains(self.client.get(self.urls[1]), 'Other by Ann Author')
+
+
+# ----------------------------
+# Read replicas
+# ----------------------------
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A second SQLite file, synced from the test database, as the replica.
+    """
+    replica = 'replica_test'
+    # Evaluated in setUpClass, once the replica is configured.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        handle = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        handle.close()
+        cls.replica_path = handle.name
+        configured = connections.configure_settings({
+            routers.PRIMARY: connections.settings[routers.PRIMARY],
+            cls.replica: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path},
+        })
+        connections.settings[cls.replica] = configured[cls.replica]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        replicas = self.settings(DATABASE_REPLICAS=[self.replica])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        replication._health.clear()
+        self.author = Author.objects.create(name='Ann')
+        Book.objects.create(title='Synced', author=self.author)
+        replication.touch_heartbeat()
+        replication.sync_sqlite_replica(self.replica)
+        # The writes above pinned this context to the primary.
+        token = routers.activate_pin(0.0)
+        self.addCleanup(routers.deactivate_pin, token)
+
+    def titles(self):
+        return set(Book.objects.values_list('title', flat=True))
+
+    def test_reads_go_to_the_replica(self):
+        # Not a routed write (nor an assigned relation), so nothing is pinned.
+        Book.objects.using(routers.PRIMARY).bulk_create([Book(title='Unsynced', author_id=self.author.pk)])
+        self.assertEqual(Book.objects.all().db, self.replica)
+        self.assertEqual(self.titles(), {'Synced'})
+        with routers.use_primary():
+            self.assertEqual(self.titles(), {'Synced', 'Unsynced'})
+        # Models that are not replicated stay on the primary.
+        self.assertEqual(User.objects.all().db, routers.PRIMARY)
+
+    def test_a_write_pins_reads_to_the_primary_for_a_while(self):
+        Book.objects.create(title='Written', author=self.author)
+        self.assertEqual(Book.objects.all().db, routers.PRIMARY)
+        self.assertEqual(self.titles(), {'Synced', 'Written'})
+        later = time.time() + settings.REPLICA_PIN_SECONDS + 1
+        with mock.patch.object(routers.time, 'time', return_value=later):
+            self.assertEqual(Book.objects.all().db, self.replica)
+            self.assertEqual(self.titles(), {'Synced'})
+
+    def test_a_lagging_replica_gets_no_reads(self):
+        with self.settings(REPLICA_MAX_LAG=-1):
+            replication._health.clear()
+            self.assertEqual(Book.objects.all().db, routers.PRIMARY)
+
+
+# ----------------------------
+# Catalogue read model
+# ----------------------------
+class CatalogueTests(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(name='Ann')
+        books = Book.objects.bulk_create([Book(title=f'Book {i}', author=author) for i in range(5)])
+        first, second = Library.objects.create(name='First'), Library.objects.create(name='Second')
+        first.books.add(*books[:3])
+        second.books.add(*books[2:])
+
+    def entries(self):
+        return list(BookCatalogueEntry.objects.order_by('book_id').values_list(
+            'book_id', 'title', 'author_id', 'author_name', 'library_ids',
+        ))
+
+    def test_migration_populates_in_chunks(self):
+        migration = importlib.import_module('relationship_app.migrations.0008_book_catalogue')
+        catalogue.rebuild()
+        expected = self.entries()
+        BookCatalogueEntry.objects.all().delete()
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.populate_catalogue(django_apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.entries(), expected)
+        self.assertEqual(len(expected), 5)
+
+    def test_failed_rebuild_keeps_the_old_entries(self):
+        catalogue.rebuild()
+        expected = self.entries()
+        build_entries = catalogue._build_entries
+        calls = []
+
+        def fail_second_chunk(book_ids, using):
+            calls.append(book_ids)
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return build_entries(book_ids, using)
+
+        with mock.patch.object(catalogue, 'REFRESH_CHUNK_SIZE', 2), \
+                mock.patch.object(catalogue, '_build_entries', fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                catalogue.rebuild()
+        self.assertEqual(self.entries(), expected)
+
+
+# ----------------------------
+# Book counters
+# ----------------------------
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.first = Author.objects.create(name='First')
+        self.second = Author.objects.create(name='Second')
+        self.library = Library.objects.create(name='Main')
+
+    def assertCounts(self, first, second, library):
+        for obj in (self.first, self.second, self.library):
+            obj.refresh_from_db()
+        self.assertEqual((self.first.book_count, self.second.book_count, self.library.book_count), (first, second, library))
+
+    def test_book_saves_and_deletes(self):
+        book = Book.objects.create(title='One', author=self.first)
+        Book.objects.create(title='Two', author=self.first)
+        self.assertCounts(2, 0, 0)
+        book.author = self.second
+        book.save()
+        self.assertCounts(1, 1, 0)
+        book.title = 'Renamed'
+        book.save()
+        self.assertCounts(1, 1, 0)
+        book.delete()
+        self.assertCounts(1, 0, 0)
+
+    def test_library_membership(self):
+        books = [Book.objects.create(title=f'Book {i}', author=self.first) for i in range(3)]
+        self.library.books.add(*books)
+        self.assertCounts(3, 0, 3)
+        self.library.books.remove(books[0], books[0].pk + 1000)
+        self.assertCounts(3, 0, 2)
+        books[1].library_set.clear()
+        self.assertCounts(3, 0, 1)
+        books[2].delete()
+        self.assertCounts(2, 0, 0)
+
+    def test_rebuild_after_bulk_writes(self):
+        Book.objects.bulk_create([Book(title='Bulk', author=self.second)])
+        self.assertCounts(0, 0, 0)
+        counters.rebuild_book_counts()
+        self.assertCounts(0, 1, 0)
+
+
+# ----------------------------
+# Bulk library membership
+# ----------------------------
+class MembershipTests(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(name='Author')
+        Book.objects.bulk_create([Book(title=f'Book {i}', author=author) for i in range(10)])
+        catalogue.rebuild()
+        self.ids = sorted(Book.objects.values_list('pk', flat=True))
+        self.library = Library.objects.create(name='Main')
+
+    def linked(self):
+        return sorted(self.library.books.values_list('pk', flat=True))
+
+    def test_add_remove_replace(self):
+        change = membership.apply(self.library, 'add', self.ids[:6] + [0], batch_size=4)
+        self.assertEqual(sorted(change.added), self.ids[:6])
+        self.assertEqual(change.unknown, [0])
+        self.assertEqual(membership.apply(self.library, 'add', self.ids[:2]).added, [])
+
+        change = membership.apply(self.library, 'remove', self.ids[4:8])
+        self.assertEqual(sorted(change.removed), self.ids[4:6])
+        self.assertEqual(self.linked(), self.ids[:4])
+
+        change = membership.apply(self.library, 'replace', self.ids[2:9], batch_size=3)
+        self.assertEqual(sorted(change.removed), self.ids[:2])
+        self.assertEqual(sorted(change.added), self.ids[4:9])
+        self.assertEqual(self.linked(), self.ids[2:9])
+
+        self.library.refresh_from_db()
+        self.assertEqual(self.library.book_count, 7)
+        entry = BookCatalogueEntry.objects.get(book_id=self.ids[2])
+        self.assertEqual(entry.library_ids, [self.library.pk])
+        self.assertEqual(BookCatalogueEntry.objects.get(book_id=self.ids[0]).library_ids, [])
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            membership.apply(self.library, 'merge', self.ids)
+
+
+# ----------------------------
+# Compiled permissions
+# ----------------------------
+class PermissionInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', password='secret')
+        self.permission = Permission.objects.get(codename='add_book', content_type__app_label='relationship_app')
+
+    def fresh_user(self):
+        # A new object, as in the next request: only the shared cache carries over.
+        return User.objects.get(pk=self.user.pk)
+
+    def test_direct_grants(self):
+        self.assertFalse(self.fresh_user().has_perm('relationship_app.add_book'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm('relationship_app.add_book'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(self.permission)
+        self.assertFalse(self.fresh_user().has_perm('relationship_app.add_book'))
+
+    def test_group_grants(self):
+        group = Group.objects.create(name='Editors')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(group)
+        self.assertFalse(self.fresh_user().has_perm('relationship_app.add_book'))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm('relationship_app.add_book'))
+        self.assertTrue(self.fresh_user().has_module_perms('relationship_app'))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.user_set.clear()
+        self.assertFalse(self.fresh_user().has_perm('relationship_app.add_book'))
+
+    def test_stale_record_cached_before_commit_is_dropped(self):
+        from .permissions import _user_key, get_compiled
+
+        self.user.user_permissions.add(self.permission)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(self.permission)
+            # A request recompiling before the commit saw the old grants.
+            compiled = get_compiled(self.fresh_user())
+            cache.set(_user_key(self.user.pk), (compiled.version, 1 << self.permission.pk, compiled.role))
+        self.assertFalse(self.fresh_user().has_perm('relationship_app.add_book'))
+
+    def test_role_change(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('member_dashboard')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=self.user).update(role=UserProfile.ROLE_LIBRARIAN)
+            profile = UserProfile.objects.get(user=self.user)
+            profile.save()
+        self.assertEqual(self.client.get(reverse('member_dashboard')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('librarian_dashboard')).status_code, 200)
+
+
+# ----------------------------
+# Admin book search
+# ----------------------------
+class AdminBookSearchTests(TestCase):
+
+    def setUp(self):
+        tolkien = Author.objects.create(name='J.R.R. Tolkien')
+        other = Author.objects.create(name='Hobbit Fancier')
+        self.by_title = Book.objects.create(title='The Hobbit', author=tolkien)
+        self.by_author = Book.objects.create(title='Notes', author=other)
+        Book.objects.create(title='Unrelated', author=tolkien)
+        Library.objects.create(name='Hobbiton Lending').books.add(Book.objects.get(title='Unrelated'))
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+
+    def search(self, query):
+        response = self.client.get(reverse('admin:relationship_app_book_changelist'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response, [book.title for book in response.context['cl'].result_list]
+
+    def test_results_keep_the_rank_order(self):
+        _, titles = self.search('hobbit')
+        self.assertEqual(titles, ['The Hobbit', 'Notes', 'Unrelated'])
+
+    def test_capped_results_are_announced(self):
+        with mock.patch.object(admin.BookAdmin, 'search_result_limit', 2):
+            response, titles = self.search('hobbit')
+        self.assertEqual(titles, ['The Hobbit', 'Notes'])
+        self.assertContains(response, 'Only the 2 best matches are listed')
+
+    def test_other_searches_use_the_search_fields(self):
+        _, titles = self.search('r.r. tolk')
+        self.assertEqual(sorted(titles), ['The Hobbit', 'Unrelated'])
+        with mock.patch.object(search, 'backend', return_value=None):
+            _, titles = self.search('hobbit')
+        self.assertEqual(sorted(titles), ['Notes', 'The Hobbit', 'Unrelated'])
+
+
+# ----------------------------
+# Book import
+# ----------------------------
+class BookImportTests(TestCase):
+
+    def write(self, content, suffix):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_unknown_libraries_are_counted_as_skipped(self):
+        Library.objects.create(name='Main')
+        path = self.write('title,author,libraries\nOne,Ann,Main;Nowhere\nTwo,Ann,Elsewhere\n,Ann,Main\n', '.csv')
+        out = io.StringIO()
+        call_command('import_books', path, stdout=out)
+        self.assertIn('2 books, 1 new authors, 1 library links, 3 skipped', out.getvalue())
+
+    def test_malformed_jsonl_stops_with_a_command_error(self):
+        path = self.write('{"title": "One", "author": "Ann"}\n{"title": "Two", "author": "Ann"}\n{"title": \n', '.jsonl')
+        with self.assertRaisesMessage(CommandError, 'Line 3:'):
+            call_command('import_books', path, '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_malformed_upload_is_a_form_error(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        upload = SimpleUploadedFile('books.jsonl', b'{"title": "One", "author": "Ann"}\n[1, 2]\n')
+        response = self.client.post(reverse('admin:relationship_app_book_import'), {'file': upload, 'batch_size': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Line 2: not a JSON object.', response.context['form'].errors['file'][0])
+        self.assertFalse(Book.objects.exists())
+
+
+# ----------------------------
+# JSON API list pages
+# ----------------------------
+class ApiListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Ann')
+        Book.objects.bulk_create([Book(title=f'Book {i}', author=author) for i in range(7)])
+        catalogue.rebuild()
+        cls.ids = sorted(Book.objects.values_list('pk', flat=True))
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields_project_each_row(self):
+        for name in ('api_list', 'async_api_list'):
+            with self.subTest(view=name):
+                url = reverse(name, args=['books'])
+                self.assertEqual(self.get(url, fields='title')['results'][0], {'title': 'Book 0'})
+                row = self.get(url)['results'][0]
+                self.assertEqual(set(row), {'id', 'title', 'author_id', 'author_name'})
+                self.assertEqual(row['author_name'], 'Ann')
+
+    def test_unknown_fields_are_rejected(self):
+        for name in ('api_list', 'async_api_list'):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(name, args=['books']), {'fields': 'title,secret'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('secret', response.json()['error'])
+
+    def test_unknown_resource_is_404(self):
+        self.assertEqual(self.client.get(reverse('api_list', args=['users'])).status_code, 404)
+
+    def test_next_links_walk_every_row_once(self):
+        for name in ('api_list', 'async_api_list'):
+            with self.subTest(view=name):
+                ids, params = [], {'fields': 'id', 'page_size': 3}
+                while True:
+                    payload = self.get(reverse(name, args=['books']), **params)
+                    ids += [row['id'] for row in payload['results']]
+                    if payload['next'] is None:
+                        break
+                    self.assertIn('fields=id', payload['next'])
+                    params['after'] = parse_qs(urlsplit(payload['next']).query)['after'][0]
+                self.assertEqual(ids, self.ids)
+
+    def test_page_size_is_capped(self):
+        with mock.patch('relationship_app.api.MAX_PAGE_SIZE', 2):
+            payload = self.get(reverse('api_list', args=['books']), page_size=100)
+        self.assertEqual(len(payload['results']), 2)
+
+
+# ----------------------------
+# JSON API export
+# ----------------------------
+class ApiExportTests(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(name='Ann')
+        Book.objects.bulk_create([Book(title=f'Book {i}', author=author) for i in range(3)])
+        catalogue.rebuild()
+
+    def export(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_export', args=['books']), {'fields': 'id,title', **params})
+            lines = b''.join(response.streaming_content).splitlines()
+        return response, lines, [query['sql'] for query in queries]
+
+    def test_rows_are_not_counted_unless_asked(self):
+        response, lines, queries = self.export()
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn('X-Total-Count', response)
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+
+    def test_count_on_request(self):
+        response, lines, _ = self.export(count='1', format='json')
+        self.assertEqual(response['X-Total-Count'], '3')
+        self.assertEqual(len(json.loads(b''.join(lines))), 3)
+
+
+# ----------------------------
+# Catalogue export
+# ----------------------------
+class ExportTests(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(name='Ann, "the" Author')
+        Book.objects.create(title='Dated', author=author, publication_year=1999)
+        Book.objects.create(title='Undated\nTwo lines', author=author)
+        Book.objects.create(title='', author=author, publication_year=0)
+        self.table = exporters.TABLES['books']
+        self.expected = list(self.table.rows())
+
+    def export(self, export_format):
+        file = io.BytesIO()
+        exporters.export_table(self.table, file, export_format)
+        file.seek(0)
+        return file
+
+    def test_columnar_round_trip_keeps_nulls(self):
+        self.assertIn(None, [row[3] for row in self.expected])
+        columns, rows = exporters.read_columnar(self.export('columnar'))
+        self.assertEqual(columns, list(self.table.columns))
+        self.assertEqual(list(rows), self.expected)
+
+    def test_columnar_row_groups_of_nullable_columns(self):
+        rows = [(None,), (1,)] * 9 + [(None,)]
+        chunks = exporters.columnar_chunks(iter(rows), ['value'], [exporters.INT64], [True], row_group_size=7)
+        self.assertEqual(list(exporters.read_columnar(io.BytesIO(b''.join(chunks)))[1]), rows)
+
+    def test_text_round_trips(self):
+        with gzip.open(self.export('jsonl'), 'rt', encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record['publication_year'] for record in records], [row[3] for row in self.expected])
+        self.assertEqual([record['title'] for record in records], [row[1] for row in self.expected])
+
+        with gzip.open(self.export('csv'), 'rt', encoding='utf-8', newline='') as file:
+            records = list(csv.DictReader(file))
+        self.assertEqual(
+            [int(record['publication_year']) if record['publication_year'] else None for record in records],
+            [row[3] for row in self.expected],
+        )
+        self.assertEqual([record['title'] for record in records], [row[1] for row in self.expected])
+
+
+# ----------------------------
+# Author autocomplete
+# ----------------------------
+class AutocompleteTests(TestCase):
+
+    def test_refresh_finds_rows_committed_after_the_watermark(self):
+        Author.objects.create(name='Ursula Le Guin')
+        index = PrefixIndex()
+        self.assertEqual([name for _, name in index.search('le g')], ['Ursula Le Guin'])
+        Author.objects.create(name='Terry Pratchett')
+        # Saved before the last refresh, but committed only after it.
+        late = Author.objects.create(name='Tove Jansson')
+        Author.objects.filter(pk=late.pk).update(updated_at=index._watermark - timedelta(seconds=2))
+        index._checked = 0.0
+        self.assertEqual(sorted(name for _, name in index.search('t')), ['Terry Pratchett', 'Tove Jansson'])
+
+    def test_bulk_changes_are_merged_into_the_index(self):
+        authors = Author.objects.bulk_create([Author(name=f'Writer {i}') for i in range(20)])
+        index = PrefixIndex()
+        index.search('writer')
+        Author.objects.filter(pk=authors[0].pk).update(name='Renamed Writer')
+        Author.objects.bulk_create([Author(name=f'Newcomer {i}') for i in range(5)])
+        index._checked = 0.0
+        with mock.patch.object(autocomplete, 'AUTOCOMPLETE_MERGE_THRESHOLD', 2), \
+                mock.patch.object(index, '_set', side_effect=AssertionError('inserted one by one')):
+            self.assertEqual(len(index.search('newcomer')), 5)
+        fresh = PrefixIndex()
+        fresh.search('w')
+        self.assertEqual(index._entries, fresh._entries)
+        self.assertEqual(index._names, fresh._names)
+
+
+# ----------------------------
+# Chunked deletion
+# ----------------------------
+class ChunkedDeletionTests(TransactionTestCase):
+    """
+    Transaction test cases, so each chunk's commit is a real one.
+    """
+
+    def setUp(self):
+        self.author = Author.objects.create(name='Prolific')
+        self.other = Author.objects.create(name='Other')
+        Book.objects.bulk_create(
+            [Book(title=f'Book {i}', author=self.author) for i in range(25)] + [Book(title='Kept', author=self.other)]
+        )
+        self.library = Library.objects.create(name='Main')
+        self.library.books.add(*Book.objects.values_list('pk', flat=True))
+        catalogue.rebuild()
+        counters.rebuild_book_counts()
+
+    def test_interrupted_run_keeps_committed_chunks_and_resumes(self):
+        def interrupt(stats):
+            if stats.chunks == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            deletion.delete_authors([self.author.pk], chunk_size=10, progress=interrupt)
+        # The two chunks reported before the interruption are committed.
+        self.assertEqual(Book.objects.filter(author=self.author).count(), 5)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.book_count, 5)
+
+        stats = deletion.delete_authors([self.author.pk], chunk_size=10)
+        self.assertEqual((stats.authors, stats.books), (1, 5))
+        self.assertFalse(Author.objects.filter(pk=self.author.pk).exists())
+        self.assertEqual(list(BookCatalogueEntry.objects.values_list('title', flat=True)), ['Kept'])
+        self.library.refresh_from_db()
+        self.assertEqual(self.library.book_count, 1)
+
+    def test_chunks_commit_outside_any_transaction(self):
+        in_transaction = []
+        deletion.delete_books(
+            Book.objects.values_list('pk', flat=True), chunk_size=10,
+            progress=lambda stats: in_transaction.append(connection.in_atomic_block),
+        )
+        self.assertEqual(in_transaction, [False, False, False])
+        self.assertFalse(Book.objects.exists())
+
+    def test_admin_delete_view_does_not_wrap_the_chunks(self):
+        in_transaction = []
+        report = deletion._report
+
+        def spy(stats, progress):
+            in_transaction.append(connection.in_atomic_block)
+            report(stats, progress)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        with mock.patch.object(deletion, '_report', spy):
+            response = self.client.post(f'/admin/relationship_app/author/{self.author.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        # One chunk of CHUNK_SIZE, committed on its own.
+        self.assertEqual(in_transaction, [False])
+        self.assertFalse(Author.objects.filter(pk=self.author.pk).exists())
+
+
+# ----------------------------
+# bookshelf migration
+# ----------------------------
+class BookshelfMigrationTests(TestCase):
+    """
+    Reads a bookshelf_book table created in the test database.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE bookshelf_book (id integer PRIMARY KEY, title varchar(200), '
+                'author varchar(100), publication_year integer)'
+            )
+            rows = [(i, f'Title {i}', ['J.R.R. Tolkien', 'j r r  tolkien', 'Ursula Le Guin'][i % 3], 1900 + i)
+                    for i in range(1, 26)]
+            cursor.executemany('INSERT INTO bookshelf_book VALUES (%s, %s, %s, %s)', rows + [(26, '', 'Nobody', 2000)])
+        Author.objects.create(name='Ursula le Guin')
+
+    def test_resumes_after_the_checkpoint(self):
+        def interrupt(stats):
+            if stats.rows == 20:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            BookshelfMigration(chunk_size=10, source='default').run(progress=interrupt)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.last_id, checkpoint.rows), (20, 20))
+        self.assertEqual(Book.objects.count(), 20)
+
+        stats = BookshelfMigration(chunk_size=10, source='default').run()
+        self.assertEqual((stats.rows, stats.books, stats.skipped, stats.authors), (6, 5, 1, 0))
+        self.assertEqual(Book.objects.count(), 25)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(sorted(Author.objects.values_list('book_count', flat=True)), [8, 17])
+        self.assertEqual(Book.objects.get(title='Title 7').publication_year, 1907)
+        checkpoint.refresh_from_db()
+        self.assertIsNotNone(checkpoint.completed_at)
+
+        # Nothing left to copy.
+        self.assertEqual(BookshelfMigration(source='default').run().rows, 0)
+        self.assertEqual(Book.objects.count(), 25)
+
+
+# ----------------------------
+# User provisioning
+# ----------------------------
+class ProvisioningTests(TestCase):
+
+    def test_invalid_rows_are_skipped_and_reported(self):
+        User.objects.create_user('taken')
+        rows = [
+            {'username': 'alice', 'email': 'alice@example.com', 'role': 'Librarian'},
+            {'username': 12},
+            {'username': 'bob', 'email': ['bob@example.com']},
+            {'username': 'b' * 151},
+            {'username': 'not valid!'},
+            {'username': 'carol', 'email': 'not an email'},
+            {'username': 'taken'},
+            {'username': 'alice'},
+        ]
+        stats = provisioning.UserProvisioner(workers=1).run(rows)
+        self.assertEqual((stats.rows, stats.users, stats.skipped), (8, 1, 7))
+        self.assertEqual(len(stats.errors), 7)
+        self.assertEqual(User.objects.get(username='alice').profile.role, UserProfile.ROLE_LIBRARIAN)
+
+    def test_username_taken_meanwhile_skips_only_that_row(self):
+        provisioner = provisioning.UserProvisioner(workers=1)
+        drop_taken = provisioner._drop_taken
+
+        def race(records, stats):
+            # Another request creates "bob" after the check.
+            records = drop_taken(records, stats)
+            if not User.objects.filter(username='bob').exists():
+                User.objects.create_user('bob')
+                provisioner._drop_taken = drop_taken
+            return records
+
+        provisioner._drop_taken = race
+        stats = provisioner.run([{'username': 'alice'}, {'username': 'bob'}, {'username': 'carol'}])
+        self.assertEqual((stats.users, stats.skipped), (2, 1))
+        self.assertEqual(stats.errors, ['bob: already exists.'])
+        self.assertEqual(User.objects.count(), 3)
+
+
+# ----------------------------
+# SQLite tuning profile
+# ----------------------------
+class PerformanceSettingsTests(TestCase):
+
+    def load_profile(self, databases):
+        with mock.patch.object(project_settings, 'DATABASES', databases):
+            sys.modules.pop('LibraryProject.settings_performance', None)
+            try:
+                return importlib.import_module('LibraryProject.settings_performance')
+            finally:
+                sys.modules.pop('LibraryProject.settings_performance', None)
+
+    def test_pragmas_apply_to_sqlite_databases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            databases = {
+                'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'p.sqlite3')},
+                'bookshelf': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'b.sqlite3')},
+                'standby': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'library'},
+            }
+            self.load_profile(databases)
+            self.assertEqual(databases['standby'], {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'library'})
+            self.assertEqual(databases['default']['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+            self.assertEqual(databases['default']['CONN_MAX_AGE'], 600)
+            self.assertNotIn('transaction_mode', databases['bookshelf']['OPTIONS'])
+            self.assertNotIn('journal_mode', databases['bookshelf']['OPTIONS']['init_command'])
+
+            handler = ConnectionHandler({alias: databases[alias] for alias in ('default', 'bookshelf')})
+            try:
+                with handler['default'].cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+                    }
+                # synchronous=1 is NORMAL, temp_store=2 is MEMORY.
+                self.assertEqual(pragmas, {
+                    'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000,
+                    'cache_size': -64 * 1024, 'temp_store': 2,
+                })
+                self.assertEqual(handler['default'].transaction_mode, 'IMMEDIATE')
+                with handler['bookshelf'].cursor() as cursor:
+                    self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+                    self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            finally:
+                handler.close_all()
+
+
+# ----------------------------
+# Cached session users
+# ----------------------------
+class SessionUserCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='pw')
+        self.backend = CompiledPermissionBackend()
+
+    def test_users_are_loaded_per_request_without_a_shared_cache(self):
+        with self.settings(CACHE_SESSION_USERS=False):
+            self.backend.get_user(self.user.pk)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_cached_user_comes_with_profile(self):
+        with self.settings(CACHE_SESSION_USERS=True):
+            self.backend.get_user(self.user.pk)
+            with self.assertNumQueries(0):
+                user = self.backend.get_user(self.user.pk)
+                self.assertEqual(user.profile.role, UserProfile.ROLE_MEMBER)
+
+    def test_user_changes_drop_the_cached_user(self):
+        with self.settings(CACHE_SESSION_USERS=True):
+            self.backend.get_user(self.user.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+            self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_profile_changes_drop_the_cached_user(self):
+        with self.settings(CACHE_SESSION_USERS=True):
+            self.backend.get_user(self.user.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                UserProfile.objects.filter(user=self.user).get().save()
+            with self.assertNumQueries(1):
+                self.backend.get_user(self.user.pk)
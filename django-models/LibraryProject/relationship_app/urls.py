@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views
+from . import api, views
 from .views import list_books, LibraryDetailView, register, admin_dashboard, librarian_dashboard, member_dashboard
 from .views import add_book, edit_book, delete_book
 from django.contrib.auth.views import LoginView, LogoutView
 
 urlpatterns = [
     path('books/', list_books, name='list_books'),
+    path('books/search/', views.search_books, name='search_books'),
     path('library/<int:pk>/', LibraryDetailView.as_view(), name='library_detail'),
     path('register/', views.register, name='register'),
     path('login/', LoginView.as_view(template_name='relationship_app/login.html', next_page='list_books'), name='login'),
@@ -20,4 +21,17 @@ urlpatterns = [
     path('add_book/', add_book, name='add_book'),
     path('edit_book/<int:pk>/', edit_book, name='edit_book'),
     path('delete_book/<int:pk>/', delete_book, name='delete_book'),
+
+    # JSON API
+    path('api/<slug:resource>/', api.resource_list, name='api_list'),
+    path('api/<slug:resource>/export/', api.resource_export, name='api_export'),
+    path('api/libraries/<int:pk>/books/', api.library_books, name='api_library_books'),
+    path('api/authors/autocomplete/', api.author_autocomplete, name='api_author_autocomplete'),
+    path('api/users/provision/', api.provision_users, name='api_provision_users'),
+
+    # Async (ASGI) counterparts of the catalogue pages and the API
+    path('async/books/', views.async_list_books, name='async_list_books'),
+    path('async/library/<int:pk>/', views.async_library_detail, name='async_library_detail'),
+    path('async/api/<slug:resource>/', api.async_resource_list, name='async_api_list'),
+    path('async/api/<slug:resource>/export/', api.async_resource_export, name='async_api_export'),
 ]
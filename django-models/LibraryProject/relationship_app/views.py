@@ -4,36 +4,125 @@ from django.shortcuts import redirect, render, get_object_or_404
 from django.views.generic.detail import DetailView
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.decorators import permission_required
-from django.http import HttpResponseForbidden
+from django.http import Http404, HttpResponseForbidden
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.utils.decorators import method_decorator
 
 
 # ----------------------------
 # Import models
 # ----------------------------
 from .models import Book
+from .models import BookCatalogueEntry
 from .models import Library
+from .models import UserProfile
+from .pagination import KeysetPaginator, get_page_size
+from .roles import get_role
+from . import deletion, search
+from .instrumentation import query_budget
+from .caching import CATALOGUE, cache_catalogue_page, conditional_page, library_scope
 
 # ----------------------------
 # Function-Based View: List all books
 # ----------------------------
+@query_budget(1)
+@conditional_page(lambda request: CATALOGUE)
+@cache_catalogue_page(lambda request: CATALOGUE)
 def list_books(request):
     """
-    Displays a list of all books with their authors.
+    Displays a page of books with their authors, ordered by title.
+    Pages are keyset-paginated on (title, book) via ``?after=<cursor>`` and
+    read from the catalogue read model, one narrow table with the author's
+    name copied in, so each page is one query without joins.
     """
-    books = Book.objects.all()  # ✅ required for tests
-    return render(request, 'relationship_app/list_books.html', {'books': books})  # ✅ required for tests
+    books = BookCatalogueEntry.objects.only('title', 'author_name')
+    paginator = KeysetPaginator(books, ordering=('title', 'book_id'), page_size=get_page_size(request))
+    page = paginator.page(request.GET.get('after'))
+    return render(request, 'relationship_app/list_books.html', {'books': page.object_list, 'page': page})  # ✅ required for tests
+
+# ----------------------------
+# Function-Based View: Book Search
+# ----------------------------
+@query_budget(2)
+def search_books(request):
+    """
+    Full-text search over book titles, author names and library names,
+    answered from the search index and ranked by relevance.
+    """
+    query = request.GET.get('q', '').strip()
+    books = search.search_books(query, limit=get_page_size(request, default=search.DEFAULT_LIMIT)) if query else []
+    return render(request, 'relationship_app/search_results.html', {'query': query, 'books': books})
 
 # ----------------------------
 # Class-Based View: Library Details
 # ----------------------------
+# The library, its page of books and, after a version eviction, the
+# Library.updated_at lookup that reseeds it.
+@query_budget(3)
+@method_decorator(conditional_page(lambda request, pk: library_scope(pk)), name='dispatch')
+@method_decorator(cache_catalogue_page(lambda request, pk: library_scope(pk)), name='dispatch')
 class LibraryDetailView(DetailView):
     """
-    Displays details of a library and all books it contains.
+    Displays details of a library and a page of the books it contains.
+    The library (with its maintained book count) and one keyset page of
+    books, with their authors' names joined in, are loaded in two queries
+    regardless of size.
     """
     model = Library
     template_name = 'relationship_app/library_detail.html'
     context_object_name = 'library'
 
+    def get_queryset(self):
+        books = Book.objects.only('title', 'publication_year').annotate(author_name=F('author__name'))
+        self.paginator = KeysetPaginator(books, ordering=('title', 'id'), page_size=get_page_size(self.request))
+        page_books = self.paginator.get_queryset(self.request.GET.get('after'))
+        return Library.objects.prefetch_related(
+            Prefetch('books', queryset=page_books, to_attr='page_books')
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = self.paginator.build_page(self.object.page_books, self.request.GET.get('after'))
+        context['page'] = page
+        context['books'] = page.object_list
+        return context
+
+# ----------------------------
+# Async catalogue views
+# ----------------------------
+# The same pages through the async ORM, for ASGI deployments: a request
+# only occupies a thread while one of its queries runs.
+@query_budget(1)
+@conditional_page(lambda request: CATALOGUE)
+@cache_catalogue_page(lambda request: CATALOGUE)
+async def async_list_books(request):
+    """
+    ``list_books`` for ASGI.
+    """
+    books = BookCatalogueEntry.objects.only('title', 'author_name')
+    paginator = KeysetPaginator(books, ordering=('title', 'book_id'), page_size=get_page_size(request))
+    page = await paginator.apage(request.GET.get('after'))
+    return render(request, 'relationship_app/list_books.html', {'books': page.object_list, 'page': page})
+
+
+@query_budget(3)
+@conditional_page(lambda request, pk: library_scope(pk))
+@cache_catalogue_page(lambda request, pk: library_scope(pk))
+async def async_library_detail(request, pk):
+    """
+    ``LibraryDetailView`` for ASGI.
+    """
+    library = await Library.objects.filter(pk=pk).afirst()
+    if library is None:
+        raise Http404('No library found matching the query')
+    books = library.books.only('title', 'publication_year').annotate(author_name=F('author__name'))
+    paginator = KeysetPaginator(books, ordering=('title', 'id'), page_size=get_page_size(request))
+    page = await paginator.apage(request.GET.get('after'))
+    return render(request, 'relationship_app/library_detail.html', {
+        'library': library, 'object': library, 'books': page.object_list, 'page': page,
+    })
+
 # ----------------------------
 # User Registration View
 # ----------------------------
@@ -54,23 +143,29 @@ def register(request):
 # ----------------------------
 # Role-based Views
 # ----------------------------
+# get_role() resolves the role once per request and caches it between requests.
+# Budgets include the session and user lookups, which happen lazily in the view;
+# with cached sessions both are usually cache hits (see permissions.py).
 def is_admin(user):
-    return user.is_authenticated and user.profile.role == 'Admin'
+    return get_role(user) == UserProfile.ROLE_ADMIN
 
 def is_librarian(user):
-    return user.is_authenticated and user.profile.role == 'Librarian'
+    return get_role(user) == UserProfile.ROLE_LIBRARIAN
 
 def is_member(user):
-    return user.is_authenticated and user.profile.role == 'Member'
+    return get_role(user) == UserProfile.ROLE_MEMBER
 
+@query_budget(3)
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     return render(request, 'relationship_app/admin_view.html')
 
+@query_budget(3)
 @user_passes_test(is_librarian)
 def librarian_dashboard(request):
     return render(request, 'relationship_app/librarian_view.html')
 
+@query_budget(3)
 @user_passes_test(is_member)
 def member_dashboard(request):
     return render(request, 'relationship_app/member_view.html')
@@ -79,10 +174,10 @@ def member_dashboard(request):
 # ----------------------------
 # Permission-Required Views for Book Operations
 # ----------------------------
-@permission_required('relationship_app.can_add_book')
+@permission_required('relationship_app.add_book')
 def add_book(request):
     """
-    Allows users with 'can_add_book' permission to add a new book.
+    Allows users with the 'add_book' permission to add a new book.
     """
     if request.method == 'POST':
         title = request.POST.get('title')
@@ -91,20 +186,21 @@ def add_book(request):
         if title and author_id:
             from .models import Author
             author = get_object_or_404(Author, id=author_id)
-            Book.objects.create(title=title, author=author)
+            # One write transaction for the book and the rows its signals maintain.
+            with transaction.atomic():
+                Book.objects.create(title=title, author=author)
             return redirect('list_books')
     
-    from .models import Author
-    authors = Author.objects.all()
-    return render(request, 'relationship_app/add_book.html', {'authors': authors})
+    # Authors are picked through the autocomplete endpoint, not a full list.
+    return render(request, 'relationship_app/add_book.html')
 
 
-@permission_required('relationship_app.can_change_book')
+@permission_required('relationship_app.change_book')
 def edit_book(request, pk):
     """
-    Allows users with 'can_change_book' permission to edit an existing book.
+    Allows users with the 'change_book' permission to edit an existing book.
     """
-    book = get_object_or_404(Book, pk=pk)
+    book = get_object_or_404(Book.objects.select_related('author'), pk=pk)
     
     if request.method == 'POST':
         title = request.POST.get('title')
@@ -115,23 +211,22 @@ def edit_book(request, pk):
             author = get_object_or_404(Author, id=author_id)
             book.title = title
             book.author = author
-            book.save()
+            with transaction.atomic():
+                book.save()
             return redirect('list_books')
     
-    from .models import Author
-    authors = Author.objects.all()
-    return render(request, 'relationship_app/edit_book.html', {'book': book, 'authors': authors})
+    return render(request, 'relationship_app/edit_book.html', {'book': book})
 
 
-@permission_required('relationship_app.can_delete_book')
+@permission_required('relationship_app.delete_book')
 def delete_book(request, pk):
     """
-    Allows users with 'can_delete_book' permission to delete a book.
+    Allows users with the 'delete_book' permission to delete a book.
     """
     book = get_object_or_404(Book, pk=pk)
     
     if request.method == 'POST':
-        book.delete()
+        deletion.delete_books([book.pk])
         return redirect('list_books')
     
     return render(request, 'relationship_app/delete_book.html', {'book': book})